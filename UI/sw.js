@@ -25,7 +25,7 @@ self.addEventListener('activate', (event) => {
         caches.keys().then((cacheNames) => {
             return Promise.all(
                 cacheNames.map((cacheName) => {
-                    if (cacheName !== CACHE_NAME) {
+                    if (cacheName !== CACHE_NAME && cacheName !== API_CACHE_NAME) {
                         return caches.delete(cacheName);
                     }
                 })
@@ -34,8 +34,42 @@ self.addEventListener('activate', (event) => {
     );
 });
 
+// Results server (eval.py --serve) API: revalidate the cached copy with its ETag
+const API_CACHE_NAME = 'envision-api-v1';
+
+function revalidateApi(request) {
+    return caches.open(API_CACHE_NAME).then((cache) => {
+        return cache.match(request).then((cached) => {
+            const headers = new Headers(request.headers);
+            const etag = cached && cached.headers.get('ETag');
+            if (etag) {
+                headers.set('If-None-Match', etag);
+            }
+            return fetch(request.url, { headers: headers, cache: 'no-store' })
+                .then((response) => {
+                    // 304: the cached copy is still current
+                    if (response.status === 304 && cached) {
+                        return cached;
+                    }
+                    if (response.status === 200 && response.headers.get('ETag')) {
+                        cache.put(request, response.clone());
+                    }
+                    return response;
+                })
+                .catch(() => {
+                    return cached || Response.error();
+                });
+        });
+    });
+}
+
 // Fetch Event - Network First, then Cache
 self.addEventListener('fetch', (event) => {
+    const url = new URL(event.request.url);
+    if (event.request.method === 'GET' && url.origin === self.location.origin && url.pathname.startsWith('/api/')) {
+        event.respondWith(revalidateApi(event.request));
+        return;
+    }
     event.respondWith(
         fetch(event.request)
             .then((response) => {
@@ -0,0 +1,218 @@
+"""Offline throughput benchmark of the eval.py harness against mock_server.py.
+
+Generates a synthetic dataset and image tree of N sequences, starts the mock
+judge in-process and runs eval.py once per execution mode in a fresh output
+directory. Reports sequences/sec, p50/p95/p99 per-sequence latency and peak
+RSS per mode. With --baseline, exits non-zero when a mode's throughput drops
+more than --tolerance below a previous report.
+
+    python benchmark.py --sequences 200 --modes thread,async --latency_ms 50
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from typing import Dict, List
+
+import numpy as np
+
+import mock_server
+
+EVAL_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval.py")
+
+# 执行模式 -> 传给 eval.py 的额外参数
+MODES = {
+    "thread": ["--engine", "thread"],
+    "async": ["--engine", "async"],
+    "thread-prefix": ["--engine", "thread", "--prompt_layout", "prefix"],
+    "async-prefix": ["--engine", "async", "--prompt_layout", "prefix"],
+    "async-json": ["--engine", "async", "--output_mode", "json"],
+    "async-resize": ["--engine", "async", "--image_max_side", "256"]
+}
+CATEGORIES = ["physics", "chemistry", "biology", "geography", "meteorology", "culture"]
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Offline throughput benchmark for eval.py')
+    parser.add_argument('--sequences', type=int, default=100, help='Number of synthetic sequences')
+    parser.add_argument('--image_size', type=int, default=512, help='Side length of the synthetic PNG images')
+    parser.add_argument('--distinct_images', type=int, default=16, help='Number of distinct images cycled through the tree')
+    parser.add_argument('--modes', default='thread,async', help=f'Comma-separated execution modes: {", ".join(MODES)}')
+    parser.add_argument('--max_workers', type=int, default=16, help='--max_workers passed to eval.py')
+    parser.add_argument('--latency', choices=['fixed', 'uniform', 'exponential', 'lognormal'], default='fixed', help='Mock judge latency distribution')
+    parser.add_argument('--latency_ms', type=float, default=50, help='Mean mock judge latency in milliseconds')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Mock judge HTTP 500 rate')
+    parser.add_argument('--rate_limit_rate', type=float, default=0.0, help='Mock judge HTTP 429 rate')
+    parser.add_argument('--extra_args', default='', help='Extra arguments appended to every eval.py run')
+    parser.add_argument('--work_dir', default=None, help='Directory for the synthetic data and run outputs (default: a temp dir)')
+    parser.add_argument('--keep', action='store_true', help='Keep the work directory')
+    parser.add_argument('--output', default='benchmark_report.json', help='Where to write the JSON report')
+    parser.add_argument('--baseline', default=None, help='Previous report to compare sequences/sec against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed relative throughput drop vs. --baseline')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic data and the mock judge')
+    return parser.parse_args()
+
+def make_png(size: int, rng: random.Random) -> bytes:
+    """Encode a size x size RGB noise image as PNG (stdlib only)."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    row = size * 3
+    noise = rng.randbytes(row * size)
+    raw = b"".join(b"\x00" + noise[y * row:(y + 1) * row] for y in range(size))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw, 1))
+        + chunk(b"IEND", b"")
+    )
+
+def generate_dataset(work_dir: str, args) -> Dict[str, str]:
+    """Write a synthetic Envision-style JSON file and index_XXXX/step_N.png image tree."""
+    rng = random.Random(args.seed)
+    image_dir = os.path.join(work_dir, "images")
+    pool = [make_png(args.image_size, rng) for _ in range(max(1, args.distinct_images))]
+    sequences = []
+    for i in range(args.sequences):
+        index = str(i)
+        sequences.append({
+            "index": index,
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "process_type": "Causal" if i % 2 else "Temporal",
+            "prompts": [
+                {"step": step, "prompt": f"Synthetic prompt {i}-{step}", "explanation": f"Synthetic explanation {i}-{step}"}
+                for step in range(1, 5)
+            ]
+        })
+        seq_dir = os.path.join(image_dir, f"index_{index.zfill(4)}")
+        os.makedirs(seq_dir, exist_ok=True)
+        for step in range(1, 5):
+            with open(os.path.join(seq_dir, f"step_{step}.png"), 'wb') as f:
+                f.write(pool[(i * 4 + step) % len(pool)])
+    json_path = os.path.join(work_dir, "sequences.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(sequences, f)
+    return {"json_path": json_path, "image_dir": image_dir}
+
+def run_mode(name: str, dataset: Dict[str, str], api_base: str, work_dir: str, args) -> Dict:
+    """Run eval.py once in a fresh output directory and collect timing and memory figures."""
+    output_dir = os.path.join(work_dir, f"run_{name}")
+    shutil.rmtree(output_dir, ignore_errors=True)
+    cmd = [
+        sys.executable, EVAL_SCRIPT,
+        "--json_path", dataset["json_path"],
+        "--image_dir", dataset["image_dir"],
+        "--output_dir", output_dir,
+        "--api_key", "mock",
+        "--model", "mock",
+        "--api_base", api_base,
+        "--result_full", "full.json",
+        "--result_scores", "scores.jsonl",
+        "--max_workers", str(args.max_workers),
+        *MODES[name],
+        *args.extra_args.split()
+    ]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # wait4 返回该子进程自身的 rusage（峰值 RSS）
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    # ru_maxrss: KB on Linux, bytes on macOS
+    peak_rss_mb = rusage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+    # 单序列时延取自 full results 中的 timings.total，吞吐取自 run_metrics.json
+    with open(os.path.join(output_dir, "full.json"), 'r', encoding='utf-8') as f:
+        latencies = [rec["timings"]["total"] for rec in json.load(f) if "timings" in rec]
+    with open(os.path.join(output_dir, "run_metrics.json"), 'r', encoding='utf-8') as f:
+        metrics = json.load(f)
+    lat = np.array(latencies) if latencies else np.array([np.nan])
+    return {
+        "mode": name,
+        "exit_status": os.waitstatus_to_exitcode(status),
+        "completed": metrics["sequences"]["succeeded"],
+        "failed": metrics["sequences"]["failed"],
+        "wall_s": round(wall, 3),
+        "seq_per_s": metrics["throughput_seq_per_s"],
+        "latency_p50_s": round(float(np.percentile(lat, 50)), 4),
+        "latency_p95_s": round(float(np.percentile(lat, 95)), 4),
+        "latency_p99_s": round(float(np.percentile(lat, 99)), 4),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "stages_p50_s": {stage: stats["p50"] for stage, stats in metrics["stages"].items()}
+    }
+
+def compare_to_baseline(results: List[Dict], baseline_path: str, tolerance: float) -> List[str]:
+    """Return a message for every mode whose throughput regressed beyond tolerance."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {r["mode"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        base = baseline.get(result["mode"])
+        if not base or not base.get("seq_per_s") or result["seq_per_s"] is None:
+            continue
+        change = result["seq_per_s"] / base["seq_per_s"] - 1
+        print(f"[BASELINE] {result['mode']}: {base['seq_per_s']:.2f} -> {result['seq_per_s']:.2f} seq/s ({change:+.1%})")
+        if change < -tolerance:
+            regressions.append(f"{result['mode']} throughput dropped {-change:.1%} (tolerance {tolerance:.0%})")
+    return regressions
+
+def main():
+    args = parse_arguments()
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        sys.exit(f"Unknown modes: {unknown}; choose from {list(MODES)}")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="envision_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        t0 = time.perf_counter()
+        dataset = generate_dataset(work_dir, args)
+        print(f"Generated {args.sequences} sequences ({args.image_size}px images) in {time.perf_counter() - t0:.1f}s under {work_dir}")
+
+        server = mock_server.start_server(mock_server.parse_arguments([
+            "--port", "0",
+            "--latency", args.latency,
+            "--latency_ms", str(args.latency_ms),
+            "--error_rate", str(args.error_rate),
+            "--rate_limit_rate", str(args.rate_limit_rate),
+            "--seed", str(args.seed)
+        ]))
+        api_base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+        results = []
+        for name in modes:
+            print(f"Running mode {name} ...", flush=True)
+            results.append(run_mode(name, dataset, api_base, work_dir, args))
+        server.shutdown()
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{'mode':<15}{'seq/s':>9}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'RSS MB':>9}{'done':>7}{'fail':>6}")
+    for r in results:
+        seq_per_s = f"{r['seq_per_s']:.2f}" if r["seq_per_s"] is not None else "--"
+        print(f"{r['mode']:<15}{seq_per_s:>9}{r['latency_p50_s']:>9.3f}{r['latency_p95_s']:>9.3f}"
+              f"{r['latency_p99_s']:>9.3f}{r['peak_rss_mb']:>9.1f}{r['completed']:>7}{r['failed']:>6}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+            "python": sys.version.split()[0],
+            "results": results
+        }, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("[REGRESSION] " + "; ".join(regressions))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
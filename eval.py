@@ -3,12 +3,41 @@ import os
 import base64
 import re
 import argparse
-import openai
+import asyncio
+import glob
+import hashlib
+import operator
+import socket
+import sqlite3
+import struct
+import sys
+import collections
 import concurrent.futures
-import math
+import contextlib
+import ctypes
+import gzip
+import heapq
+import itertools
+import random
+import threading
+import time
+import warnings
+import zlib
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from statistics import NormalDist
 from pathlib import Path
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is only needed for --image_max_side
+    Image = None
 
 # 按照 4:4:2 的比例定义权重（调整后）
 DIMENSION_WEIGHTS = {
@@ -36,29 +65,238 @@ SUB_DIMENSION_WEIGHTS = {
     }
 }
 
+# 九个子维度（按维度顺序）
+SUB_DIMENSIONS = [dim for dims in SUB_DIMENSION_WEIGHTS.values() for dim in dims]
+
+# 结构化输出模式（--output_mode json）的 response_format schema
+JUDGE_SCORE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        dim: {
+            "type": "object",
+            "properties": {
+                "score": {"type": "integer", "enum": [0, 1, 2, 3, 4, 5]},
+                "reason": {"type": "string"}
+            },
+            "required": ["score", "reason"],
+            "additionalProperties": False
+        }
+        for dim in SUB_DIMENSIONS
+    },
+    "required": SUB_DIMENSIONS,
+    "additionalProperties": False
+}
+
+# 等级阈值（分数 >= 阈值即为该等级，低于所有阈值为 "Very Poor"）
+GRADE_THRESHOLDS = [
+    (4.5, "Excellent"),
+    (4.0, "Very Good"),
+    (3.5, "Good"),
+    (3.0, "Fair"),
+    (2.0, "Poor")
+]
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """argparse type for --shard i/N."""
+    try:
+        i, n = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {value!r}")
+    if not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"shard index must be in [0, {n}), got {i}")
+    return i, n
+
+def parse_band(value: str) -> Tuple[float, float]:
+    """argparse type for --triage_band LO:HI."""
+    try:
+        low, high = (float(part) for part in value.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected LO:HI, got {value!r}")
+    return min(low, high), max(low, high)
+
+# 只读结果的模式（--rescore/--compare/--serve）未指定 --result_scores 时使用的文件名
+DEFAULT_RESULT_SCORES = "scores.jsonl"
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Sequential Image Quality Assessment Tool')
-    parser.add_argument('--json_path', required=True, help='Path to the JSON file containing prompts and sequences')
-    parser.add_argument('--image_dir', required=True, help='Root directory containing index folders with step images')
+    parser.add_argument('--json_path', help='Path to the JSON file containing prompts and sequences')
+    parser.add_argument('--image_dir', help='Root directory containing index folders with step images')
     parser.add_argument('--output_dir', required=True, help='Directory to save evaluation results')
-    parser.add_argument('--api_key', required=True, help='OpenAI API key')
-    parser.add_argument('--model', required=True, help='Model name for evaluation')
-    parser.add_argument('--result_full', required=True, help='Output JSON file for full results')
-    parser.add_argument('--result_scores', required=True, help='Output JSONL file for scores')
+    parser.add_argument('--api_key', help='OpenAI API key')
+    parser.add_argument('--model', help='Model name for evaluation')
+    parser.add_argument('--result_full', help='Output JSON file for full results')
+    parser.add_argument('--result_scores', help=f'Output JSONL file for scores (required when judging; modes that only read results default to {DEFAULT_RESULT_SCORES})')
     parser.add_argument('--api_base', default=None, type=str, help='OpenAI API base URL (optional)')
-    parser.add_argument('--max_workers', type=int, default=5, help='Maximum number of concurrent workers')
-    return parser.parse_args()
+    parser.add_argument('--max_workers', type=int, default=5, help='Maximum number of concurrent workers (in-flight judge requests for --engine async)')
+    parser.add_argument('--engine', choices=['thread', 'async'], default='thread', help='Execution engine: thread pool or asyncio with one pooled client')
+    parser.add_argument('--rpm', type=float, default=None, help='Requests-per-minute budget for judge calls (optional)')
+    parser.add_argument('--tpm', type=float, default=None, help='Tokens-per-minute budget for judge calls (optional)')
+    parser.add_argument('--max_retries', type=int, default=4, help='Retry budget per sequence for retryable judge errors')
+    parser.add_argument('--retry_failed', '--retry-failed', action='store_true', help='Only re-run sequences recorded in failures.jsonl')
+    parser.add_argument('--cache_path', default=None, type=str, help='SQLite judge response cache; unchanged requests are answered locally (optional)')
+    parser.add_argument('--cache_max_mb', type=float, default=2048, help='Evict least recently used cache entries beyond this size')
+    parser.add_argument('--cache_max_age_days', type=float, default=None, help='Evict cache entries older than this many days (optional)')
+    parser.add_argument('--image_max_side', type=int, default=None, help='Downscale images so the longest side is at most this many pixels before upload (requires Pillow)')
+    parser.add_argument('--image_format', choices=['jpeg', 'webp', 'png'], default='jpeg', help='Re-encoding format used with --image_max_side')
+    parser.add_argument('--image_quality', type=int, default=85, help='JPEG/WebP quality used with --image_max_side')
+    parser.add_argument('--output_mode', choices=['text', 'json'], default='text', help='Judge output: nine score lines (text) or compact JSON scores with short reasons (json)')
+    parser.add_argument('--json_max_tokens', type=int, default=600, help='max_tokens for --output_mode json')
+    parser.add_argument('--response_format', choices=['json_schema', 'json_object', 'none'], default='json_schema', help='response_format sent with --output_mode json (use none for endpoints without support)')
+    parser.add_argument('--samples', type=int, default=1, help='Judge outputs drawn per sequence in the first request (n parameter); >1 enables self-consistency scoring')
+    parser.add_argument('--max_samples', type=int, default=None, help='Upper bound of judge outputs per sequence; more are only drawn when the samples disagree (default: --samples)')
+    parser.add_argument('--sample_spread', type=float, default=1.0, help='Draw more samples while a sub-dimension score range across samples exceeds this')
+    parser.add_argument('--grade_margin', type=float, default=0.1, help='Draw more samples while the aggregated overall score is within this distance of a grade boundary')
+    parser.add_argument('--sample_aggregate', choices=['median', 'mean'], default='median', help='How sampled sub-dimension scores are combined')
+    parser.add_argument('--triage_model', default=None, help='Cheaper judge that scores every sequence first; only borderline or inconsistent ones are re-judged by --model')
+    parser.add_argument('--triage_band', type=parse_band, action='append', default=None, help='Overall-score band LO:HI of triage results that is escalated to --model (repeatable; default 2.5:4.0)')
+    parser.add_argument('--triage_spread', type=float, default=2.0, help='Escalate when sub-scores of one dimension differ by more than this in the triage judgment')
+    parser.add_argument('--triage_audit', type=float, default=0.0, help='Fraction of settled sequences also re-judged by --model for an unbiased calibration sample')
+    parser.add_argument('--hedge_percentile', type=float, default=None, help='Send a duplicate judge request when a call runs longer than this percentile of observed latency, e.g. 95 (off by default)')
+    parser.add_argument('--hedge_budget', type=float, default=0.05, help='Maximum hedged requests as a fraction of all judge requests')
+    parser.add_argument('--prompt_layout', choices=['inline', 'prefix'], default='inline', help='Message layout: original inline prompt, or static rubric first as a shared prefix for provider prompt caching')
+    parser.add_argument('--prefetch_mb', type=float, default=0, help='Memory budget in MB for encoded images read ahead of and held by in-flight requests (0 disables prefetching)')
+    parser.add_argument('--prefetch_workers', type=int, default=4, help='Threads reading and encoding images ahead of the judge requests')
+    parser.add_argument('--image_detail', choices=['low', 'high', 'auto'], default=None, help='Vision detail level sent with each image (optional)')
+    parser.add_argument('--image_cache_dir', default=None, type=str, help='Directory for cached processed image variants (optional)')
+    parser.add_argument('--image_manifest', default=None, type=str, help='Persisted image directory listing; unchanged directories are not re-listed (optional)')
+    parser.add_argument('--verbose', action='store_true', help='Print per-sequence events and judge transcripts instead of only the progress line')
+    parser.add_argument('--price_table', default=None, type=str, help='JSON {model: {"input", "cached_input", "output"}} in USD per 1M tokens, merged over the built-in prices')
+    parser.add_argument('--prometheus_textfile', default=None, type=str, help='Write run metrics in Prometheus textfile-collector format to this path (optional)')
+    parser.add_argument('--order', choices=['dataset', 'stratified'], default='dataset', help='Judging order: dataset order, or interleaved across category/process_type strata with running confidence intervals')
+    parser.add_argument('--target_ci', type=float, default=None, help='Stop submitting judgments once the overall-score confidence interval is narrower than this width')
+    parser.add_argument('--ci_level', type=float, default=0.95, help='Confidence level of the running intervals')
+    parser.add_argument('--ci_min_sequences', type=int, default=30, help='Minimum judged sequences before --target_ci may stop the run')
+    parser.add_argument('--journal', default=None, type=str, help='Append-only journal file for crash-safe resume (default: <result_full>.journal.jsonl)')
+    parser.add_argument('--rescore', default=None, type=str, help='Offline mode: re-parse and rescore an existing full-results file (no API calls)')
+    parser.add_argument('--batch_manifest', default=None, type=str, help='JSON/JSONL list of {"name", "image_dir", "group"} entries to judge several generators in one run')
+    parser.add_argument('--leaderboard_dir', default=None, type=str, help='Where batch mode writes the leaderboard tables (default: --output_dir)')
+    parser.add_argument('--compare', nargs='+', default=None, help='Offline mode: paired significance tests between score files or run directories (NAME=PATH entries)')
+    parser.add_argument('--resamples', type=int, default=10000, help='Bootstrap resamples and permutations per model pair (0 disables the tests in batch mode)')
+    parser.add_argument('--alpha', type=float, default=0.05, help='Significance level; bootstrap intervals are 1-alpha and p-values are Holm-adjusted across model pairs')
+    parser.add_argument('--compare_workers', type=int, default=None, help='Worker processes for the resampling (default: CPU count)')
+    parser.add_argument('--compare_seed', type=int, default=0, help='Seed of the resampling')
+    parser.add_argument('--serve', nargs='?', type=int, const=8000, default=None, help='Serve the results in --output_dir over HTTP on this port (default 8000) with paginated, cacheable endpoints')
+    parser.add_argument('--serve_host', default='127.0.0.1', help='Bind address for --serve')
+    parser.add_argument('--batch_prepare', '--batch-prepare', action='store_true', help='Write pending judge requests as Batch API JSONL shards under <output_dir>/batch instead of calling the API')
+    parser.add_argument('--batch_execute_local', action='store_true', help='Answer prepared batch shards through --api_base and write Batch API style results (local stand-in)')
+    parser.add_argument('--batch_ingest', '--batch-ingest', nargs='+', default=None, help='Batch API output JSONL file(s) to parse and score into the normal result files')
+    parser.add_argument('--batch_max_mb', type=float, default=190, help='Maximum size of one batch input shard in MB')
+    parser.add_argument('--batch_max_requests', type=int, default=50000, help='Maximum number of requests in one batch input shard')
+    parser.add_argument('--shard', type=parse_shard, default=None, help='Only judge shard i of N (hash of the sequence index); results go to <output_dir>/shard_i_of_N')
+    parser.add_argument('--merge', nargs='+', default=None, help='Merge per-shard output directories (globs allowed) into --output_dir and recompute the analysis')
+    parser.add_argument('--work_queue', nargs='?', const='work_queue.sqlite', default=None, help='Cooperate with other workers through a shared SQLite work queue (relative to --output_dir; default work_queue.sqlite)')
+    parser.add_argument('--lease_seconds', type=float, default=120, help='Lease length for sequences claimed from --work_queue; expired leases are reclaimed')
+    parser.add_argument('--worker_id', default=None, help='Worker name recorded in --work_queue (default: <hostname>-<pid>)')
+    parser.add_argument('--watch', action='store_true', help='Judge sequences as soon as the generator has written all of their images to --image_dir')
+    parser.add_argument('--watch_settle', type=float, default=2.0, help='Seconds an image must stay unchanged before --watch treats it as written')
+    parser.add_argument('--watch_idle', type=float, default=600, help='Stop --watch when no sequence was completed for this many seconds')
+    parser.add_argument('--preflight', action='store_true', help='Validate the dataset and image tree (no API calls) and write preflight_report.json')
+    parser.add_argument('--preflight_workers', type=int, default=None, help='Worker processes for --preflight (default: CPU count)')
+    parser.add_argument('--rescore_configs', default=None, type=str, help='JSON file of named weight configurations to rescore side by side')
+    args = parser.parse_args()
+
+    # 各模式所需参数
+    if args.rescore or args.compare or args.serve is not None:
+        required = []
+    elif args.merge:
+        required = ['result_full', 'result_scores']
+    elif args.preflight:
+        required = ['json_path', 'image_dir']
+    elif args.batch_manifest:
+        required = ['json_path', 'api_key', 'model', 'result_full', 'result_scores']
+    elif args.batch_prepare:
+        required = ['json_path', 'image_dir', 'model', 'result_full', 'result_scores']
+    elif args.batch_execute_local:
+        required = ['api_key']
+    elif args.batch_ingest:
+        required = ['json_path', 'result_full', 'result_scores']
+    else:
+        required = ['json_path', 'image_dir', 'api_key', 'model', 'result_full', 'result_scores']
+    missing = [f"--{name}" for name in required if getattr(args, name) is None]
+    if missing:
+        parser.error(f"the following arguments are required: {', '.join(missing)}")
+    if args.watch and args.work_queue:
+        parser.error("--watch cannot be combined with --work_queue")
+    return args
 
 def get_config(args):
+    output_dir = args.output_dir
+    if args.shard and not args.merge:
+        output_dir = os.path.join(output_dir, f"shard_{args.shard[0]}_of_{args.shard[1]}")
     return {
         "json_path": args.json_path,
         "image_dir": args.image_dir,
-        "output_dir": args.output_dir,
+        "output_dir": output_dir,
         "api_key": args.api_key,
         "api_base": args.api_base,
         "model": args.model,
-        "result_files": {"full": args.result_full, "scores": args.result_scores},
+        "result_files": {"full": args.result_full, "scores": args.result_scores or DEFAULT_RESULT_SCORES, "failures": "failures.jsonl"},
         "max_workers": args.max_workers,
+        "engine": args.engine,
+        "rpm": args.rpm,
+        "tpm": args.tpm,
+        "max_retries": args.max_retries,
+        "retry_failed": args.retry_failed,
+        "cache_path": args.cache_path,
+        "cache_max_mb": args.cache_max_mb,
+        "cache_max_age_days": args.cache_max_age_days,
+        "image_max_side": args.image_max_side,
+        "image_format": args.image_format,
+        "image_quality": args.image_quality,
+        "image_detail": args.image_detail,
+        "prefetch_mb": args.prefetch_mb,
+        "prefetch_workers": args.prefetch_workers,
+        "output_mode": args.output_mode,
+        "prompt_layout": args.prompt_layout,
+        "hedge_percentile": args.hedge_percentile,
+        "hedge_budget": args.hedge_budget,
+        "samples": args.samples,
+        "max_samples": max(args.max_samples or args.samples, args.samples),
+        "sample_spread": args.sample_spread,
+        "grade_margin": args.grade_margin,
+        "sample_aggregate": args.sample_aggregate,
+        "triage_model": args.triage_model,
+        "triage_bands": args.triage_band or [(2.5, 4.0)],
+        "triage_spread": args.triage_spread,
+        "triage_audit": args.triage_audit,
+        "json_max_tokens": args.json_max_tokens,
+        "response_format": args.response_format,
+        "image_cache_dir": args.image_cache_dir,
+        "image_manifest": args.image_manifest,
+        "verbose": args.verbose,
+        "price_table": args.price_table,
+        "prometheus_textfile": args.prometheus_textfile,
+        "journal": args.journal or f"{args.result_full}.journal.jsonl",
+        "rescore": args.rescore,
+        "rescore_configs": args.rescore_configs,
+        "batch_manifest": args.batch_manifest,
+        "leaderboard_dir": args.leaderboard_dir,
+        "compare": args.compare,
+        "serve": args.serve,
+        "serve_host": args.serve_host,
+        "resamples": args.resamples,
+        "alpha": args.alpha,
+        "compare_workers": args.compare_workers,
+        "compare_seed": args.compare_seed,
+        "batch_prepare": args.batch_prepare,
+        "batch_execute_local": args.batch_execute_local,
+        "batch_ingest": args.batch_ingest,
+        "batch_max_mb": args.batch_max_mb,
+        "batch_max_requests": args.batch_max_requests,
+        "shard": args.shard,
+        "merge": args.merge,
+        "order": args.order,
+        "target_ci": args.target_ci,
+        "ci_level": args.ci_level,
+        "ci_min_sequences": args.ci_min_sequences,
+        "watch": args.watch,
+        "watch_settle": args.watch_settle,
+        "watch_idle": args.watch_idle,
+        "preflight": args.preflight,
+        "preflight_workers": args.preflight_workers,
+        "work_queue": args.work_queue,
+        "lease_seconds": args.lease_seconds,
+        "worker_id": args.worker_id or f"{socket.gethostname()}-{os.getpid()}",
     }
 
 def load_jsonl(path: str) -> Dict[str, Dict]:
@@ -72,13 +310,45 @@ def load_jsonl(path: str) -> Dict[str, Dict]:
             records[obj["index"]] = obj
     return records
 
-def load_json(path: str) -> Dict[str, Dict]:
-    """Load existing full results from JSON file."""
+def replay_journal(path: str) -> Tuple[Dict[str, Dict], Dict[str, Dict], Dict[str, Dict]]:
+    """Rebuild full/score/failure records from the append-only journal.
+
+    A torn last line (crash mid-write) is dropped and truncated away so that
+    subsequent appends start on a clean line.
+    """
+    full, scores, failures = {}, {}, {}
     if not os.path.isfile(path) or os.path.getsize(path) == 0:
-        return {}
-    with open(path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return {item["index"]: item for item in data}
+        return full, scores, failures
+    good_end = 0
+    with open(path, 'rb') as f:
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                # 没有换行的末行即使能解析也是写了一半：下一次追加会接在同一行上
+                print(f"[WARN] Dropping torn journal tail at byte {good_end} in {path}")
+                break
+            try:
+                entry = json.loads(raw)
+                if "failure" in entry:
+                    failures[entry["index"]] = entry["failure"]
+                else:
+                    full[entry["index"]] = entry["full"]
+                    scores[entry["index"]] = entry["scores"]
+                    failures.pop(entry["index"], None)
+            except (ValueError, KeyError, TypeError):
+                print(f"[WARN] Skipping corrupt journal line at byte {good_end} in {path}")
+            good_end += len(raw)
+    if good_end < os.path.getsize(path):
+        with open(path, 'r+b') as f:
+            f.truncate(good_end)
+            f.flush()
+            os.fsync(f.fileno())
+    return full, scores, failures
+
+def append_journal(f, entry: Dict):
+    """Append one journal entry and fsync it."""
+    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
 
 def extract_scores(txt: str) -> Dict[str, float]:
     """Extract scores from evaluation text using comprehensive patterns."""
@@ -125,29 +395,365 @@ def extract_scores(txt: str) -> Dict[str, float]:
     
     return out
 
-def encode_image(path: str) -> str:
-    """Encode image to base64."""
+# JSON 解析失败（截断、夹杂文字）时的单遍回退扫描："<dim>": 3 或 "<dim>": {"score": 3
+STRUCTURED_SCORE_RE = re.compile(
+    r'"(' + "|".join(SUB_DIMENSIONS) + r')"\s*:\s*(?:\{\s*"score"\s*:\s*)?(\d+(?:\.\d+)?)'
+)
+
+def parse_structured_scores(txt: str) -> Tuple[Dict[str, float], Dict[str, str]]:
+    """Parse a JSON-mode judge response into (scores, reasons).
+
+    Well-formed JSON is decoded once; anything else (code fences, stray prose,
+    output cut off at max_tokens) falls back to one precompiled regex scan
+    that recovers every complete "<dim>": score pair.
+    """
+    scores, reasons = {}, {}
+    start, end = txt.find("{"), txt.rfind("}")
+    try:
+        data = json.loads(txt[start:end + 1]) if start != -1 else None
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        for dim in SUB_DIMENSIONS:
+            entry = data.get(dim)
+            value = entry.get("score") if isinstance(entry, dict) else entry
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and 0 <= value <= 5:
+                scores[dim] = float(value)
+                if isinstance(entry, dict) and isinstance(entry.get("reason"), str):
+                    reasons[dim] = entry["reason"]
+        return scores, reasons
+    for match in STRUCTURED_SCORE_RE.finditer(txt):
+        value = float(match.group(2))
+        if 0 <= value <= 5:
+            scores[match.group(1)] = value
+    return scores, reasons
+
+def parse_evaluation(txt: str, output_mode: str = "text") -> Tuple[Dict[str, float], Dict[str, str]]:
+    """Parse judge output of either output mode into (scores, reasons)."""
+    if output_mode == "json":
+        return parse_structured_scores(txt)
+    return extract_scores(txt), {}
+
+IMAGE_MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+class ImageOptimizer:
+    """Downscale and re-encode images before base64, caching variants on disk.
+
+    Variants are keyed by the source bytes hash and the encoding parameters.
+    """
+
+    def __init__(self, max_side: int, fmt: str = "jpeg", quality: int = 85, cache_dir: str = None):
+        if Image is None:
+            raise RuntimeError("Pillow is required for image optimization (pip install pillow)")
+        self.max_side = max_side
+        self.format = fmt
+        self.quality = quality
+        self.cache_dir = cache_dir
+        self.mime_type = IMAGE_MIME_TYPES[fmt]
+        self.stats = {"images": 0, "source_bytes": 0, "payload_bytes": 0, "cache_hits": 0}
+        self.lock = threading.Lock()
+
+    def _variant_path(self, raw: bytes) -> str:
+        params = f"{self.max_side}:{self.format}:{self.quality}".encode()
+        digest = hashlib.sha256(raw + b"\0" + params).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.{self.format}")
+
+    def _reencode(self, raw: bytes) -> bytes:
+        img = Image.open(BytesIO(raw))
+        img.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+        if self.format == "jpeg" and img.mode != "RGB":
+            # JPEG 无透明通道：先铺白底
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.split()[-1])
+        out = BytesIO()
+        if self.format == "png":
+            img.save(out, format="PNG", optimize=True)
+        else:
+            img.save(out, format=self.format.upper(), quality=self.quality)
+        return out.getvalue()
+
+    def process(self, raw: bytes) -> bytes:
+        variant_path = self._variant_path(raw) if self.cache_dir else None
+        cache_hit = variant_path is not None and os.path.isfile(variant_path)
+        if cache_hit:
+            with open(variant_path, "rb") as f:
+                data = f.read()
+        else:
+            data = self._reencode(raw)
+            if variant_path is not None:
+                os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+                tmp_path = f"{variant_path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, variant_path)
+        with self.lock:
+            self.stats["images"] += 1
+            self.stats["source_bytes"] += len(raw)
+            self.stats["payload_bytes"] += len(data)
+            self.stats["cache_hits"] += int(cache_hit)
+        return data
+
+    def report(self) -> str:
+        src, out = self.stats["source_bytes"], self.stats["payload_bytes"]
+        saved = 100.0 * (src - out) / src if src else 0.0
+        return (f"Image payload: {src / 1e6:.1f} MB -> {out / 1e6:.1f} MB ({saved:.1f}% saved) "
+                f"over {self.stats['images']} images, variant cache hits: {self.stats['cache_hits']}")
+
+def make_image_optimizer(cfg: Dict):
+    if not cfg["image_max_side"]:
+        return None
+    return ImageOptimizer(cfg["image_max_side"], cfg["image_format"], cfg["image_quality"], cfg["image_cache_dir"])
+
+def encode_image(path: str, optimizer: ImageOptimizer = None) -> str:
+    """Encode image to base64, optionally downscaled/re-encoded first."""
     try:
         with open(path, "rb") as f:
-            return base64.b64encode(f.read()).decode()
+            raw = f.read()
+        if optimizer is not None:
+            raw = optimizer.process(raw)
+        return base64.b64encode(raw).decode()
     except Exception as e:
         print(f"[ERROR] Failed to encode image {path}: {e}")
         return ""
 
-def load_sequences(path: str) -> Dict[str, Dict[str, Any]]:
-    """Load sequence data from JSON file."""
+def shard_of(index: str, num_shards: int) -> int:
+    """Stable shard assignment of a sequence index (same on every machine and Python run)."""
+    return int.from_bytes(hashlib.sha1(str(index).encode("utf-8")).digest()[:8], "big") % num_shards
+
+def iter_sequences(path: str, shard: Tuple[int, int] = None):
+    """Stream sequences from a JSON array or JSONL dataset (optionally gzip-compressed).
+
+    With shard=(i, N) only the sequences assigned to shard i are yielded.
+    """
+    for item in iter_json_records(path):
+        if shard is None or shard_of(item["index"], shard[1]) == shard[0]:
+            yield item
+
+def load_sequences(path: str, shard: Tuple[int, int] = None) -> Dict[str, Dict[str, Any]]:
+    """Load sequence data (JSON/JSONL, optionally .gz) into an index -> sequence dict."""
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        print(f"Successfully loaded {len(data)} sequences from {path}")
-        return {item["index"]: item for item in data}
+        sequences = {item["index"]: item for item in iter_sequences(path, shard)}
+        print(f"Successfully loaded {len(sequences)} sequences from {path}"
+              + (f" (shard {shard[0]}/{shard[1]})" if shard else ""))
+        return sequences
     except Exception as e:
         print(f"[ERROR] Failed to load sequences from {path}: {e}")
         return {}
 
-def find_image_paths(index: str, image_dir: str, steps: List[int]) -> Dict[int, str]:
+class ImageIndex:
+    """Set of every path under --image_dir (one level deep), built with a single scandir pass.
+
+    Replaces per-candidate os.path.exists probing in find_image_paths. With a
+    manifest, subdirectories whose mtime is unchanged are not re-listed.
+    """
+
+    def __init__(self, image_dir: str, root_entries: List[str], dirs: Dict[str, Dict]):
+        self.image_dir = image_dir
+        self.root_entries = root_entries
+        self.dirs = dirs
+        self.paths = {image_dir}
+        self.paths.update(os.path.join(image_dir, name) for name in root_entries)
+        for name, listing in dirs.items():
+            self.paths.update(os.path.join(image_dir, name, f) for f in listing["files"])
+
+    def exists(self, path: str) -> bool:
+        return path in self.paths
+
+    @staticmethod
+    def _list_dir(path: str) -> Dict:
+        with os.scandir(path) as it:
+            files = [entry.name for entry in it if not entry.is_dir()]
+        return {"mtime_ns": os.stat(path).st_mtime_ns, "files": files}
+
+    @classmethod
+    def build(cls, image_dir: str, manifest_path: str = None, max_workers: int = 16) -> "ImageIndex":
+        previous = {}
+        if manifest_path and os.path.isfile(manifest_path):
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                if manifest.get("image_dir") == os.path.abspath(image_dir):
+                    previous = manifest.get("dirs", {})
+            except (ValueError, OSError) as e:
+                print(f"[WARN] Ignoring unreadable image manifest {manifest_path}: {e}")
+
+        root_entries, subdirs = [], []
+        with os.scandir(image_dir) as it:
+            for entry in it:
+                root_entries.append(entry.name)
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+
+        def list_subdir(name):
+            path = os.path.join(image_dir, name)
+            cached = previous.get(name)
+            if cached is not None and os.stat(path).st_mtime_ns == cached["mtime_ns"]:
+                return name, cached, True
+            return name, cls._list_dir(path), False
+
+        dirs, reused = {}, 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for name, listing, was_cached in executor.map(list_subdir, subdirs):
+                dirs[name] = listing
+                reused += int(was_cached)
+
+        index = cls(image_dir, root_entries, dirs)
+        print(f"Indexed {len(index.paths)} paths in {image_dir} ({len(dirs)} directories, {reused} unchanged from manifest)")
+        if manifest_path:
+            index.save_manifest(manifest_path)
+        return index
+
+    def refresh(self, names: Iterable[str], root: bool = False):
+        """Re-list changed subdirectories (and the top level with root=True) in place."""
+        if root:
+            with os.scandir(self.image_dir) as it:
+                root_entries = [entry.name for entry in it]
+            self.paths.difference_update(os.path.join(self.image_dir, name) for name in self.root_entries)
+            self.paths.update(os.path.join(self.image_dir, name) for name in root_entries)
+            self.root_entries = root_entries
+        for name in names:
+            path = os.path.join(self.image_dir, name)
+            old = self.dirs.pop(name, None)
+            if old is not None:
+                self.paths.difference_update(os.path.join(path, f) for f in old["files"])
+            try:
+                self.dirs[name] = self._list_dir(path)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            self.paths.update(os.path.join(path, f) for f in self.dirs[name]["files"])
+
+    def save_manifest(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"image_dir": os.path.abspath(self.image_dir), "dirs": self.dirs}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+# inotify(7) 常量
+IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+IN_Q_OVERFLOW, IN_ISDIR = 0x4000, 0x40000000
+IN_NONBLOCK, IN_CLOEXEC = os.O_NONBLOCK, 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+class ImageDirWatcher:
+    """Keeps an ImageIndex of --image_dir current while a generator writes into it.
+
+    Uses Linux inotify (through ctypes) to learn which directories changed;
+    elsewhere, or when watches cannot be added, every poll() compares the
+    directory mtimes from one scandir pass over the top level.
+    """
+
+    def __init__(self, image_index: ImageIndex):
+        self.index = image_index
+        self.image_dir = image_index.image_dir
+        self.fd = None
+        self.watches = {}
+        self.mtimes = {}
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            self.fd = fd
+            self.watch("")
+            for name in self.index.dirs:
+                self.watch(name)
+        except (OSError, AttributeError) as e:
+            if self.fd is not None:
+                os.close(self.fd)
+            self.fd = None
+            print(f"[WATCH] inotify unavailable ({e}); polling {self.image_dir} instead")
+        self.mode = "inotify" if self.fd is not None else "polling"
+        if self.fd is None:
+            self._changed_by_mtime()
+
+    def watch(self, name: str):
+        mask = IN_CREATE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM
+        wd = self._add_watch(self.fd, os.fsencode(os.path.join(self.image_dir, name)), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {name or self.image_dir}")
+        self.watches[wd] = name
+
+    def _changed_by_mtime(self) -> Tuple[bool, set]:
+        mtimes = {}
+        with os.scandir(self.image_dir) as it:
+            for entry in it:
+                if entry.is_dir():
+                    mtimes[entry.name] = entry.stat().st_mtime_ns
+        root_mtime = os.stat(self.image_dir).st_mtime_ns
+        changed = {name for name, mtime in mtimes.items() if self.mtimes.get(name) != mtime}
+        changed.update(name for name in self.mtimes if name not in mtimes and name != "")
+        root_changed = self.mtimes.get("") != root_mtime
+        mtimes[""] = root_mtime
+        self.mtimes = mtimes
+        return root_changed, changed
+
+    def _changed_by_events(self) -> Tuple[bool, set]:
+        root_changed, changed, created, overflow = False, set(), [], False
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+                offset += INOTIFY_EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                parent = self.watches.get(wd)
+                if parent is None:
+                    continue
+                if parent == "":
+                    root_changed = True
+                    if mask & IN_ISDIR:
+                        changed.add(os.fsdecode(name))
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            created.append(os.fsdecode(name))
+                else:
+                    changed.add(parent)
+        if overflow:
+            # 事件队列溢出：补齐监听并完整重扫
+            with os.scandir(self.image_dir) as it:
+                subdirs = {entry.name for entry in it if entry.is_dir()}
+            watched = set(self.watches.values())
+            created = [name for name in subdirs if name not in watched]
+            root_changed, changed = True, subdirs | set(self.index.dirs)
+        for name in created:
+            # 先加监听再列目录，之间写入的文件不会漏掉
+            try:
+                self.watch(name)
+            except OSError as e:
+                if os.path.isdir(os.path.join(self.image_dir, name)):
+                    # 多半是 max_user_watches 用尽：改为轮询
+                    print(f"[WATCH] {e}; switching to polling")
+                    self.close()
+                    self.mode = "polling"
+                    self._changed_by_mtime()
+                    return True, changed | set(self.index.dirs)
+        return root_changed, changed
+
+    def poll(self) -> int:
+        """Apply directory changes since the last poll to the index; returns the number of changed directories."""
+        root_changed, changed = self._changed_by_events() if self.fd is not None else self._changed_by_mtime()
+        if root_changed or changed:
+            self.index.refresh(changed, root=root_changed)
+        return len(changed) + int(root_changed)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+def find_image_paths(index: str, image_dir: str, steps: List[int], image_index: ImageIndex = None,
+                     quiet: bool = False) -> Dict[int, str]:
     """Find image paths for all steps in a sequence with flexible path resolution."""
     image_paths = {}
+    exists = image_index.exists if image_index is not None else os.path.exists
     
     # Convert index to string and handle zero-padding
     index_str = str(index)
@@ -162,12 +768,13 @@ def find_image_paths(index: str, image_dir: str, steps: List[int]) -> Dict[int,
     
     target_dir = None
     for possible_dir in possible_dirs:
-        if os.path.exists(possible_dir):
+        if exists(possible_dir):
             target_dir = possible_dir
             break
     
     if not target_dir:
-        print(f"[WARN] No directory found for index {index_str} in {image_dir}")
+        if not quiet:
+            print(f"[WARN] No directory found for index {index_str} in {image_dir}")
         return image_paths
     
     for step in steps:
@@ -183,33 +790,28 @@ def find_image_paths(index: str, image_dir: str, steps: List[int]) -> Dict[int,
         image_found = False
         for filename in possible_filenames:
             image_path = os.path.join(target_dir, filename)
-            if os.path.exists(image_path):
+            if exists(image_path):
                 image_paths[step] = image_path
                 image_found = True
                 break
         
-        if not image_found:
+        if not image_found and not quiet:
             print(f"[WARN] Missing image for index {index_str}, step {step} in {target_dir}")
     
     return image_paths
 
-def get_grade(score: float) -> str:
+def get_grade(score: float, thresholds: List[Tuple[float, str]] = None) -> str:
     """根据分数返回等级"""
-    if score >= 4.5:
-        return "Excellent"
-    elif score >= 4.0:
-        return "Very Good"
-    elif score >= 3.5:
-        return "Good"
-    elif score >= 3.0:
-        return "Fair"
-    elif score >= 2.0:
-        return "Poor"
-    else:
-        return "Very Poor"
+    for threshold, grade in (thresholds or GRADE_THRESHOLDS):
+        if score >= threshold:
+            return grade
+    return "Very Poor"
 
-def calculate_comprehensive_scores(individual_scores: Dict) -> Dict:
-    """计算综合评分 - 按照4:4:2权重"""
+def calculate_comprehensive_scores(individual_scores: Dict, dimension_weights: Dict = None,
+                                   sub_dimension_weights: Dict = None, grade_thresholds: List = None) -> Dict:
+    """计算综合评分 - 默认按照4:4:2权重"""
+    dimension_weights = dimension_weights or DIMENSION_WEIGHTS
+    sub_dimension_weights = sub_dimension_weights or SUB_DIMENSION_WEIGHTS
     
     # 提取各维度分数
     consistency_scores = {
@@ -232,25 +834,25 @@ def calculate_comprehensive_scores(individual_scores: Dict) -> Dict:
     
     # 计算维度平均分（加权）
     consistency_avg = sum(
-        consistency_scores[dim] * SUB_DIMENSION_WEIGHTS["consistency"][dim] 
+        consistency_scores[dim] * sub_dimension_weights["consistency"][dim] 
         for dim in consistency_scores
     )
     
     aesthetic_avg = sum(
-        aesthetic_scores[dim] * SUB_DIMENSION_WEIGHTS["aesthetic"][dim] 
+        aesthetic_scores[dim] * sub_dimension_weights["aesthetic"][dim] 
         for dim in aesthetic_scores
     )
     
     physicality_avg = sum(
-        physicality_scores[dim] * SUB_DIMENSION_WEIGHTS["physicality"][dim] 
+        physicality_scores[dim] * sub_dimension_weights["physicality"][dim] 
         for dim in physicality_scores
     )
     
-    # 计算总体分数（按照4:4:2权重）
+    # 计算总体分数（默认按照4:4:2权重）
     overall_score = (
-        consistency_avg * DIMENSION_WEIGHTS["consistency"] +
-        physicality_avg * DIMENSION_WEIGHTS["physicality"] +
-        aesthetic_avg * DIMENSION_WEIGHTS["aesthetic"]
+        consistency_avg * dimension_weights["consistency"] +
+        physicality_avg * dimension_weights["physicality"] +
+        aesthetic_avg * dimension_weights["aesthetic"]
     )
     
     return {
@@ -265,10 +867,10 @@ def calculate_comprehensive_scores(individual_scores: Dict) -> Dict:
         
         # 权重信息
         "weight_info": {
-            "consistency_weight": DIMENSION_WEIGHTS["consistency"],
-            "physicality_weight": DIMENSION_WEIGHTS["physicality"], 
-            "aesthetic_weight": DIMENSION_WEIGHTS["aesthetic"],
-            "total_weight": sum(DIMENSION_WEIGHTS.values())
+            "consistency_weight": dimension_weights["consistency"],
+            "physicality_weight": dimension_weights["physicality"], 
+            "aesthetic_weight": dimension_weights["aesthetic"],
+            "total_weight": sum(dimension_weights.values())
         },
         
         # 简单平均分（不加权，用于对比）
@@ -282,14 +884,51 @@ def calculate_comprehensive_scores(individual_scores: Dict) -> Dict:
         "pass_rate_4": round(sum(1 for score in individual_scores.values() if score >= 4) / len(individual_scores), 2),
         
         # 等级评定
-        "overall_grade": get_grade(overall_score),
-        "consistency_grade": get_grade(consistency_avg),
-        "aesthetic_grade": get_grade(aesthetic_avg),
-        "physicality_grade": get_grade(physicality_avg)
+        "overall_grade": get_grade(overall_score, grade_thresholds),
+        "consistency_grade": get_grade(consistency_avg, grade_thresholds),
+        "aesthetic_grade": get_grade(aesthetic_avg, grade_thresholds),
+        "physicality_grade": get_grade(physicality_avg, grade_thresholds)
     }
 
-def build_sequence_evaluation_messages(sequence_data: Dict, image_base64_list: List[str]) -> list:
-    """Build messages for sequence evaluation."""
+# 输出格式说明：text 为原始九行格式；json 为结构化输出模式（--output_mode json）
+TEXT_OUTPUT_FORMAT = """## Output Format
+
+**Do not include any other text, explanations, or labels.** You must return only nine lines of text, each containing a metric and the corresponding score, for example:
+
+**Example Output:**
+Semantic Consistency: 3
+Factual Consistency: 5
+Spatial-Temporal Consistency: 2
+Expressiveness: 4
+Artistic Quality: 3
+Authenticity: 4
+Basic Properties: 5
+Dynamics and Interactivity: 3
+Physical Reliability: 5"""
+
+JSON_OUTPUT_FORMAT = """## Output Format
+
+**Do not include any other text.** Return ONLY a JSON object with one entry per metric. Each entry has an integer "score" (0-5) and a "reason" of at most 15 words, for example:
+
+**Example Output:**
+{"semantic_consistency": {"score": 3, "reason": "Step 3 changes the subject's color."}, "factual_consistency": {"score": 5, "reason": "..."}, "spatial_temporal_consistency": {"score": 2, "reason": "..."}, "expressiveness": {"score": 4, "reason": "..."}, "artistic_quality": {"score": 3, "reason": "..."}, "authenticity": {"score": 4, "reason": "..."}, "basic_properties": {"score": 5, "reason": "..."}, "dynamics_interactivity": {"score": 3, "reason": "..."}, "physical_reliability": {"score": 5, "reason": "..."}}"""
+
+OUTPUT_FORMATS = {"text": TEXT_OUTPUT_FORMAT, "json": JSON_OUTPUT_FORMAT}
+
+PROMPT_PREAMBLE = """Please evaluate this 4-step image sequence strictly and return ONLY the nine scores as requested.
+
+# SEQUENTIAL Image Quality Evaluation Protocol
+
+## System Instruction
+You are an AI quality auditor for sequential text-to-image generation. Apply these rules with ABSOLUTE RUTHLESSNESS. Only sequences meeting the HIGHEST standards should receive top scores.
+
+"""
+
+# --prompt_layout prefix：静态前缀之后再给出序列信息与图像
+PREFIX_LAYOUT_NOTE = "The sequence information, step descriptions and the 4 images to evaluate follow after this protocol.\n\n---\n\n"
+
+def build_sequence_info_text(sequence_data: Dict) -> str:
+    """Render the per-sequence part of the prompt (sequence information and step descriptions)."""
     
     # Build step descriptions
     step_descriptions = []
@@ -302,50 +941,19 @@ def build_sequence_evaluation_messages(sequence_data: Dict, image_base64_list: L
     
     steps_text = "\n".join(step_descriptions)
     
-    # Build image content with proper formatting
-    image_contents = []
-    for i, image_base64 in enumerate(image_base64_list):
-        if image_base64:  # 只添加成功编码的图像
-            image_contents.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/png;base64,{image_base64}"
-                }
-            })
-    
-    return [
-        {
-            "role": "system",
-            "content": [
-                {
-                    "type": "text",
-                    "text": "You are a professional Vincennes sequential image quality audit expert. Evaluate the image sequence quality strictly according to the protocol, considering the progression across all 4 steps."
-                }
-            ]
-        },
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": f"""Please evaluate this 4-step image sequence strictly and return ONLY the nine scores as requested.
-
-# SEQUENTIAL Image Quality Evaluation Protocol
-
-## System Instruction
-You are an AI quality auditor for sequential text-to-image generation. Apply these rules with ABSOLUTE RUTHLESSNESS. Only sequences meeting the HIGHEST standards should receive top scores.
-
-**Sequence Information**
+    return f"""**Sequence Information**
 - INDEX: {sequence_data['index']}
 - CATEGORY: {sequence_data['category']}
 - PROCESS TYPE: {sequence_data['process_type']}
 
 **Step-by-Step Sequence Description:**
-{steps_text}
-
----
+{steps_text}"""
 
-## SCORING CRITERIA (0-5 scale with exhaustive rubrics)
+def render_rubric(output_mode: str = "text") -> str:
+    """Render the static scoring rubric; it is identical for every sequence, so runs render it once."""
+    output_format = OUTPUT_FORMATS[output_mode]
+    
+    return f"""## SCORING CRITERIA (0-5 scale with exhaustive rubrics)
 
 **CONSISTENCY DIMENSION** - Evaluate across the entire 4-step sequence
 
@@ -427,20 +1035,7 @@ You are an AI quality auditor for sequential text-to-image generation. Apply the
 
 ---
 
-## Output Format
-
-**Do not include any other text, explanations, or labels.** You must return only nine lines of text, each containing a metric and the corresponding score, for example:
-
-**Example Output:**
-Semantic Consistency: 3
-Factual Consistency: 5
-Spatial-Temporal Consistency: 2
-Expressiveness: 4
-Artistic Quality: 3
-Authenticity: 4
-Basic Properties: 5
-Dynamics and Interactivity: 3
-Physical Reliability: 5
+{output_format}
 
 ---
 
@@ -453,280 +1048,4021 @@ Evaluate the ENTIRE 4-step sequence as a cohesive unit, considering progression,
 Each dimension has specific, exhaustive criteria that must be followed precisely. Do not generalize or make assumptions beyond what is explicitly stated in the rubrics.
 
 Please strictly adhere to the scoring criteria and follow the template format when providing your results."""
-                },
-                *image_contents
-            ]
-        }
-    ]
 
-def evaluate_sequence(index: str, sequence_data: Dict, cfg: Dict) -> Tuple[Dict, Dict]:
-    """Evaluate a complete 4-step sequence."""
-    try:
-        print(f"Evaluating sequence {index} ...")
-        
-        # Get all step numbers
-        steps = [prompt["step"] for prompt in sequence_data["prompts"]]
-        if len(steps) != 4:
-            print(f"[WARN] Sequence {index} has {len(steps)} steps, expected 4")
-        
-        # Get image paths for all steps
-        image_paths = find_image_paths(index, cfg["image_dir"], steps)
-        if len(image_paths) != len(steps):
-            print(f"[WARN] Sequence {index} has {len(image_paths)}/{len(steps)} images")
-            return None
-        
-        # Encode all images in step order
-        image_base64_list = []
-        for step in sorted(steps):
-            if step in image_paths:
-                encoded = encode_image(image_paths[step])
-                if encoded:
-                    image_base64_list.append(encoded)
-                else:
-                    print(f"[ERROR] Failed to encode image for step {step}")
-                    return None
-        
-        # Build evaluation messages
-        msgs = build_sequence_evaluation_messages(sequence_data, image_base64_list)
-        
-        # Initialize OpenAI client
-        client = openai.OpenAI(
-            api_key=cfg["api_key"],
-            base_url=cfg["api_base"] if cfg["api_base"] else None
-        )
-        
-        # Call API
-        resp = client.chat.completions.create(
-            model=cfg["model"],
-            messages=msgs,
-            temperature=0.3,
-            max_tokens=2000
-        )
-        eval_txt = resp.choices[0].message.content
-        scores = extract_scores(eval_txt)
+def build_sequence_prompt_text(sequence_data: Dict, output_mode: str = "text", rubric: str = None) -> str:
+    """Render the evaluation prompt (rubric plus step descriptions) of a sequence."""
+    if rubric is None:
+        rubric = render_rubric(output_mode)
+    return PROMPT_PREAMBLE + build_sequence_info_text(sequence_data) + "\n\n---\n\n" + rubric
 
-        print(f"\n--- Sequence {index} ---\n{eval_txt}\nScores: {scores}\n--------------\n")
+def build_static_prefix_text(rubric: str) -> str:
+    """The sequence-independent user preamble of the prefix layout (preamble plus rubric)."""
+    return PROMPT_PREAMBLE + PREFIX_LAYOUT_NOTE + rubric
 
-        # 计算综合分数
-        comprehensive_scores = calculate_comprehensive_scores(scores)
 
-        # Build step information for full record
-        step_info = []
-        for step_data in sequence_data["prompts"]:
-            step = step_data["step"]
-            step_info.append({
-                "step": step,
-                "prompt": step_data["prompt"],
-                "explanation": step_data["explanation"],
-                "image_path": image_paths.get(step, "")
-            })
+def build_sequence_text_contents(sequence_data: Dict, output_mode: str = "text", layout: str = "inline",
+                                 rubric: str = None) -> list:
+    """The text parts of the user message of a sequence (everything but the images).
 
-        return (
-            {  # full record
-                "index": index,
-                "category": sequence_data["category"],
-                "process_type": sequence_data["process_type"],
-                "steps": step_info,
-                "evaluation": eval_txt,
-                "individual_scores": scores,
-                "comprehensive_scores": comprehensive_scores
-            },
-            {  # score record (简化版，用于分析)
-                "index": index,
-                "category": sequence_data["category"],
-                "process_type": sequence_data["process_type"],
-                # 原始分数
-                **scores,
-                # 综合分数
-                "consistency_score": comprehensive_scores["consistency_score"],
-                "aesthetic_score": comprehensive_scores["aesthetic_score"],
-                "physicality_score": comprehensive_scores["physicality_score"],
-                "overall_score": comprehensive_scores["overall_score"],
-                "overall_grade": comprehensive_scores["overall_grade"],
-                "pass_rate_3": comprehensive_scores["pass_rate_3"],
-                "pass_rate_4": comprehensive_scores["pass_rate_4"]
-            }
-        )
-    except Exception as e:
-        print(f"[ERR] Sequence {index}: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+    layout "inline" is the original single prompt (sequence information ahead
+    of the rubric). layout "prefix" sends the static rubric first, so every
+    request shares a byte-identical prefix that provider-side prompt caching
+    can reuse, followed by the per-sequence text.
+    """
+    if rubric is None:
+        rubric = render_rubric(output_mode)
+    if layout == "prefix":
+        return [
+            {"type": "text", "text": build_static_prefix_text(rubric)},
+            {"type": "text", "text": build_sequence_info_text(sequence_data)}
+        ]
+    return [{"type": "text", "text": build_sequence_prompt_text(sequence_data, output_mode, rubric)}]
 
-def calculate_std(scores: List[float]) -> float:
-    """计算标准差"""
-    if len(scores) <= 1:
-        return 0.0
-    mean = sum(scores) / len(scores)
-    variance = sum((x - mean) ** 2 for x in scores) / (len(scores) - 1)
-    return math.sqrt(variance)
+def build_sequence_evaluation_messages(sequence_data: Dict, image_base64_list: List[str],
+                                       mime_type: str = "image/png", detail: str = None,
+                                       output_mode: str = "text", layout: str = "inline", rubric: str = None,
+                                       text_contents: list = None) -> list:
+    """Build messages for sequence evaluation.
 
-def analyze_comprehensive_results(all_scores: List[Dict]) -> Dict:
-    """分析综合评分结果"""
+    See build_sequence_text_contents for the layouts. Pass a pre-rendered
+    rubric, or the pre-rendered text_contents, to avoid re-rendering per call.
+    """
     
-    if not all_scores:
-        return {}
-    
-    analysis = {
-        "dimension_performance": {},
-        "score_distribution": {},
-        "ranking": {},
-        "summary": {}
-    }
+    if text_contents is None:
+        text_contents = build_sequence_text_contents(sequence_data, output_mode, layout, rubric)
     
-    # 收集所有综合分数
-    consistency_scores = [s.get("consistency_score", 0) for s in all_scores]
-    aesthetic_scores = [s.get("aesthetic_score", 0) for s in all_scores]
-    physicality_scores = [s.get("physicality_score", 0) for s in all_scores]
-    overall_scores = [s.get("overall_score", 0) for s in all_scores]
+    # Build image content with proper formatting
+    image_contents = []
+    for i, image_base64 in enumerate(image_base64_list):
+        if image_base64:  # 只添加成功编码的图像
+            image_url = {"url": f"data:{mime_type};base64,{image_base64}"}
+            if detail:
+                image_url["detail"] = detail
+            image_contents.append({
+                "type": "image_url",
+                "image_url": image_url
+            })
     
-    # 维度性能分析
-    for dim_name, scores in [
-        ("consistency", consistency_scores),
-        ("aesthetic", aesthetic_scores),
-        ("physicality", physicality_scores),
-        ("overall", overall_scores)
-    ]:
-        analysis["dimension_performance"][dim_name] = {
-            "mean": round(sum(scores) / len(scores), 2),
-            "max": round(max(scores), 2),
-            "min": round(min(scores), 2),
-            "std": round(calculate_std(scores), 2)
+    return [
+        {
+            "role": "system",
+            "content": [
+                {
+                    "type": "text",
+                    "text": "You are a professional Vincennes sequential image quality audit expert. Evaluate the image sequence quality strictly according to the protocol, considering the progression across all 4 steps."
+                }
+            ]
+        },
+        {
+            "role": "user",
+            "content": [
+                *text_contents,
+                *image_contents
+            ]
         }
-    
-    # 按总体分数排序
-    sorted_indices = sorted(
-        [(i, s["overall_score"]) for i, s in enumerate(all_scores)],
-        key=lambda x: x[1],
-        reverse=True
+    ]
+
+def make_client(cfg: Dict):
+    """Create the (thread-safe) synchronous judge client shared by all workers."""
+    import openai  # 延迟导入：离线模式（--rescore 等）不依赖 openai
+    return openai.OpenAI(
+        api_key=cfg["api_key"],
+        base_url=cfg["api_base"] if cfg["api_base"] else None,
+        max_retries=0  # retries are owned by JudgeScheduler
     )
-    
-    analysis["ranking"] = {
-        "top_5": [{"index": all_scores[i]["index"], "score": all_scores[i]["overall_score"]} for i, _ in sorted_indices[:5]],
-        "bottom_5": [{"index": all_scores[i]["index"], "score": all_scores[i]["overall_score"]} for i, _ in sorted_indices[-5:]]
-    }
-    
-    # 总体统计
-    analysis["summary"] = {
-        "total_sequences": len(all_scores),
-        "weight_ratio": "Consistency:Physicality:Aesthetic = 4:4:2",
-        "average_overall_score": round(sum(overall_scores) / len(overall_scores), 2),
-        "excellent_sequences": sum(1 for s in overall_scores if s >= 4.5),
-        "good_sequences": sum(1 for s in overall_scores if 3.5 <= s < 4.5),
-        "fair_sequences": sum(1 for s in overall_scores if 3.0 <= s < 3.5),
-        "poor_sequences": sum(1 for s in overall_scores if s < 3.0)
-    }
-    
-    return analysis
 
-def save_results(data: List[Dict], filename: str, cfg: Dict):
-    """Save results to file."""
-    path = os.path.join(cfg["output_dir"], filename)
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    
-    if filename.endswith('.jsonl'):
-        with open(path, 'w', encoding='utf-8') as f:
-            for item in data:
-                f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    else:
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"[SAVE] {path} - {len(data)} records")
+def make_async_client(cfg: Dict):
+    """Create one long-lived async judge client with a connection pool sized for the run."""
+    import httpx
+    import openai
+    limits = httpx.Limits(
+        max_connections=cfg["max_workers"],
+        max_keepalive_connections=cfg["max_workers"],
+        keepalive_expiry=60.0
+    )
+    return openai.AsyncOpenAI(
+        api_key=cfg["api_key"],
+        base_url=cfg["api_base"] if cfg["api_base"] else None,
+        timeout=600.0,
+        max_retries=0,
+        http_client=openai.DefaultAsyncHttpxClient(limits=limits)
+    )
 
-def main():
-    args = parse_arguments()
-    cfg = get_config(args)
-    
-    # Create output directory
-    Path(cfg["output_dir"]).mkdir(parents=True, exist_ok=True)
-    print(f"Output directory: {cfg['output_dir']}")
+# 可重试的错误类型
+RETRYABLE_ERRORS = {"rate_limit", "timeout", "connection", "server_error", "empty_response", "truncated", "parse_error"}
+# 触发 AIMD 降并发的错误类型
+CONGESTION_ERRORS = {"rate_limit", "timeout", "server_error"}
+# 单张图像的 token 预估（用于 tokens/min 预扣，响应后按 usage 校正）
+IMAGE_TOKEN_ESTIMATE = 765
 
-    # Load sequence data
-    sequences = load_sequences(cfg["json_path"])
-    if not sequences:
-        print("No sequences loaded. Exiting.")
-        return
+class EmptyResponseError(Exception):
+    """The judge returned no content."""
 
-    # Load existing results
-    exist_scores = load_jsonl(os.path.join(cfg["output_dir"], cfg["result_files"]["scores"]))
-    exist_full = load_json(os.path.join(cfg["output_dir"], cfg["result_files"]["full"]))
-    done_indices = set(exist_scores.keys())
+class TruncatedResponseError(Exception):
+    """The judge hit max_tokens (finish_reason == "length") before giving all scores."""
 
-    print(f"Found {len(done_indices)} already evaluated sequences")
+class ScoreParseError(Exception):
+    """Not every sub-dimension score could be parsed from the judge output."""
 
-    # Prepare tasks for unevaluated sequences
-    tasks = []
-    for index, sequence_data in sequences.items():
-        if index in done_indices:
-            print(f"[SKIP] Sequence {index}: Already evaluated")
-            continue
-        
-        # Check if all images exist
-        steps = [prompt["step"] for prompt in sequence_data["prompts"]]
-        image_paths = find_image_paths(index, cfg["image_dir"], steps)
-        
-        if len(image_paths) == len(steps):
-            tasks.append((index, sequence_data))
-            print(f"[QUEUE] Sequence {index}: Ready for evaluation")
-        else:
-            print(f"[SKIP] Sequence {index}: Missing images ({len(image_paths)}/{len(steps)})")
+class TokenBucket:
+    """Reservation-style token bucket refilled continuously at rate_per_min."""
 
-    print(f"Prepared {len(tasks)} sequences for evaluation")
+    def __init__(self, rate_per_min: float):
+        self.rate = rate_per_min / 60.0
+        self.capacity = float(rate_per_min)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
 
-    # Multi-threaded evaluation
-    if tasks:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=cfg["max_workers"]) as executor:
-            future_to_index = {
-                executor.submit(evaluate_sequence, index, seq_data, cfg): index 
-                for index, seq_data in tasks
-            }
-            
-            for future in concurrent.futures.as_completed(future_to_index):
-                index = future_to_index[future]
-                try:
-                    result = future.result()
-                    if result is not None:
-                        full_rec, score_rec = result
-                        exist_full[index] = full_rec
-                        exist_scores[index] = score_rec
-                        print(f"[SUCCESS] Completed evaluation for sequence {index}")
-                    else:
-                        print(f"[FAILED] Evaluation failed for sequence {index}")
-                except Exception as e:
-                    print(f"[ERR] Failed to evaluate sequence {index}: {e}")
-    else:
-        print("No tasks to process.")
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
 
-    # Sort and save results
-    full_sorted = [exist_full[k] for k in sorted(exist_full.keys())]
-    score_sorted = [exist_scores[k] for k in sorted(exist_scores.keys())]
+    def reserve(self, amount: float) -> float:
+        """Take amount tokens (possibly going into debt); return seconds to wait."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
 
-    save_results(full_sorted, cfg["result_files"]["full"], cfg)
+    def adjust(self, delta: float):
+        """Correct an earlier reservation by delta tokens (positive = consumed more)."""
+        with self.lock:
+            self.tokens -= delta
+
+    def observe_remaining(self, remaining: float):
+        """Clamp to the server-reported remaining budget."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, remaining)
+
+class AdaptiveConcurrency:
+    """Limit on in-flight judge calls, usable from threads and coroutines.
+
+    Starts in slow start (+1 per success, i.e. doubling every round of full
+    concurrency) until the first congestion signal, then continues with AIMD.
+    Only congestion (429s, timeouts, 5xx) shrinks the limit.
+    """
+
+    def __init__(self, maximum: int, initial: int, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.slow_start = True
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.cond = threading.Condition()
+        self.async_waiters = []
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self.cond:
+            while not self._try_acquire():
+                self.cond.wait()
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now (never waits)."""
+        with self.cond:
+            return self._try_acquire()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.cond:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self.async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, congested: bool = False):
+        with self.cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if congested:
+                # 乘性减：同一拥塞窗口内只减一次；首次拥塞后结束慢启动
+                self.slow_start = False
+                if now - self.last_decrease > 2.0:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.last_decrease = now
+            elif self.slow_start:
+                # 慢启动：每次成功 +1，约每轮满并发翻倍
+                self.limit = min(self.maximum, self.limit + 1.0)
+            else:
+                # 加性增：大约每轮满并发 +1
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.cond.notify_all()
+            for loop, waiter in self.async_waiters:
+                loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+            self.async_waiters = []
+
+# 对冲：阈值所需的最少观测数、延迟样本窗口与没有空闲并发槽时的重试间隔
+HEDGE_MIN_OBSERVATIONS = 20
+HEDGE_WINDOW = 500
+HEDGE_RECHECK_SECONDS = 1.0
+
+class RequestHedger:
+    """Duplicates judge requests that run longer than a percentile of the observed latency.
+
+    Whichever copy succeeds first wins. In the async engine the other one is
+    cancelled; the thread engine's blocking calls cannot be interrupted, so
+    there the loser finishes in the background on a pool of at most
+    max_workers threads, keeping its concurrency slot until it completes.
+    A hedge is only sent when a concurrency slot is free and at most
+    budget x primary requests are hedged.
+    """
+
+    def __init__(self, percentile: float, budget: float, workers: int):
+        self.percentile = percentile
+        self.budget = budget
+        self.latencies = collections.deque(maxlen=HEDGE_WINDOW)
+        self.effective = []
+        self.lock = threading.Lock()
+        # 池中每个请求都占着一个并发槽，所以线程数不会超过并发上限
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge")
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "skipped_budget": 0, "skipped_busy": 0,
+                      "discarded_tokens": 0}
+
+    def delay(self) -> Optional[float]:
+        """Current hedging threshold in seconds; None until enough latencies were observed."""
+        with self.lock:
+            if len(self.latencies) < HEDGE_MIN_OBSERVATIONS:
+                return None
+            return float(np.percentile(self.latencies, self.percentile))
+
+    def observe(self, seconds: float):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def admit(self, scheduler: "JudgeScheduler", skipped: set) -> bool:
+        """Reserve the budget and a concurrency slot for one hedge.
+
+        skipped holds the reasons already counted for this call, so a slow
+        request that is rechecked repeatedly is counted once per reason.
+        """
+        with self.lock:
+            if self.stats["hedged"] >= self.budget * self.stats["requests"]:
+                reason = "skipped_budget"
+            elif scheduler.pause_until > time.monotonic() or not scheduler.concurrency.try_acquire():
+                reason = "skipped_busy"
+            else:
+                self.stats["hedged"] += 1
+                return True
+            if reason not in skipped:
+                skipped.add(reason)
+                self.stats[reason] += 1
+            return False
+
+    def settle(self, started: float, hedge_won: bool):
+        with self.lock:
+            self.effective.append(time.perf_counter() - started)
+            self.stats["hedge_wins"] += int(hedge_won)
+
+    def discard(self, raw, scheduler: "JudgeScheduler", est_tokens: float):
+        """Account for the tokens of a losing copy that completed anyway."""
+        resp = raw.parse()
+        scheduler.observe_response(raw.headers, resp.usage, est_tokens)
+        with self.lock:
+            self.stats["discarded_tokens"] += getattr(resp.usage, "total_tokens", 0) or 0
+
+    def finish_loser(self, future: concurrent.futures.Future, scheduler: "JudgeScheduler", est_tokens: float):
+        """Done callback of the losing copy: free the slot it was holding and count its tokens."""
+        error = future.exception()
+        scheduler.concurrency.release(error is not None and classify_error(error) in CONGESTION_ERRORS)
+        if error is None:
+            self.discard(future.result(), scheduler, est_tokens)
+
+    def call(self, send, scheduler: "JudgeScheduler", est_tokens: float):
+        """Blocking hedged call; send() performs one request and returns the raw response.
+
+        The caller holds one concurrency slot and releases it when this
+        returns; a second copy brings its own slot, which the loser releases
+        when it completes.
+        """
+        with self.lock:
+            self.stats["requests"] += 1
+        started = time.perf_counter()
+        threshold = self.delay()
+        if threshold is None:
+            # 观测不足时不对冲，直接在调用线程上发送
+            raw = send()
+            self.observe(time.perf_counter() - started)
+            self.settle(started, False)
+            return raw
+        primary = self.executor.submit(send)
+        primary.add_done_callback(lambda f: f.exception() or self.observe(time.perf_counter() - started))
+        hedge, skipped = None, set()
+        while True:
+            timeout = None if hedge is not None else max(0.0, started + threshold - time.perf_counter())
+            done, _ = concurrent.futures.wait([f for f in (primary, hedge) if f is not None], timeout=timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            if done:
+                break
+            if self.admit(scheduler, skipped):
+                hedge = self.executor.submit(self._send_hedge, send, scheduler, est_tokens)
+            else:
+                threshold += HEDGE_RECHECK_SECONDS
+        winner = primary if primary in done else hedge
+        loser = hedge if winner is primary else primary
+        if winner.exception() is not None and loser is not None:
+            concurrent.futures.wait([loser])
+            if loser.exception() is None:
+                winner, loser = loser, winner
+        self.settle(started, winner is hedge)
+        if loser is not None:
+            loser.add_done_callback(lambda f: self.finish_loser(f, scheduler, est_tokens))
+        return winner.result()
+
+    def _send_hedge(self, send, scheduler: "JudgeScheduler", est_tokens: float):
+        delay = scheduler.admission_delay(est_tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return send()
+
+    async def call_async(self, send, scheduler: "JudgeScheduler", est_tokens: float):
+        """Async hedged call; send() returns a coroutine performing one request."""
+        with self.lock:
+            self.stats["requests"] += 1
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(send())
+        primary.add_done_callback(lambda t: t.cancelled() or t.exception() or self.observe(time.perf_counter() - started))
+        hedge, threshold, skipped = None, self.delay(), set()
+        try:
+            while True:
+                timeout = None if hedge is not None or threshold is None else max(0.0, started + threshold - time.perf_counter())
+                done, _ = await asyncio.wait([t for t in (primary, hedge) if t is not None], timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if done:
+                    break
+                if self.admit(scheduler, skipped):
+                    hedge = asyncio.ensure_future(self._send_hedge_async(send, scheduler, est_tokens))
+                else:
+                    threshold += HEDGE_RECHECK_SECONDS
+            winner = primary if primary in done else hedge
+            loser = hedge if winner is primary else primary
+            if winner.exception() is not None and loser is not None:
+                await asyncio.wait([loser])
+                if loser.exception() is None:
+                    winner, loser = loser, winner
+            if loser is primary and not primary.done():
+                # 被取消的主请求只知道下界，仍计入观测
+                self.observe(time.perf_counter() - started)
+            self.settle(started, winner is hedge)
+            return winner.result()
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def _send_hedge_async(self, send, scheduler: "JudgeScheduler", est_tokens: float):
+        try:
+            delay = scheduler.admission_delay(est_tokens)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return await send()
+        finally:
+            scheduler.concurrency.release()
+
+    def summary(self) -> Dict:
+        with self.lock:
+            effective = np.array(self.effective) if self.effective else np.array([np.nan])
+            threshold = float(np.percentile(self.latencies, self.percentile)) if len(self.latencies) >= HEDGE_MIN_OBSERVATIONS else None
+            return {
+                **self.stats,
+                "percentile": self.percentile,
+                "budget": self.budget,
+                "threshold_s": round(threshold, 4) if threshold is not None else None,
+                "latency_p50_s": round(float(np.percentile(effective, 50)), 4),
+                "latency_p95_s": round(float(np.percentile(effective, 95)), 4),
+                "latency_p99_s": round(float(np.percentile(effective, 99)), 4)
+            }
+
+    def report(self) -> str:
+        s = self.summary()
+        return (f"Hedging: {s['hedged']} of {s['requests']} requests hedged after p{s['percentile']:g} "
+                f"(last threshold {s['threshold_s']}s), hedge won {s['hedge_wins']}, "
+                f"skipped {s['skipped_budget']} over budget / {s['skipped_busy']} without a free slot, "
+                f"{s['discarded_tokens']} tokens in discarded responses; call latency p50/p95/p99 "
+                f"{s['latency_p50_s']}/{s['latency_p95_s']}/{s['latency_p99_s']}s")
+
+class JudgeScheduler:
+    """Admission control and retry policy shared by all judge calls of a run."""
+
+    def __init__(self, cfg: Dict):
+        self.requests = TokenBucket(cfg["rpm"]) if cfg.get("rpm") else None
+        self.tokens = TokenBucket(cfg["tpm"]) if cfg.get("tpm") else None
+        self.concurrency = AdaptiveConcurrency(
+            maximum=cfg["max_workers"],
+            initial=min(cfg["max_workers"], 8)
+        )
+        self.hedger = (RequestHedger(cfg["hedge_percentile"], cfg["hedge_budget"], cfg["max_workers"])
+                       if cfg.get("hedge_percentile") else None)
+        self.pause_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = {
+            "requests": 0, "retries": 0, "rate_limited": 0, "truncated": 0, "parse_failures": 0,
+            "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0
+        }
+
+    def admission_delay(self, est_tokens: float) -> float:
+        """Seconds the caller must wait before sending a request of est_tokens."""
+        delay = 0.0
+        if self.requests:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens:
+            delay = max(delay, self.tokens.reserve(est_tokens))
+        with self.lock:
+            self.stats["requests"] += 1
+            return max(delay, self.pause_until - time.monotonic())
+
+    def _pause(self, seconds: float):
+        with self.lock:
+            self.pause_until = max(self.pause_until, time.monotonic() + seconds)
+
+    def observe_response(self, headers, usage, est_tokens: float):
+        """Feed resp.usage and x-ratelimit-* headers back into the buckets."""
+        if usage is not None:
+            # prompt_tokens_details.cached_tokens：命中服务端前缀缓存的 prompt token 数
+            details = getattr(usage, "prompt_tokens_details", None)
+            with self.lock:
+                self.stats["prompt_tokens"] += usage.prompt_tokens or 0
+                self.stats["cached_tokens"] += getattr(details, "cached_tokens", None) or 0
+                self.stats["completion_tokens"] += usage.completion_tokens or 0
+        if usage is not None and self.tokens:
+            self.tokens.adjust(usage.total_tokens - est_tokens)
+        if headers is None:
+            return
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            try:
+                remaining = float(remaining)
+            except ValueError:
+                continue
+            if bucket:
+                bucket.observe_remaining(remaining)
+            if remaining <= 0:
+                self._pause(parse_duration(headers.get(f"x-ratelimit-reset-{kind}", "1s")))
+
+    def observe_error(self, error_type: str, retry_after: float):
+        if error_type in ("truncated", "parse_error"):
+            with self.lock:
+                self.stats["truncated" if error_type == "truncated" else "parse_failures"] += 1
+        if error_type == "rate_limit":
+            with self.lock:
+                self.stats["rate_limited"] += 1
+            if retry_after:
+                self._pause(retry_after)
+
+    def backoff_delay(self, attempt: int, retry_after: float) -> float:
+        """Full-jitter exponential backoff, never shorter than Retry-After."""
+        with self.lock:
+            self.stats["retries"] += 1
+        return max(retry_after or 0.0, random.uniform(0, min(60.0, 2.0 * 2 ** attempt)))
+
+def parse_duration(value: str) -> float:
+    """Parse rate-limit reset durations such as '1s', '6m0s' or '20ms'."""
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    total = 0.0
+    for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", str(value)):
+        total += float(amount) * units[unit]
+    return total
+
+def retry_after_seconds(e: Exception) -> float:
+    """Read Retry-After (or retry-after-ms) from an API error response, if any."""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return 0.0
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0.0
+
+def classify_error(e: Exception) -> str:
+    """Map an exception from the evaluation path to an error type."""
+    if isinstance(e, EmptyResponseError):
+        return "empty_response"
+    if isinstance(e, TruncatedResponseError):
+        return "truncated"
+    if isinstance(e, ScoreParseError):
+        return "parse_error"
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return "internal"
+    if isinstance(e, openai.RateLimitError):
+        return "quota" if getattr(e, "code", None) == "insufficient_quota" else "rate_limit"
+    if isinstance(e, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(e, openai.APIConnectionError):
+        return "connection"
+    if isinstance(e, openai.APIStatusError):
+        return classify_status(e.status_code)
+    return "internal"
+
+def classify_status(status_code: int) -> str:
+    """Map a non-2xx HTTP status of a judge request to an error type."""
+    if status_code == 429:
+        return "rate_limit"
+    if status_code >= 500 or status_code == 409:
+        return "server_error"
+    if status_code == 408:
+        return "timeout"
+    if status_code in (401, 403):
+        return "auth"
+    return "bad_request"
+
+def make_failure_record(index: str, error_type: str, error: str, attempts: int) -> Dict:
+    return {
+        "index": index,
+        "error_type": error_type,
+        "error": error,
+        "attempts": attempts,
+        "timestamp": datetime.now().isoformat()
+    }
+
+def estimate_request_tokens(msgs: list, max_tokens: int) -> float:
+    """Rough upper estimate of a request's token cost for the tokens/min bucket."""
+    chars, images = 0, 0
+    for msg in msgs:
+        for part in msg["content"]:
+            if part["type"] == "text":
+                chars += len(part["text"])
+            else:
+                images += 1
+    return chars / 4 + images * IMAGE_TOKEN_ESTIMATE + max_tokens
+
+def judge_request_params(cfg: Dict, msgs: list, n: int = 1) -> Dict:
+    """Keyword arguments of the judge chat.completions.create call (n > 1 asks for several samples)."""
+    params = {
+        "model": cfg["model"],
+        "messages": msgs,
+        "temperature": 0.3,
+        "max_tokens": 2000
+    }
+    if n > 1:
+        params["n"] = n
+    if cfg["output_mode"] == "json":
+        params["max_tokens"] = cfg["json_max_tokens"]
+        if cfg["response_format"] == "json_schema":
+            params["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "envision_scores", "strict": True, "schema": JUDGE_SCORE_SCHEMA}
+            }
+        elif cfg["response_format"] == "json_object":
+            params["response_format"] = {"type": "json_object"}
+    return params
+
+def check_judge_response(response: Dict, output_mode: str):
+    """Raise if a judge response cannot be scored (empty, no scores in text mode, or incomplete in JSON mode)."""
+    if not response["content"]:
+        raise EmptyResponseError("judge returned no content")
+    if output_mode != "json":
+        if not extract_scores(response["content"]):
+            raise ScoreParseError("no scores could be parsed")
+        return
+    scores, _ = parse_structured_scores(response["content"])
+    missing = [dim for dim in SUB_DIMENSIONS if dim not in scores]
+    if not missing:
+        return
+    if response.get("finish_reason") == "length":
+        raise TruncatedResponseError(f"output truncated at max_tokens, missing {missing}")
+    raise ScoreParseError(f"missing scores for {missing}")
+
+def call_judge(client, params: Dict, scheduler: JudgeScheduler, timings: Dict = None):
+    """Send one judge request through the scheduler (blocking)."""
+    t0 = time.perf_counter()
+    est_tokens = estimate_request_tokens(params["messages"], params["max_tokens"])
+    delay = scheduler.admission_delay(est_tokens)
+    if delay > 0:
+        time.sleep(delay)
+    scheduler.concurrency.acquire()
+    t1 = time.perf_counter()
+    congested = False
+    try:
+        if scheduler.hedger is not None:
+            raw = scheduler.hedger.call(lambda: client.chat.completions.with_raw_response.create(**params), scheduler, est_tokens)
+        else:
+            raw = client.chat.completions.with_raw_response.create(**params)
+        resp = raw.parse()
+        scheduler.observe_response(raw.headers, resp.usage, est_tokens)
+        return resp
+    except Exception as e:
+        congested = classify_error(e) in CONGESTION_ERRORS
+        raise
+    finally:
+        scheduler.concurrency.release(congested)
+        add_span(timings, "request_wait", t1 - t0)
+        add_span(timings, "judge", time.perf_counter() - t1)
+
+async def call_judge_async(client, params: Dict, scheduler: JudgeScheduler, timings: Dict = None):
+    """Send one judge request through the scheduler (async)."""
+    t0 = time.perf_counter()
+    est_tokens = estimate_request_tokens(params["messages"], params["max_tokens"])
+    delay = scheduler.admission_delay(est_tokens)
+    if delay > 0:
+        await asyncio.sleep(delay)
+    await scheduler.concurrency.acquire_async()
+    t1 = time.perf_counter()
+    congested = False
+    try:
+        if scheduler.hedger is not None:
+            raw = await scheduler.hedger.call_async(lambda: client.chat.completions.with_raw_response.create(**params), scheduler, est_tokens)
+        else:
+            raw = await client.chat.completions.with_raw_response.create(**params)
+        resp = raw.parse()
+        scheduler.observe_response(raw.headers, resp.usage, est_tokens)
+        return resp
+    except Exception as e:
+        congested = classify_error(e) in CONGESTION_ERRORS
+        raise
+    finally:
+        scheduler.concurrency.release(congested)
+        add_span(timings, "request_wait", t1 - t0)
+        add_span(timings, "judge", time.perf_counter() - t1)
+
+class JudgeCache:
+    """SQLite cache of judge responses, content-addressed by the full request.
+
+    The key hashes the judge model, sampling parameters and the rendered
+    messages, which embed the base64 image bytes, so any change to the rubric,
+    prompts or images is a miss.
+    """
+
+    def __init__(self, path: str, max_mb: float = None, max_age_days: float = None):
+        self.path = path
+        self.max_bytes = max_mb * 1024 * 1024 if max_mb else None
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self.conn.commit()
+        self.evict()
+
+    @staticmethod
+    def key(params: Dict) -> str:
+        blob = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return json.loads(row[0])
+
+    def put(self, key: str, model: str, response: Dict):
+        blob = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, blob, len(blob), now, now)
+            )
+            self.conn.commit()
+            self.stats["writes"] += 1
+
+    def evict(self):
+        """Drop entries older than max_age, then least recently used ones beyond max_bytes."""
+        with self.lock:
+            if self.max_age:
+                cur = self.conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+                self.stats["evicted"] += cur.rowcount
+            if self.max_bytes:
+                total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    stale = []
+                    for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self.conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                    self.stats["evicted"] += len(stale)
+            self.conn.commit()
+
+    def close(self):
+        self.evict()
+        with self.lock:
+            self.conn.close()
+
+# 判分模型价格（美元 / 百万 token）；--price_table 可覆盖或补充，按最长前缀匹配模型名
+DEFAULT_PRICES = {
+    "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60}
+}
+# 阶段耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0]
+PROMETHEUS_INTERVAL = 10.0
+
+def add_span(timings: Dict, stage: str, seconds: float):
+    """Accumulate a stage duration into a per-sequence timings dict (no-op if None)."""
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+def load_price_table(path: str = None) -> Dict[str, Dict]:
+    prices = dict(DEFAULT_PRICES)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            prices.update(json.load(f))
+    return prices
+
+def usage_record(usage: Dict, model: str, prices: Dict = None, local_cache_hit: bool = False) -> Optional[Dict]:
+    """Normalize resp.usage and price it; local judge-cache hits cost nothing."""
+    if not usage:
+        return None
+    details = usage.get("prompt_tokens_details") or {}
+    record = {
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "cached_tokens": details.get("cached_tokens") or 0,
+        "completion_tokens": usage.get("completion_tokens") or 0,
+        "cost_usd": None,
+        "local_cache_hit": local_cache_hit
+    }
+    matches = [name for name in (prices or {}) if model == name or model.startswith(name + "-")]
+    if local_cache_hit:
+        record["cost_usd"] = 0.0
+    elif matches:
+        price = prices[max(matches, key=len)]
+        uncached = record["prompt_tokens"] - record["cached_tokens"]
+        record["cost_usd"] = round((
+            uncached * price["input"]
+            + record["cached_tokens"] * price.get("cached_input", price["input"])
+            + record["completion_tokens"] * price["output"]
+        ) / 1e6, 6)
+    return record
+
+def log_event(runtime: Dict, message: str, verbose: bool = False):
+    """Print a per-sequence event without breaking the progress line.
+
+    verbose events (per-sequence start and judge transcripts) are only shown with --verbose.
+    """
+    progress = runtime.get("progress")
+    if progress is None:
+        print(message)
+    elif progress.verbose or not verbose:
+        progress.write(message)
+
+def format_evaluation(index: str, full_record: Dict) -> str:
+    return f"\n--- Sequence {index} ---\n{full_record['evaluation']}\nScores: {full_record['individual_scores']}\n--------------\n"
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+class RunTelemetry:
+    """Live progress line and run-level aggregates (stage latencies, tokens, cost).
+
+    Events are printed through write() so they do not interleave with the
+    progress line. On a TTY the line is redrawn in place, otherwise it is
+    printed every `interval` seconds. run_metrics.json and the optional
+    Prometheus textfile are built from the same counters.
+    """
+
+    def __init__(self, verbose: bool = False, prometheus_path: str = None, stream=None, interval: float = None):
+        self.stream = stream or sys.stderr
+        self.tty = self.stream.isatty()
+        self.interval = interval if interval is not None else (0.5 if self.tty else 10.0)
+        self.verbose = verbose
+        self.prometheus_path = prometheus_path
+        self.lock = threading.RLock()
+        self.scheduler = None
+        self.estimate = None
+        self.start(0)
+
+    def start(self, total: int):
+        with self.lock:
+            self.total = total
+            self.started = time.monotonic()
+            self.finished = None
+            self.last_render = self.last_export = 0.0
+            self.line_shown = False
+            self.succeeded = self.failed = 0
+            self.failures_by_type = {}
+            self.stages = {}
+            self.tokens = {"prompt": 0, "cached": 0, "completion": 0}
+            self.cost = 0.0
+            self.unpriced = 0
+            self.local_cache_hits = 0
+            self.samples = {"outputs": 0, "multi_sampled": 0, "escalated": 0}
+            self.triage = {}
+
+    def write(self, message: str):
+        with self.lock:
+            if self.line_shown:
+                self.stream.write("\r\033[K")
+                self.stream.flush()
+                self.line_shown = False
+            print(message, flush=True)
+            if self.tty:
+                self._render(force=True)
+
+    def update(self, index: str, result):
+        """Account one finished sequence (success tuple or failure record)."""
+        with self.lock:
+            if isinstance(result, tuple):
+                self.succeeded += 1
+                full_rec = result[0]
+                for stage, seconds in full_rec.get("timings", {}).items():
+                    self.stages.setdefault(stage, []).append(seconds)
+                usage = full_rec.get("usage")
+                if usage:
+                    self.tokens["prompt"] += usage["prompt_tokens"]
+                    self.tokens["cached"] += usage["cached_tokens"]
+                    self.tokens["completion"] += usage["completion_tokens"]
+                    self.local_cache_hits += usage["local_cache_hit"]
+                    if usage["cost_usd"] is None:
+                        self.unpriced += 1
+                    else:
+                        self.cost += usage["cost_usd"]
+                judge = full_rec.get("judge")
+                if judge:
+                    reason = judge["reason"] or "settled"
+                    self.triage[reason] = self.triage.get(reason, 0) + 1
+                sampled = full_rec.get("samples")
+                self.samples["outputs"] += sampled["n"] if sampled else 1
+                if sampled:
+                    self.samples["multi_sampled"] += 1
+                    self.samples["escalated"] += sampled["escalated"]
+                if self.verbose:
+                    self.write(f"[SUCCESS] Completed evaluation for sequence {index}")
+            else:
+                self.failed += 1
+                self.failures_by_type[result["error_type"]] = self.failures_by_type.get(result["error_type"], 0) + 1
+                self.write(f"[FAILED] Evaluation failed for sequence {index}: {result['error_type']}")
+            self._render()
+
+    def status_line(self) -> str:
+        done = self.succeeded + self.failed
+        elapsed = (self.finished or time.monotonic()) - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = format_duration((self.total - done) / rate) if rate > 0 else "--:--:--"
+        tokens = self.tokens["prompt"] + self.tokens["completion"]
+        line = (f"[PROGRESS] {done}/{self.total} ({self.failed} failed) | {rate:.2f} seq/s | "
+                f"elapsed {format_duration(elapsed)} | ETA {eta} | {tokens} tokens | ${self.cost:.4f}")
+        if self.estimate is not None:
+            line += f" | {self.estimate.brief()}"
+        return line
+
+    def _render(self, force: bool = False):
+        now = time.monotonic()
+        if force or now - self.last_render >= self.interval:
+            self.last_render = now
+            if self.tty:
+                self.stream.write("\r\033[K" + self.status_line())
+                self.line_shown = True
+            else:
+                self.stream.write(self.status_line() + "\n")
+            self.stream.flush()
+        if self.prometheus_path and now - self.last_export >= PROMETHEUS_INTERVAL:
+            self.last_export = now
+            self.write_prometheus()
+
+    def close(self):
+        with self.lock:
+            self.finished = time.monotonic()
+            self._render(force=True)
+            if self.line_shown:
+                self.stream.write("\n")
+                self.stream.flush()
+                self.line_shown = False
+            if self.prometheus_path:
+                self.write_prometheus()
+
+    @staticmethod
+    def stage_summary(values: List[float]) -> Dict:
+        arr = np.asarray(values, dtype=float)
+        # Prometheus 的 le 桶含上界：等于边界的值计入该桶
+        counts = np.bincount(np.searchsorted(LATENCY_BUCKETS, arr, side="left"), minlength=len(LATENCY_BUCKETS) + 1)
+        p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+        return {
+            "count": int(arr.size),
+            "sum": round(float(arr.sum()), 4),
+            "mean": round(float(arr.mean()), 4),
+            "p50": round(float(p50), 4),
+            "p95": round(float(p95), 4),
+            "p99": round(float(p99), 4),
+            "max": round(float(arr.max()), 4),
+            "histogram": {"le": [*LATENCY_BUCKETS, "+Inf"], "counts": counts.tolist()}
+        }
+
+    def summary(self) -> Dict:
+        with self.lock:
+            elapsed = (self.finished or time.monotonic()) - self.started
+            done = self.succeeded + self.failed
+            return {
+                "sequences": {"total": self.total, "succeeded": self.succeeded, "failed": self.failed},
+                "failures_by_type": dict(self.failures_by_type),
+                "wall_time_s": round(elapsed, 3),
+                "throughput_seq_per_s": round(done / elapsed, 4) if elapsed > 0 else None,
+                "stages": {stage: self.stage_summary(values) for stage, values in self.stages.items() if values},
+                "tokens": dict(self.tokens),
+                "cost_usd": round(self.cost, 6),
+                "unpriced_sequences": self.unpriced,
+                "local_cache_hits": self.local_cache_hits,
+                "judge_samples": dict(self.samples),
+                "triage": dict(self.triage),
+                "judge": dict(self.scheduler.stats) if self.scheduler is not None else {},
+                "hedging": self.scheduler.hedger.summary() if self.scheduler is not None and self.scheduler.hedger is not None else None
+            }
+
+    def write_prometheus(self):
+        """Write the aggregates in the Prometheus textfile-collector format (atomically)."""
+        summary = self.summary()
+        lines = [
+            "# HELP envision_sequences_total Sequences finished in this run.",
+            "# TYPE envision_sequences_total counter",
+            f'envision_sequences_total{{status="succeeded"}} {summary["sequences"]["succeeded"]}',
+            f'envision_sequences_total{{status="failed"}} {summary["sequences"]["failed"]}',
+            "# HELP envision_sequences_planned Sequences queued for this run.",
+            "# TYPE envision_sequences_planned gauge",
+            f"envision_sequences_planned {summary['sequences']['total']}",
+            "# HELP envision_throughput_sequences_per_second Finished sequences per second.",
+            "# TYPE envision_throughput_sequences_per_second gauge",
+            f"envision_throughput_sequences_per_second {summary['throughput_seq_per_s'] or 0}",
+            "# HELP envision_tokens_total Judge tokens used.",
+            "# TYPE envision_tokens_total counter"
+        ]
+        lines += [f'envision_tokens_total{{kind="{kind}"}} {count}' for kind, count in summary["tokens"].items()]
+        lines += [
+            "# HELP envision_cost_usd_total Judge cost from the price table.",
+            "# TYPE envision_cost_usd_total counter",
+            f"envision_cost_usd_total {summary['cost_usd']}"
+        ]
+        for key in ("requests", "retries", "rate_limited", "truncated", "parse_failures"):
+            if key in summary["judge"]:
+                lines += [f"# TYPE envision_judge_{key}_total counter", f"envision_judge_{key}_total {summary['judge'][key]}"]
+        lines += ["# HELP envision_stage_seconds Per-sequence stage durations.", "# TYPE envision_stage_seconds histogram"]
+        for stage, stats in summary["stages"].items():
+            cumulative = 0
+            for le, count in zip(stats["histogram"]["le"], stats["histogram"]["counts"]):
+                cumulative += count
+                lines.append(f'envision_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'envision_stage_seconds_sum{{stage="{stage}"}} {stats["sum"]}')
+            lines.append(f'envision_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        tmp_path = f"{self.prometheus_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prometheus_path)
+
+def prepare_sequence_request(index: str, sequence_data: Dict, cfg: Dict, runtime: Dict, timings: Dict = None,
+                             image_paths: Dict[int, str] = None):
+    """Resolve and encode the images of a sequence and build its messages.
+
+    Returns (image_paths, messages), or None if the sequence cannot be evaluated.
+    Stage durations are added to timings ("image_lookup", "encode") if given.
+    image_paths already resolved by the job source skip the lookup.
+    """
+    t0 = time.perf_counter()
+    # Get all step numbers
+    steps = [prompt["step"] for prompt in sequence_data["prompts"]]
+    if len(steps) != 4:
+        print(f"[WARN] Sequence {index} has {len(steps)} steps, expected 4")
+    
+    # Get image paths for all steps
+    if image_paths is None:
+        image_paths = find_image_paths(index, cfg["image_dir"], steps, runtime.get("image_index"))
+    t1 = time.perf_counter()
+    add_span(timings, "image_lookup", t1 - t0)
+    if len(image_paths) != len(steps):
+        log_event(runtime, f"[WARN] Sequence {index} has {len(image_paths)}/{len(steps)} images")
+        return None
+    
+    # Encode all images in step order
+    optimizer = runtime.get("images")
+    image_base64_list = []
+    for step in sorted(steps):
+        if step in image_paths:
+            encoded = encode_image(image_paths[step], optimizer)
+            if encoded:
+                image_base64_list.append(encoded)
+            else:
+                log_event(runtime, f"[ERROR] Failed to encode image for step {step}")
+                return None
+    
+    # Build evaluation messages
+    msgs = build_sequence_evaluation_messages(
+        sequence_data, image_base64_list,
+        mime_type=optimizer.mime_type if optimizer is not None else "image/png",
+        detail=cfg["image_detail"],
+        output_mode=cfg["output_mode"],
+        layout=cfg["prompt_layout"],
+        rubric=runtime.get("rubric"),
+        text_contents=runtime.get("prompt_texts", {}).get(index)
+    )
+    add_span(timings, "encode", time.perf_counter() - t1)
+    return image_paths, msgs
+
+def aggregate_sample_scores(sample_scores: List[Dict[str, float]], method: str = "median") -> Tuple[Dict, Dict, Dict]:
+    """Combine per-sample sub-dimension scores; returns (scores, variance, spread) per dimension."""
+    scores, variance, spread = {}, {}, {}
+    for dim in SUB_DIMENSIONS:
+        values = np.array([sample[dim] for sample in sample_scores if dim in sample], dtype=float)
+        if not len(values):
+            continue
+        scores[dim] = round(float(np.median(values) if method == "median" else values.mean()), 3)
+        variance[dim] = round(float(values.var(ddof=1)), 4) if len(values) > 1 else 0.0
+        spread[dim] = float(values.max() - values.min())
+    return scores, variance, spread
+
+def sum_usage(usages: List[Optional[Dict]]) -> Optional[Dict]:
+    """Combine the usage records of several judge requests of one sequence."""
+    usages = [u for u in usages if u]
+    if not usages:
+        return None
+    if len(usages) == 1:
+        return usages[0]
+    costs = [u["cost_usd"] for u in usages]
+    return {
+        "prompt_tokens": sum(u["prompt_tokens"] for u in usages),
+        "cached_tokens": sum(u["cached_tokens"] for u in usages),
+        "completion_tokens": sum(u["completion_tokens"] for u in usages),
+        "cost_usd": None if None in costs else round(sum(costs), 6),
+        "local_cache_hit": all(u["local_cache_hit"] for u in usages)
+    }
+
+class JudgeSamples:
+    """Judge outputs of one sequence across sampling rounds (--samples / --max_samples).
+
+    cfg["model"] is the judge that is asked (the triage model in a cascade).
+
+    The first round asks for --samples outputs with the n parameter. Further
+    rounds of up to --samples each are only requested, until --max_samples,
+    while a sub-dimension spread exceeds --sample_spread or the aggregated
+    overall score lies within --grade_margin of a grade boundary. Endpoints
+    that ignore n simply take more rounds.
+    """
+
+    def __init__(self, cfg: Dict):
+        self.cfg = cfg
+        self.contents = []
+        self.usages = []
+        self.rounds = 0
+        self.attempts = 0
+        self.escalated = False
+
+    def next_n(self) -> int:
+        """Number of outputs to request next; 0 when sampling is finished."""
+        have = len(self.contents)
+        if have < self.cfg["samples"]:
+            return self.cfg["samples"] - have
+        if have < self.cfg["max_samples"] and self.disagree():
+            self.escalated = True
+            return min(self.cfg["samples"], self.cfg["max_samples"] - have)
+        return 0
+
+    def add(self, response: Dict, usage: Optional[Dict]):
+        self.contents.extend(choice["content"] for choice in response.get("choices") or [response])
+        self.usages.append(usage)
+        self.rounds += 1
+
+    def parsed(self) -> List[Dict[str, float]]:
+        return [parse_evaluation(content, self.cfg["output_mode"])[0] for content in self.contents]
+
+    def disagree(self) -> bool:
+        scores, _, spread = aggregate_sample_scores(self.parsed(), self.cfg["sample_aggregate"])
+        if not scores:
+            # 没有可解析的样本（如旧缓存中的响应）：继续采样
+            return True
+        if max(spread.values()) > self.cfg["sample_spread"]:
+            return True
+        overall = calculate_comprehensive_scores(scores)["overall_score"]
+        return any(abs(overall - threshold) < self.cfg["grade_margin"] for threshold, _ in GRADE_THRESHOLDS)
+
+    def scores(self) -> Dict[str, float]:
+        """Aggregated sub-dimension scores of all outputs."""
+        return aggregate_sample_scores(self.parsed(), self.cfg["sample_aggregate"])[0]
+
+    def record(self) -> Dict:
+        """The "samples" entry of the full record (only written for more than one output)."""
+        _, variance, spread = aggregate_sample_scores(self.parsed(), self.cfg["sample_aggregate"])
+        return {
+            "n": len(self.contents),
+            "rounds": self.rounds,
+            "escalated": self.escalated,
+            "aggregate": self.cfg["sample_aggregate"],
+            "variance": variance,
+            "spread": spread,
+            "evaluations": self.contents
+        }
+
+def triage_reason(index: str, triage: JudgeSamples, cfg: Dict) -> Optional[str]:
+    """Why a triage judgment must be re-judged by --model, or None if it settles the sequence.
+
+    Escalates incomplete score sets, overall scores inside a --triage_band,
+    dimensions whose sub-scores disagree by more than --triage_spread (or
+    samples spread beyond --sample_spread), and a stable --triage_audit
+    fraction of the rest for calibration.
+    """
+    scores, _, spread = aggregate_sample_scores(triage.parsed(), cfg["sample_aggregate"])
+    if any(dim not in scores for dim in SUB_DIMENSIONS):
+        return "incomplete"
+    overall = calculate_comprehensive_scores(scores)["overall_score"]
+    if any(low <= overall <= high for low, high in cfg["triage_bands"]):
+        return "band"
+    for weights in SUB_DIMENSION_WEIGHTS.values():
+        values = [scores[dim] for dim in weights]
+        if max(values) - min(values) > cfg["triage_spread"]:
+            return "inconsistent"
+    if len(triage.contents) > 1 and max(spread.values()) > cfg["sample_spread"]:
+        return "inconsistent"
+    # 按索引哈希稳定抽样，用于无偏校准
+    if cfg["triage_audit"] and shard_of(f"audit:{index}", 10000) < cfg["triage_audit"] * 10000:
+        return "audit"
+    return None
+
+def add_triage_provenance(result: Tuple[Dict, Dict], triage: JudgeSamples, reason: Optional[str], cfg: Dict):
+    """Record which judge produced the result; escalated records also keep the triage scores."""
+    full_rec, score_rec = result
+    full_rec["judge"] = {
+        "model": cfg["model"] if reason else cfg["triage_model"],
+        "triage_model": cfg["triage_model"],
+        "escalated": reason is not None,
+        "reason": reason
+    }
+    score_rec["judge_model"] = full_rec["judge"]["model"]
+    score_rec["triage_reason"] = reason
+    if reason:
+        scores = triage.scores()
+        comprehensive_scores = calculate_comprehensive_scores(scores)
+        full_rec["triage"] = {
+            "evaluation": triage.contents[0],
+            "individual_scores": scores,
+            "comprehensive_scores": comprehensive_scores
+        }
+        score_rec["triage"] = {
+            **scores,
+            "overall_score": comprehensive_scores["overall_score"],
+            "overall_grade": comprehensive_scores["overall_grade"]
+        }
+
+def finish_judgment(index: str, sequence_data: Dict, image_paths: Dict[int, str], samples: JudgeSamples,
+                    triage: Optional[JudgeSamples], reason: Optional[str], cfg: Dict, telemetry: Dict) -> Tuple[Dict, Dict]:
+    """Build the result records from the deciding judge's samples (plus triage provenance)."""
+    stages = [s for s in (triage, samples) if s is not None]
+    telemetry["usage"] = sum_usage([u for s in dict.fromkeys(stages) for u in s.usages])
+    result = build_result_records(index, sequence_data, image_paths, samples.contents[0], cfg["output_mode"], telemetry,
+                                  samples.record() if len(samples.contents) > 1 else None)
+    if triage is not None:
+        add_triage_provenance(result, triage, reason, cfg)
+    return result
+
+def build_result_records(index: str, sequence_data: Dict, image_paths: Dict[int, str], eval_txt: str,
+                         output_mode: str = "text", telemetry: Dict = None, samples: Dict = None) -> Tuple[Dict, Dict]:
+    """Parse the judge output and build the (full record, score record) pair.
+
+    telemetry ({"timings", "usage"[, "started"]}) is stored in the full record.
+    With samples (JudgeSamples.record()), the scores are the aggregate of all
+    sampled evaluations and eval_txt is the first of them.
+    """
+    t0 = time.perf_counter()
+    scores, reasons = parse_evaluation(eval_txt, output_mode)
+    if samples is not None:
+        sample_scores = [parse_evaluation(txt, output_mode)[0] for txt in samples["evaluations"]]
+        scores, _, _ = aggregate_sample_scores(sample_scores, samples["aggregate"])
+
+    # 计算综合分数
+    comprehensive_scores = calculate_comprehensive_scores(scores)
+
+    # Build step information for full record
+    step_info = []
+    for step_data in sequence_data["prompts"]:
+        step = step_data["step"]
+        step_info.append({
+            "step": step,
+            "prompt": step_data["prompt"],
+            "explanation": step_data["explanation"],
+            "image_path": image_paths.get(step, "")
+        })
+
+    full_record = {
+        "index": index,
+        "category": sequence_data["category"],
+        "process_type": sequence_data["process_type"],
+        "steps": step_info,
+        "evaluation": eval_txt,
+        "individual_scores": scores,
+        "comprehensive_scores": comprehensive_scores
+    }
+    if output_mode == "json":
+        full_record["output_mode"] = output_mode
+        full_record["reasons"] = reasons
+    if samples is not None:
+        full_record["samples"] = samples
+    if telemetry is not None:
+        timings = telemetry["timings"]
+        add_span(timings, "parse", time.perf_counter() - t0)
+        if "started" in telemetry:
+            timings["total"] = time.perf_counter() - telemetry["started"]
+        full_record["timings"] = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+        full_record["usage"] = telemetry["usage"]
+    return full_record, make_score_record(index, sequence_data, scores, comprehensive_scores)
+
+def make_score_record(index: str, sequence_data: Dict, scores: Dict, comprehensive_scores: Dict) -> Dict:
+    """Score record (简化版，用于分析)."""
+    return {
+        "index": index,
+        "category": sequence_data["category"],
+        "process_type": sequence_data["process_type"],
+        # 原始分数
+        **scores,
+        # 综合分数
+        "consistency_score": comprehensive_scores["consistency_score"],
+        "aesthetic_score": comprehensive_scores["aesthetic_score"],
+        "physicality_score": comprehensive_scores["physicality_score"],
+        "overall_score": comprehensive_scores["overall_score"],
+        "overall_grade": comprehensive_scores["overall_grade"],
+        "pass_rate_3": comprehensive_scores["pass_rate_3"],
+        "pass_rate_4": comprehensive_scores["pass_rate_4"]
+    }
+
+def make_runtime(cfg: Dict, image_index: ImageIndex = None) -> Dict:
+    """Objects shared by all workers of a run; the engine adds its own "client".
+
+    Batch mode also adds "prompt_texts" (index -> rendered text parts of the messages).
+    """
+    return {
+        "image_index": image_index,
+        "rubric": render_rubric(cfg["output_mode"]),
+        "prices": load_price_table(cfg["price_table"]),
+        "progress": RunTelemetry(cfg["verbose"], cfg["prometheus_textfile"]),
+        "scheduler": JudgeScheduler(cfg),
+        "images": make_image_optimizer(cfg),
+        "cache": JudgeCache(cfg["cache_path"], cfg["cache_max_mb"], cfg["cache_max_age_days"]) if cfg["cache_path"] else None
+    }
+
+def cached_judge_response(params: Dict, runtime: Dict, sample_round: int = 0):
+    """Return (cache key, cached response or None).
+
+    Later sampling rounds of the same request get their own cache entries.
+    """
+    cache = runtime.get("cache")
+    if cache is None:
+        return None, None
+    key = JudgeCache.key({**params, "sample_round": sample_round} if sample_round else params)
+    return key, cache.get(key)
+
+def store_judge_response(key: str, params: Dict, resp, cfg: Dict, runtime: Dict) -> Dict:
+    """Convert a completion into the cached response form and validate it.
+
+    Only responses that pass check_judge_response are cached.
+    """
+    response = {
+        "content": resp.choices[0].message.content,
+        "finish_reason": resp.choices[0].finish_reason,
+        "usage": resp.usage.model_dump() if resp.usage is not None else None
+    }
+    if len(resp.choices) > 1:
+        # 多采样：丢弃无法评分的样本，全部无效时按首个错误处理
+        choices, errors = [], []
+        for choice in resp.choices:
+            sample = {"content": choice.message.content, "finish_reason": choice.finish_reason}
+            try:
+                check_judge_response(sample, cfg["output_mode"])
+                choices.append(sample)
+            except (EmptyResponseError, TruncatedResponseError, ScoreParseError) as e:
+                errors.append(e)
+        if not choices:
+            raise errors[0]
+        for e in errors:
+            runtime["scheduler"].observe_error(classify_error(e), 0.0)
+        response.update(choices[0], choices=choices)
+    check_judge_response(response, cfg["output_mode"])
+    if key is not None:
+        runtime["cache"].put(key, params["model"], response)
+    return response
+
+class MemoryBudget:
+    """Byte-counting semaphore shared by the prefetch and request stages.
+
+    try_acquire never blocks; one reservation is always admitted when nothing
+    is held, so an oversized sequence cannot stall the pipeline.
+    """
+
+    def __init__(self, limit_bytes: float):
+        self.limit = limit_bytes
+        self.used = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self, nbytes: int) -> bool:
+        with self.lock:
+            if self.used and self.used + nbytes > self.limit:
+                return False
+            self.used += nbytes
+            self.peak = max(self.peak, self.used)
+            return True
+
+    def adjust(self, delta: int):
+        with self.lock:
+            self.used += delta
+            self.peak = max(self.peak, self.used)
+
+class PrefetchedInput:
+    """Request inputs of one sequence, prepared by the prefetch stage.
+
+    Holds its bytes in the memory budget until the request stage is done with it.
+    """
+
+    def __init__(self, stage: "PrefetchStage", nbytes: int):
+        self.stage = stage
+        self.nbytes = nbytes
+        self.future = None
+        self.timings = {}
+        self.released = False
+
+    def _merge(self, timings: Dict, waited: float):
+        for stage, seconds in self.timings.items():
+            add_span(timings, stage, seconds)
+        add_span(timings, "prefetch_wait", waited)
+        self.stage.add_wait(waited)
+
+    def result(self, timings: Dict = None):
+        t0 = time.perf_counter()
+        prepared = self.future.result()
+        self._merge(timings, time.perf_counter() - t0)
+        return prepared
+
+    async def result_async(self, timings: Dict = None):
+        t0 = time.perf_counter()
+        prepared = await asyncio.wrap_future(self.future)
+        self._merge(timings, time.perf_counter() - t0)
+        return prepared
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.stage.budget.adjust(-self.nbytes)
+
+class PrefetchStage:
+    """Reads and encodes images ahead of the request stage on a small thread pool.
+
+    wrap() turns a job source into one whose jobs carry a PrefetchedInput as a
+    seventh element. New sequences are only admitted while their (estimated)
+    encoded size fits the --prefetch_mb budget. The budget also covers requests
+    in flight, so peak image memory stays flat at any --max_workers.
+    """
+
+    def __init__(self, cfg: Dict):
+        self.budget = MemoryBudget(cfg["prefetch_mb"] * 1024 * 1024)
+        self.workers = cfg["prefetch_workers"]
+        self.lookahead = 2 * cfg["max_workers"]
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+        self.lock = threading.Lock()
+        self.waited = 0.0
+        self.waits = 0
+
+    @staticmethod
+    def estimate_bytes(job: Tuple) -> int:
+        """Base64 size of the raw image files (processed variants are usually smaller)."""
+        _, index, seq_data, job_cfg, job_runtime, image_paths = job[:6]
+        if image_paths is None:
+            steps = [prompt["step"] for prompt in seq_data["prompts"]]
+            image_paths = find_image_paths(index, job_cfg["image_dir"], steps, job_runtime.get("image_index"))
+        total = 0
+        for path in image_paths.values():
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total * 4 // 3 + 1
+
+    def _prepare(self, handle: PrefetchedInput, job: Tuple):
+        _, index, seq_data, job_cfg, job_runtime, image_paths = job[:6]
+        prepared = prepare_sequence_request(index, seq_data, job_cfg, job_runtime, handle.timings, image_paths)
+        actual = 0
+        if prepared is not None:
+            for msg in prepared[1]:
+                for part in msg["content"] if isinstance(msg["content"], list) else []:
+                    if part.get("type") == "image_url":
+                        actual += len(part["image_url"]["url"])
+        # 用实际编码大小替换预估值
+        if not handle.released:
+            self.budget.adjust(actual - handle.nbytes)
+        handle.nbytes = actual
+        return prepared
+
+    def add_wait(self, seconds: float):
+        with self.lock:
+            self.waited += seconds
+            self.waits += seconds > 0.001
+
+    def wrap(self, jobs):
+        """Yield the jobs of a job source with their inputs prefetched, under the memory budget."""
+        jobs = iter(jobs)
+        ahead = collections.deque()
+        parked = None
+        exhausted = False
+        while True:
+            while len(ahead) < self.lookahead:
+                if parked is None:
+                    if exhausted:
+                        break
+                    try:
+                        job = next(jobs)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if job is None:  # 源暂时没有任务
+                        break
+                    parked = (job, self.estimate_bytes(job))
+                job, estimate = parked
+                if not self.budget.try_acquire(estimate):
+                    break  # 背压：等在途请求释放内存
+                parked = None
+                handle = PrefetchedInput(self, estimate)
+                handle.future = self.pool.submit(self._prepare, handle, job)
+                ahead.append(tuple(job[:6]) + (handle,))
+            if ahead:
+                yield ahead.popleft()
+            elif exhausted and parked is None:
+                return
+            else:
+                # 预算被在途请求占满（或源暂时为空）：这些请求完成后再继续
+                yield None
+
+    def report(self) -> str:
+        return (f"Prefetch: peak {self.budget.peak / 1024 / 1024:.2f} MB of {self.budget.limit / 1024 / 1024:g} MB budget, "
+                f"request stage waited {self.waited:.2f}s on {self.waits} sequences")
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+def collect_samples(samples: JudgeSamples, index: str, msgs: list, runtime: Dict, timings: Dict = None):
+    """Request judge outputs until samples.next_n() is satisfied, retrying retryable errors (blocking)."""
+    cfg, scheduler = samples.cfg, runtime["scheduler"]
+    n = samples.next_n()
+    while n:
+        params = judge_request_params(cfg, msgs, n)
+        cache_key, response = cached_judge_response(params, runtime, samples.rounds)
+        local_cache_hit = response is not None
+        while response is None:
+            samples.attempts += 1
+            try:
+                resp = call_judge(runtime["client"], params, scheduler, timings)
+                response = store_judge_response(cache_key, params, resp, cfg, runtime)
+            except Exception as e:
+                error_type = classify_error(e)
+                retry_after = retry_after_seconds(e)
+                scheduler.observe_error(error_type, retry_after)
+                if error_type not in RETRYABLE_ERRORS or samples.attempts > cfg["max_retries"]:
+                    raise
+                delay = scheduler.backoff_delay(samples.attempts, retry_after)
+                log_event(runtime, f"[RETRY] Sequence {index}: {error_type} ({e}); attempt {samples.attempts}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                add_span(timings, "retry_backoff", delay)
+        samples.add(response, usage_record(response.get("usage"), params["model"], runtime.get("prices"), local_cache_hit))
+        n = samples.next_n()
+
+async def collect_samples_async(samples: JudgeSamples, index: str, msgs: list, runtime: Dict, timings: Dict = None):
+    """Async counterpart of collect_samples."""
+    cfg, scheduler = samples.cfg, runtime["scheduler"]
+    n = samples.next_n()
+    while n:
+        params = judge_request_params(cfg, msgs, n)
+        cache_key, response = cached_judge_response(params, runtime, samples.rounds)
+        local_cache_hit = response is not None
+        while response is None:
+            samples.attempts += 1
+            try:
+                resp = await call_judge_async(runtime["client"], params, scheduler, timings)
+                response = store_judge_response(cache_key, params, resp, cfg, runtime)
+            except Exception as e:
+                error_type = classify_error(e)
+                retry_after = retry_after_seconds(e)
+                scheduler.observe_error(error_type, retry_after)
+                if error_type not in RETRYABLE_ERRORS or samples.attempts > cfg["max_retries"]:
+                    raise
+                delay = scheduler.backoff_delay(samples.attempts, retry_after)
+                log_event(runtime, f"[RETRY] Sequence {index}: {error_type} ({e}); attempt {samples.attempts}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                add_span(timings, "retry_backoff", delay)
+        samples.add(response, usage_record(response.get("usage"), params["model"], runtime.get("prices"), local_cache_hit))
+        n = samples.next_n()
+
+def evaluate_sequence(index: str, sequence_data: Dict, cfg: Dict, runtime: Dict, image_paths: Dict[int, str] = None,
+                      prefetched: PrefetchedInput = None):
+    """Evaluate a complete 4-step sequence.
+
+    Returns (full record, score record) on success, or a failure record dict.
+    image_paths, if given, were resolved by the job source. With prefetched,
+    the images were already encoded by the PrefetchStage.
+    """
+    stages = []
+    telemetry = {"started": time.perf_counter(), "timings": {}, "usage": None}
+    timings = telemetry["timings"]
+    try:
+        log_event(runtime, f"Evaluating sequence {index} ...", verbose=True)
+        
+        if prefetched is not None:
+            prepared = prefetched.result(timings)
+        else:
+            prepared = prepare_sequence_request(index, sequence_data, cfg, runtime, timings, image_paths)
+        if prepared is None:
+            return make_failure_record(index, "input_error", "missing or unreadable images", 0)
+        image_paths, msgs = prepared
+        
+        triage = reason = None
+        if cfg["triage_model"]:
+            triage = JudgeSamples({**cfg, "model": cfg["triage_model"]})
+            stages.append(triage)
+            collect_samples(triage, index, msgs, runtime, timings)
+            reason = triage_reason(index, triage, cfg)
+        samples = triage
+        if triage is None or reason is not None:
+            samples = JudgeSamples(cfg)
+            stages.append(samples)
+            collect_samples(samples, index, msgs, runtime, timings)
+        result = finish_judgment(index, sequence_data, image_paths, samples, triage, reason, cfg, telemetry)
+        log_event(runtime, format_evaluation(index, result[0]), verbose=True)
+        return result
+    except Exception as e:
+        log_event(runtime, f"[ERR] Sequence {index}: {e}")
+        return make_failure_record(index, classify_error(e), str(e), sum(stage.attempts for stage in stages))
+    finally:
+        if prefetched is not None:
+            prefetched.release()
+
+async def evaluate_sequence_async(index: str, sequence_data: Dict, cfg: Dict, runtime: Dict, sem: asyncio.Semaphore,
+                                  image_paths: Dict[int, str] = None, prefetched: PrefetchedInput = None):
+    """Async counterpart of evaluate_sequence; produces identical records."""
+    async with sem:
+        stages = []
+        telemetry = {"started": time.perf_counter(), "timings": {}, "usage": None}
+        timings = telemetry["timings"]
+        try:
+            log_event(runtime, f"Evaluating sequence {index} ...", verbose=True)
+            
+            # Disk reads and base64 encoding happen off the event loop
+            if prefetched is not None:
+                prepared = await prefetched.result_async(timings)
+            else:
+                prepared = await asyncio.to_thread(prepare_sequence_request, index, sequence_data, cfg, runtime, timings, image_paths)
+            if prepared is None:
+                return make_failure_record(index, "input_error", "missing or unreadable images", 0)
+            image_paths, msgs = prepared
+            
+            triage = reason = None
+            if cfg["triage_model"]:
+                triage = JudgeSamples({**cfg, "model": cfg["triage_model"]})
+                stages.append(triage)
+                await collect_samples_async(triage, index, msgs, runtime, timings)
+                reason = triage_reason(index, triage, cfg)
+            samples = triage
+            if triage is None or reason is not None:
+                samples = JudgeSamples(cfg)
+                stages.append(samples)
+                await collect_samples_async(samples, index, msgs, runtime, timings)
+            result = finish_judgment(index, sequence_data, image_paths, samples, triage, reason, cfg, telemetry)
+            log_event(runtime, format_evaluation(index, result[0]), verbose=True)
+            return result
+        except Exception as e:
+            log_event(runtime, f"[ERR] Sequence {index}: {e}")
+            return make_failure_record(index, classify_error(e), str(e), sum(stage.attempts for stage in stages))
+        finally:
+            if prefetched is not None:
+                prefetched.release()
+
+# 任务源暂时没有任务时，引擎再次拉取前最多等待的秒数
+JOB_POLL_SECONDS = 0.5
+
+def pull_jobs(jobs, count: int) -> Tuple[List[Tuple], bool]:
+    """Take up to count jobs from a job iterator; returns (jobs, exhausted).
+
+    A job source may yield None to signal that no job is ready yet (see
+    iter_queue_jobs, iter_watch_jobs); the engines then pull again when a
+    result arrives or after JOB_POLL_SECONDS, whichever comes first.
+    """
+    pulled = []
+    while len(pulled) < count:
+        try:
+            job = next(jobs)
+        except StopIteration:
+            return pulled, True
+        if job is None:
+            break
+        pulled.append(job)
+    return pulled, False
+
+def run_threaded_evaluation(jobs: Iterable[Tuple], cfg: Dict, on_result, runtime: Dict):
+    """Evaluate jobs on a thread pool sharing one client; on_result runs on the main thread.
+
+    Each job is (key, index, sequence_data, job_cfg, job_runtime, image_paths),
+    image_paths being None when the source did not resolve them; job runtimes
+    share the run-level objects of runtime. Jobs are pulled lazily, at most
+    2 x max_workers ahead of the results.
+    """
+    client = make_client(cfg)
+    jobs = iter(jobs)
+    window = 2 * cfg["max_workers"]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=cfg["max_workers"]) as executor:
+        future_to_key = {}
+        exhausted = waiting = False
+        while True:
+            if not exhausted:
+                wanted = window - len(future_to_key)
+                new_jobs, exhausted = pull_jobs(jobs, wanted)
+                waiting = not exhausted and len(new_jobs) < wanted
+                for key, index, seq_data, job_cfg, job_runtime, *inputs in new_jobs:
+                    job_runtime["client"] = client
+                    future_to_key[executor.submit(evaluate_sequence, index, seq_data, job_cfg, job_runtime, *inputs)] = key
+            if not future_to_key:
+                if exhausted:
+                    break
+                time.sleep(JOB_POLL_SECONDS)
+                continue
+
+            done, _ = concurrent.futures.wait(future_to_key, timeout=JOB_POLL_SECONDS if waiting else None,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                key = future_to_key.pop(future)
+                try:
+                    on_result(key, future.result())
+                except Exception as e:
+                    log_event(runtime, f"[ERR] Failed to evaluate sequence {key}: {e}")
+
+async def run_async_evaluation(jobs: Iterable[Tuple], cfg: Dict, on_result, runtime: Dict):
+    """Evaluate jobs as a semaphore-bounded asyncio task set over one pooled client.
+
+    Jobs are pulled lazily, at most 2 x max_workers ahead of the results.
+    """
+    client = make_async_client(cfg)
+    sem = asyncio.Semaphore(cfg["max_workers"])
+    jobs = iter(jobs)
+    window = 2 * cfg["max_workers"]
+
+    async def run_one(key, index, seq_data, job_cfg, job_runtime, image_paths=None, prefetched=None):
+        job_runtime["client"] = client
+        return key, await evaluate_sequence_async(index, seq_data, job_cfg, job_runtime, sem, image_paths, prefetched)
+
+    pending = set()
+    try:
+        exhausted = waiting = False
+        while True:
+            if not exhausted:
+                wanted = window - len(pending)
+                new_jobs, exhausted = pull_jobs(jobs, wanted)
+                waiting = not exhausted and len(new_jobs) < wanted
+                pending.update(asyncio.create_task(run_one(*job)) for job in new_jobs)
+            if not pending:
+                if exhausted:
+                    break
+                await asyncio.sleep(JOB_POLL_SECONDS)
+                continue
+
+            done, pending = await asyncio.wait(pending, timeout=JOB_POLL_SECONDS if waiting else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    key, result = task.result()
+                    on_result(key, result)
+                except Exception as e:
+                    log_event(runtime, f"[ERR] Failed to evaluate sequence: {e}")
+    finally:
+        for task in pending:
+            task.cancel()
+        await client.close()
+
+def run_evaluation(jobs: Iterable[Tuple], cfg: Dict, on_result, runtime: Dict, total: int = None):
+    """Run jobs on the configured engine and report run-level statistics.
+
+    jobs may be a list or a lazy job source (pass total for the progress
+    line). The run aggregates are written to <output_dir>/run_metrics.json,
+    or run_metrics.<worker_id>.json for a --work_queue worker.
+    """
+    progress = runtime["progress"]
+    progress.scheduler = runtime["scheduler"]
+    progress.start(len(jobs) if total is None else total)
+    prefetch = PrefetchStage(cfg) if cfg.get("prefetch_mb") else None
+    if prefetch is not None:
+        jobs = prefetch.wrap(jobs)
+    try:
+        if cfg["engine"] == "async":
+            asyncio.run(run_async_evaluation(jobs, cfg, on_result, runtime))
+        else:
+            run_threaded_evaluation(jobs, cfg, on_result, runtime)
+    finally:
+        progress.close()
+        if prefetch is not None:
+            prefetch.close()
+            print(prefetch.report())
+        if runtime["cache"] is not None:
+            runtime["cache"].close()
+            print(f"Judge cache: {runtime['cache'].stats}")
+        if runtime["images"] is not None:
+            print(runtime["images"].report())
+        scheduler = runtime["scheduler"]
+        print(f"Judge requests: {scheduler.stats['requests']}, retries: {scheduler.stats['retries']}, "
+              f"rate limited: {scheduler.stats['rate_limited']}, final concurrency: {int(scheduler.concurrency.limit)}")
+        if scheduler.stats["prompt_tokens"]:
+            print(f"Judge tokens: prompt {scheduler.stats['prompt_tokens']} "
+                  f"(cached {scheduler.stats['cached_tokens']}, "
+                  f"{100.0 * scheduler.stats['cached_tokens'] / scheduler.stats['prompt_tokens']:.1f}%), "
+                  f"completion {scheduler.stats['completion_tokens']}")
+        if scheduler.hedger is not None:
+            print(scheduler.hedger.report())
+        if cfg["output_mode"] == "json":
+            print(f"Structured output: {scheduler.stats['truncated']} truncated, "
+                  f"{scheduler.stats['parse_failures']} unparseable responses (retried; see failures.jsonl)")
+        elif scheduler.stats["parse_failures"]:
+            print(f"Judge outputs: {scheduler.stats['parse_failures']} without parseable scores (retried or skipped)")
+        metrics = progress.summary()
+        if cfg.get("max_samples", 1) > 1:
+            sampled = metrics["judge_samples"]
+            print(f"Self-consistency: {sampled['outputs']} judge outputs, {sampled['multi_sampled']} sequences multi-sampled, "
+                  f"{sampled['escalated']} escalated beyond --samples")
+        if runtime["cache"] is not None:
+            metrics["judge_cache"] = dict(runtime["cache"].stats)
+        metrics_name = f"run_metrics.{cfg['worker_id']}.json" if cfg.get("work_queue") else "run_metrics.json"
+        metrics_path = os.path.join(cfg["output_dir"], metrics_name)
+        with open(metrics_path, 'w', encoding='utf-8') as f:
+            json.dump({**metrics, "timestamp": datetime.now().isoformat()}, f, ensure_ascii=False, indent=2)
+        cost = f"${metrics['cost_usd']:.4f}" + (f" ({metrics['unpriced_sequences']} unpriced)" if metrics["unpriced_sequences"] else "")
+        print(f"Run: {metrics['sequences']['succeeded']} succeeded, {metrics['sequences']['failed']} failed in "
+              f"{format_duration(metrics['wall_time_s'])} ({metrics['throughput_seq_per_s'] or 0:.2f} seq/s), cost {cost}")
+        print(f"Run metrics saved to: {metrics_path}")
+
+# 分析用的列
+DIMENSION_COLUMNS = {
+    "consistency": "consistency_score",
+    "aesthetic": "aesthetic_score",
+    "physicality": "physicality_score",
+    "overall": "overall_score"
+}
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+def build_score_table(all_scores: List[Dict]) -> Dict[str, np.ndarray]:
+    """Load score records into a columnar table (one NumPy array per field).
+
+    Missing composite scores are 0 (as in calculate_comprehensive_scores);
+    missing sub-dimension scores are NaN so they do not bias the statistics.
+    """
+    label_columns = ["index", "category", "process_type", "overall_grade"]
+    value_columns = list(DIMENSION_COLUMNS.values()) + SUB_DIMENSIONS
+    try:
+        # 快速路径：记录字段齐全时用 C 实现的 itemgetter 一次取出所有列
+        labels = list(map(operator.itemgetter(*label_columns), all_scores))
+        values = list(map(operator.itemgetter(*value_columns), all_scores))
+    except KeyError:
+        labels = [(s["index"], s.get("category", ""), s.get("process_type", ""), s.get("overall_grade", "")) for s in all_scores]
+        values = [[s.get(c, 0) for c in DIMENSION_COLUMNS.values()] + [s.get(c, np.nan) for c in SUB_DIMENSIONS] for s in all_scores]
+    labels = np.array(labels, dtype=object).reshape(len(all_scores), len(label_columns))
+    values = np.array(values, dtype=float).reshape(len(all_scores), len(value_columns))
+    table = {name: labels[:, j] for j, name in enumerate(label_columns)}
+    table.update({name: values[:, j] for j, name in enumerate(value_columns)})
+    return table
+
+def column_stats(values: np.ndarray) -> List[Dict]:
+    """Statistics of every column of a (rows x columns) block, computed column-wise in one pass."""
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    # nan* 归约明显更慢，只在确有缺失值时使用
+    has_nan = not valid.all()
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(values, axis=0) if has_nan else values.mean(axis=0)
+        std = np.nanstd(values, axis=0, ddof=1) if has_nan else values.std(axis=0, ddof=1)
+        std = np.where(count > 1, std, 0.0)
+        quantiles = np.nanquantile(values, QUANTILES, axis=0) if has_nan else np.quantile(values, QUANTILES, axis=0)
+        minimum = np.nanmin(values, axis=0) if has_nan else values.min(axis=0, initial=np.inf)
+        maximum = np.nanmax(values, axis=0) if has_nan else values.max(axis=0, initial=-np.inf)
+        pass_3 = (values >= 3).sum(axis=0) / count
+        pass_4 = (values >= 4).sum(axis=0) / count
+    stats = []
+    for j in range(values.shape[1]):
+        if count[j] == 0:
+            stats.append({"count": 0})
+            continue
+        stats.append({
+            "count": int(count[j]),
+            "mean": round(float(mean[j]), 2),
+            "max": round(float(maximum[j]), 2),
+            "min": round(float(minimum[j]), 2),
+            "std": round(float(std[j]), 2),
+            **{f"p{int(q * 100)}": round(float(quantiles[i, j]), 2) for i, q in enumerate(QUANTILES)},
+            "pass_rate_3": round(float(pass_3[j]), 2),
+            "pass_rate_4": round(float(pass_4[j]), 2)
+        })
+    return stats
+
+def grouped_stats(table: Dict[str, np.ndarray], key: str, columns: List[str]) -> Dict[str, Dict]:
+    """Per-group statistics: one stable sort by group, then column-wise stats per contiguous block."""
+    values = np.column_stack([table[c] for c in columns])
+    groups, codes = np.unique(table[key].astype(str), return_inverse=True)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    result = {}
+    for group, rows in zip(groups, np.split(order, bounds)):
+        stats = column_stats(values[rows])
+        result[str(group)] = {"count": int(len(rows)), **{c: st for c, st in zip(columns, stats)}}
+    return result
+
+def select_extreme(scores: np.ndarray, k: int, largest: bool = True) -> np.ndarray:
+    """Positions of the k largest (or smallest) scores via partial selection.
+
+    Matches a stable descending sort: ties keep dataset order, and the
+    bottom-k is listed from highest to lowest like sorted(...)[-k:].
+    """
+    k = min(k, len(scores))
+    if k == 0:
+        return np.array([], dtype=int)
+    positions = np.arange(len(scores))
+    key = -scores if largest else scores
+    kth = np.partition(key, k - 1)[k - 1]
+    strict = np.flatnonzero(key < kth)
+    ties = np.flatnonzero(key == kth)
+    ties = ties[:k - len(strict)] if largest else ties[::-1][:k - len(strict)]
+    selected = np.concatenate([strict, ties])
+    # 按（分数降序，数据集顺序）排列
+    return selected[np.lexsort((positions[selected], -scores[selected]))]
+
+def analyze_comprehensive_results(all_scores: List[Dict], dimension_weights: Dict = None) -> Dict:
+    """分析综合评分结果"""
+    dimension_weights = dimension_weights or DIMENSION_WEIGHTS
+    
+    if not all_scores:
+        return {}
+    
+    table = build_score_table(all_scores)
+    overall_scores = table["overall_score"]
+    dimension_columns = list(DIMENSION_COLUMNS.values())
+    
+    analysis = {
+        "dimension_performance": {},
+        "sub_dimension_performance": {},
+        "by_category": grouped_stats(table, "category", dimension_columns + SUB_DIMENSIONS),
+        "by_process_type": grouped_stats(table, "process_type", dimension_columns + SUB_DIMENSIONS),
+        "score_distribution": {},
+        "ranking": {},
+        "summary": {}
+    }
+    
+    # 维度性能分析
+    stats = column_stats(np.column_stack([table[c] for c in dimension_columns + SUB_DIMENSIONS]))
+    for dim_name, st in zip(DIMENSION_COLUMNS, stats):
+        analysis["dimension_performance"][dim_name] = st
+    for dim_name, st in zip(SUB_DIMENSIONS, stats[len(DIMENSION_COLUMNS):]):
+        analysis["sub_dimension_performance"][dim_name] = st
+    
+    # 等级分布
+    grades, counts = np.unique(table["overall_grade"].astype(str), return_counts=True)
+    analysis["score_distribution"] = {str(g): int(c) for g, c in zip(grades, counts)}
+    
+    # Top/Bottom 5（部分选择，无需全排序）
+    top = select_extreme(overall_scores, 5, largest=True)
+    bottom = select_extreme(overall_scores, 5, largest=False)
+    analysis["ranking"] = {
+        "top_5": [{"index": all_scores[i]["index"], "score": all_scores[i]["overall_score"]} for i in top],
+        "bottom_5": [{"index": all_scores[i]["index"], "score": all_scores[i]["overall_score"]} for i in bottom]
+    }
+    
+    # 总体统计
+    analysis["summary"] = {
+        "total_sequences": len(all_scores),
+        "weight_ratio": "Consistency:Physicality:Aesthetic = " + ":".join(
+            f"{dimension_weights[dim] * 10:g}" for dim in ("consistency", "physicality", "aesthetic")
+        ),
+        "average_overall_score": round(float(overall_scores.mean()), 2),
+        "excellent_sequences": int((overall_scores >= 4.5).sum()),
+        "good_sequences": int(((overall_scores >= 3.5) & (overall_scores < 4.5)).sum()),
+        "fair_sequences": int(((overall_scores >= 3.0) & (overall_scores < 3.5)).sum()),
+        "poor_sequences": int((overall_scores < 3.0).sum())
+    }
+    
+    return analysis
+
+def save_results(data, filename: str, cfg: Dict) -> int:
+    """Save results to file (atomically, via a temp file + rename).
+
+    data may be any iterable; records are written one at a time, so a
+    generator is never materialized. Returns the number of records written.
+    """
+    path = os.path.join(cfg["output_dir"], filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    
+    count = 0
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if filename.endswith('.jsonl'):
+                for item in data:
+                    f.write(json.dumps(item, ensure_ascii=False) + '\n')
+                    count += 1
+            else:
+                # 逐条写出，与 json.dump(data, indent=2) 的输出一致
+                for item in data:
+                    f.write("[\n  " if count == 0 else ",\n  ")
+                    f.write(json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+                    count += 1
+                f.write("\n]" if count else "[]")
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    print(f"[SAVE] {path} - {count} records")
+    return count
+
+class UnsortedRecordsError(Exception):
+    """A result stream that should be sorted by index is not."""
+
+def merge_sorted_records(sources: List):
+    """Lazily merge index-sorted record streams; on duplicate indices the later source wins."""
+    def tagged(priority, records):
+        last = None
+        for seq_no, rec in enumerate(records):
+            if last is not None and rec["index"] < last:
+                raise UnsortedRecordsError(f"records out of order at index {rec['index']}")
+            last = rec["index"]
+            yield rec["index"], -priority, seq_no, rec
+
+    previous = None
+    for index, _, _, rec in heapq.merge(*(tagged(p, src) for p, src in enumerate(sources))):
+        if index != previous:
+            previous = index
+            yield rec
+
+def save_merged_full(source_factories: List, filename: str, cfg: Dict) -> int:
+    """Write the full-results file as a streaming merge of index-sorted sources.
+
+    source_factories are callables returning record iterables (later ones win).
+    Falls back to sorting in memory if a source turns out to be unsorted.
+    """
+    try:
+        return save_results(merge_sorted_records([make() for make in source_factories]), filename, cfg)
+    except UnsortedRecordsError as e:
+        print(f"[WARN] {e}; sorting full results in memory")
+        merged = {}
+        for make in source_factories:
+            for rec in make():
+                merged[rec["index"]] = rec
+        return save_results((merged[k] for k in sorted(merged)), filename, cfg)
+
+def iter_existing_full(path: str):
+    if os.path.isfile(path) and os.path.getsize(path) > 0:
+        yield from iter_full_records(path)
+
+def load_run_state(cfg: Dict) -> Dict:
+    """Load existing results (compacted files first, then replay the journal on top).
+
+    Done indices come from the lightweight scores file only. The full-results
+    file is never loaded: state["full"] holds just the records finished since
+    the last compaction, which compact_results merges into the existing file.
+    """
+    exist_scores = load_jsonl(os.path.join(cfg["output_dir"], cfg["result_files"]["scores"]))
+    exist_failures = load_jsonl(os.path.join(cfg["output_dir"], cfg["result_files"]["failures"]))
+    journal_path = os.path.join(cfg["output_dir"], cfg["journal"])
+    journal_full, journal_scores, journal_failures = replay_journal(journal_path)
+    if journal_scores or journal_failures:
+        print(f"Recovered {len(journal_scores)} sequences ({len(journal_failures)} failures) from journal {journal_path}")
+    exist_scores.update(journal_scores)
+    exist_failures.update(journal_failures)
+    return {"full": journal_full, "scores": exist_scores, "failures": exist_failures, "journal_path": journal_path}
+
+def queue_sequences(sequences, state: Dict, cfg: Dict, image_index: ImageIndex) -> List[Tuple[str, Dict, Dict[int, str]]]:
+    """Select the sequences that still need judging and whose images are all present.
+
+    sequences is any iterable of sequence dicts (e.g. the lazy iter_sequences).
+    """
+    done_indices = set(state["scores"].keys())
+    print(f"Found {len(done_indices)} already evaluated sequences")
+    if cfg["retry_failed"]:
+        print(f"Retrying {len(set(state['failures']) - done_indices)} previously failed sequences only")
+
+    tasks = []
+    scanned = 0
+    for sequence_data in sequences:
+        index = sequence_data["index"]
+        scanned += 1
+        if index in done_indices:
+            print(f"[SKIP] Sequence {index}: Already evaluated")
+            continue
+        if cfg["retry_failed"] and index not in state["failures"]:
+            continue
+        
+        # Check if all images exist
+        steps = [prompt["step"] for prompt in sequence_data["prompts"]]
+        image_paths = find_image_paths(index, cfg["image_dir"], steps, image_index)
+        
+        if len(image_paths) == len(steps):
+            tasks.append((index, sequence_data, image_paths))
+            print(f"[QUEUE] Sequence {index}: Ready for evaluation")
+        else:
+            print(f"[SKIP] Sequence {index}: Missing images ({len(image_paths)}/{len(steps)})")
+
+    print(f"Prepared {len(tasks)} of {scanned} sequences for evaluation")
+    return tasks
+
+# 分层抽样的分层键与运行估计的列
+STRATUM_FIELDS = ("category", "process_type")
+ESTIMATE_COLUMNS = ["overall_score", "consistency_score", "physicality_score", "aesthetic_score"]
+
+def stratum_of(record: Dict) -> str:
+    return "/".join(str(record.get(field, "")) for field in STRATUM_FIELDS)
+
+def stratified_order(tasks: List[Tuple]) -> List[Tuple]:
+    """Interleave tasks across category/process_type strata in proportion to stratum size.
+
+    Within a stratum the order is a stable hash shuffle, so every prefix of
+    the result is close to a proportionally allocated stratified random sample.
+    """
+    strata = {}
+    for task in tasks:
+        strata.setdefault(stratum_of(task[1]), []).append(task)
+    keyed = []
+    for name, members in strata.items():
+        members.sort(key=lambda task: hashlib.sha1(str(task[0]).encode("utf-8")).digest())
+        keyed.extend(((rank + 0.5) / len(members), name, task) for rank, task in enumerate(members))
+    keyed.sort(key=lambda item: item[:2])
+    return [task for _, _, task in keyed]
+
+class RunningEstimate:
+    """Running means and confidence intervals of the composite scores as results arrive.
+
+    Once every stratum has two results, the estimate is stratified: strata are
+    weighted by their population share, with a finite-population correction.
+    Before that it is the plain sample mean (also with the correction).
+    """
+
+    def __init__(self, population: Dict[str, int], level: float = 0.95):
+        self.population = population
+        self.total = sum(population.values())
+        self.level = level
+        self.z = NormalDist().inv_cdf(0.5 + level / 2)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def add(self, score_record: Dict):
+        with self.lock:
+            stratum = self.values.setdefault(stratum_of(score_record), {column: [] for column in ESTIMATE_COLUMNS})
+            for column in ESTIMATE_COLUMNS:
+                stratum[column].append(score_record[column])
+
+    @property
+    def n(self) -> int:
+        return sum(len(stratum["overall_score"]) for stratum in self.values.values())
+
+    def estimate(self, column: str = "overall_score") -> Optional[Dict]:
+        with self.lock:
+            n = self.n
+            if n < 2:
+                return None
+            samples = {name: np.array(stratum[column], dtype=float) for name, stratum in self.values.items()}
+            if all(len(samples.get(name, ())) >= 2 for name, size in self.population.items() if size):
+                method = "stratified"
+                mean = variance = 0.0
+                for name, size in self.population.items():
+                    if not size:
+                        continue
+                    values, weight = samples[name], size / self.total
+                    mean += weight * values.mean()
+                    variance += weight ** 2 * max(0.0, 1 - len(values) / size) * values.var(ddof=1) / len(values)
+            else:
+                method = "simple"
+                values = np.concatenate(list(samples.values()))
+                mean = values.mean()
+                variance = max(0.0, 1 - n / max(self.total, n)) * values.var(ddof=1) / n
+        half_width = self.z * float(np.sqrt(variance))
+        return {
+            "mean": round(float(mean), 4),
+            "low": round(float(mean) - half_width, 4),
+            "high": round(float(mean) + half_width, 4),
+            "width": round(2 * half_width, 4),
+            "n": n,
+            "method": method
+        }
+
+    def converged(self, target_width: float, min_sequences: int) -> bool:
+        if self.n < min_sequences:
+            return False
+        overall = self.estimate()
+        return overall is not None and overall["width"] <= target_width
+
+    def brief(self) -> str:
+        overall = self.estimate()
+        if overall is None:
+            return "overall --"
+        return f"overall {overall['mean']:.2f} ±{overall['width'] / 2:.2f}"
+
+    def summary(self) -> Dict:
+        return {
+            "level": self.level,
+            "population": self.total,
+            "estimates": {column: self.estimate(column) for column in ESTIMATE_COLUMNS},
+            "strata": {
+                name: {"population": size, "judged": len(self.values.get(name, {}).get("overall_score", []))}
+                for name, size in sorted(self.population.items())
+            }
+        }
+
+def stop_at_target_ci(jobs, estimate: RunningEstimate, cfg: Dict, runtime: Dict):
+    """Job source wrapper that stops handing out jobs once the overall-score CI is narrow enough."""
+    remaining = None
+    for job in jobs:
+        if job is not None and estimate.converged(cfg["target_ci"], cfg["ci_min_sequences"]):
+            remaining = job
+            break
+        yield job
+    if remaining is not None:
+        overall = estimate.estimate()
+        log_event(runtime, f"[CI] Overall-score CI width {overall['width']:.3f} <= {cfg['target_ci']} after "
+                           f"{overall['n']} sequences; not submitting further judgments")
+        runtime["stopped_early"] = True
+
+def write_running_estimate(estimate: RunningEstimate, stopped_early: bool, cfg: Dict):
+    """Write running_estimate.json and print the composite-score intervals."""
+    summary = {**estimate.summary(), "target_ci": cfg["target_ci"], "stopped_early": stopped_early,
+               "timestamp": datetime.now().isoformat()}
+    path = os.path.join(cfg["output_dir"], "running_estimate.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    for column, est in summary["estimates"].items():
+        if est is not None:
+            print(f"[CI] {column}: {est['mean']:.3f} [{est['low']:.3f}, {est['high']:.3f}] "
+                  f"({int(estimate.level * 100)}% CI, n={est['n']}, {est['method']})")
+    print(f"Running estimate saved to: {path}")
+
+def record_result(state: Dict, journal, index: str, result, progress: RunTelemetry = None):
+    """Journal a finished sequence (success or failure) and fold it into the run state."""
+    if isinstance(result, tuple):
+        full_rec, score_rec = result
+        append_journal(journal, {"index": index, "full": full_rec, "scores": score_rec})
+        state["full"][index] = full_rec
+        state["scores"][index] = score_rec
+        state["failures"].pop(index, None)
+        if progress is None:
+            print(f"[SUCCESS] Completed evaluation for sequence {index}")
+    else:
+        append_journal(journal, {"index": index, "failure": result})
+        state["failures"][index] = result
+        if progress is None:
+            print(f"[FAILED] Evaluation failed for sequence {index}: {result['error_type']}")
+    if progress is not None:
+        progress.update(index, result)
+
+def compare_judges(records: List[Dict]) -> Dict:
+    """Agreement of triage and strong judge on records scored by both."""
+    result = {"n": len(records), "dimensions": {}}
+    if not records:
+        return result
+    for column in SUB_DIMENSIONS + ["overall_score"]:
+        pairs = np.array([(r["triage"][column], r[column]) for r in records if column in r["triage"] and column in r], dtype=float)
+        if not len(pairs):
+            continue
+        diff = pairs[:, 1] - pairs[:, 0]
+        corr = None
+        if len(pairs) > 1 and pairs.std(axis=0).all():
+            corr = round(float(np.corrcoef(pairs[:, 0], pairs[:, 1])[0, 1]), 4)
+        result["dimensions"][column] = {
+            "n": len(pairs),
+            "mean_triage": round(float(pairs[:, 0].mean()), 4),
+            "mean_strong": round(float(pairs[:, 1].mean()), 4),
+            "bias": round(float(diff.mean()), 4),
+            "mae": round(float(np.abs(diff).mean()), 4),
+            "pearson_r": corr
+        }
+    confusion = {}
+    for r in records:
+        row = confusion.setdefault(r["triage"]["overall_grade"], {})
+        row[r["overall_grade"]] = row.get(r["overall_grade"], 0) + 1
+    result["grade_agreement"] = round(sum(r["triage"]["overall_grade"] == r["overall_grade"] for r in records) / len(records), 4)
+    result["grade_confusion"] = confusion
+    return result
+
+def write_triage_calibration(score_sorted: List[Dict], cfg: Dict):
+    """Write triage_calibration.json: cascade counts and judge agreement on the escalated overlap.
+
+    The "audit" block only uses the --triage_audit sample, which is drawn
+    independently of the triage scores and therefore not biased towards
+    borderline sequences.
+    """
+    triaged = [r for r in score_sorted if "judge_model" in r]
+    if not triaged:
+        return
+    overlap = [r for r in triaged if "triage" in r]
+    reasons = {}
+    for r in triaged:
+        reasons[r["triage_reason"] or "settled"] = reasons.get(r["triage_reason"] or "settled", 0) + 1
+    report = {
+        "sequences": len(triaged),
+        "settled_by_triage": reasons.get("settled", 0),
+        "escalated": {k: v for k, v in reasons.items() if k != "settled"},
+        "overlap": compare_judges(overlap),
+        "audit": compare_judges([r for r in overlap if r["triage_reason"] == "audit"]),
+        "timestamp": datetime.now().isoformat()
+    }
+    path = os.path.join(cfg["output_dir"], "triage_calibration.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    overall = report["overlap"]["dimensions"].get("overall_score", {})
+    print(f"Triage: {report['settled_by_triage']}/{len(triaged)} settled by the triage judge, escalated {report['escalated']}; "
+          f"overlap n={len(overlap)}, overall bias {overall.get('bias')}, MAE {overall.get('mae')}, "
+          f"grade agreement {report['overlap'].get('grade_agreement')}")
+    print(f"Triage calibration saved to: {path}")
+
+def write_analysis_report(score_sorted: List[Dict], cfg: Dict):
+    """Write analysis_report.json for the score records and print the summary."""
+    analysis = analyze_comprehensive_results(score_sorted)
+    analysis_path = os.path.join(cfg["output_dir"], "analysis_report.json")
+    with open(analysis_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "analysis": analysis,
+            "timestamp": datetime.now().isoformat(),
+            "total_sequences": len(score_sorted)
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Analysis report saved to: {analysis_path}")
+    
+    # 打印简要报告
+    print("\n=== EVALUATION SUMMARY ===")
+    print(f"Total sequences evaluated: {analysis['summary']['total_sequences']}")
+    print(f"Overall average score: {analysis['summary']['average_overall_score']}")
+    print(f"Weight ratio: {analysis['summary']['weight_ratio']}")
+    print(f"Excellent sequences (≥4.5): {analysis['summary']['excellent_sequences']}")
+    print(f"Good sequences (3.5-4.5): {analysis['summary']['good_sequences']}")
+    print(f"Fair sequences (3.0-3.5): {analysis['summary']['fair_sequences']}")
+    print(f"Poor sequences (<3.0): {analysis['summary']['poor_sequences']}")
+    write_triage_calibration(score_sorted, cfg)
+
+def compact_results(state: Dict, cfg: Dict):
+    """Fold journal state into the sorted full/scores/failures files and the analysis report.
+
+    New full records are stream-merged into the existing full-results file.
+    The journal is only cleared after all result files have been replaced, so
+    a crash at any point here loses nothing.
+    """
+    new_full, exist_scores, exist_failures = state["full"], state["scores"], state["failures"]
+    score_sorted = [exist_scores[k] for k in sorted(exist_scores.keys())]
+    failure_sorted = [exist_failures[k] for k in sorted(exist_failures.keys()) if k not in exist_scores]
+
+    full_path = os.path.join(cfg["output_dir"], cfg["result_files"]["full"])
+    total_full = save_merged_full([
+        lambda: iter_existing_full(full_path),
+        lambda: (new_full[k] for k in sorted(new_full))
+    ], cfg["result_files"]["full"], cfg)
     save_results(score_sorted, cfg["result_files"]["scores"], cfg)
+    failures_path = os.path.join(cfg["output_dir"], cfg["result_files"]["failures"])
+    if failure_sorted:
+        save_results(failure_sorted, cfg["result_files"]["failures"], cfg)
+    elif os.path.isfile(failures_path):
+        os.remove(failures_path)
+
+    journal_path = os.path.join(cfg["output_dir"], cfg["journal"])
+    if os.path.isfile(journal_path):
+        os.remove(journal_path)
 
     # 生成分析报告
     if score_sorted:
-        analysis = analyze_comprehensive_results(score_sorted)
-        analysis_path = os.path.join(cfg["output_dir"], "analysis_report.json")
-        with open(analysis_path, 'w', encoding='utf-8') as f:
+        write_analysis_report(score_sorted, cfg)
+
+    print(f"Evaluation completed. Total sequences: {total_full}")
+
+    remaining_failures = {k: v for k, v in exist_failures.items() if k not in exist_scores}
+    if remaining_failures:
+        by_type = {}
+        for failure in remaining_failures.values():
+            by_type[failure["error_type"]] = by_type.get(failure["error_type"], 0) + 1
+        print(f"Failed sequences: {len(remaining_failures)} {by_type} (re-run with --retry_failed)")
+
+def merge_shards(cfg: Dict):
+    """Combine per-shard output directories (--shard runs) into one result set and a fresh analysis.
+
+    Unfinished shard journals are included. Full-results files are merged as
+    sorted streams, so they are never loaded into memory as a whole.
+    """
+    shard_dirs = sorted({d for pattern in cfg["merge"] for d in (glob.glob(pattern) or [pattern])})
+    scores, failures, full_sources = {}, {}, []
+    for shard_dir in shard_dirs:
+        if not os.path.isdir(shard_dir):
+            print(f"[WARN] Skipping missing shard directory {shard_dir}")
+            continue
+        state = load_run_state({**cfg, "output_dir": shard_dir})
+        duplicates = set(scores) & set(state["scores"])
+        if duplicates:
+            print(f"[WARN] {len(duplicates)} sequences appear in more than one shard; keeping {shard_dir}")
+        scores.update(state["scores"])
+        failures.update(state["failures"])
+        full_path = os.path.join(shard_dir, cfg["result_files"]["full"])
+        shard_full = state["full"]
+        full_sources.append(lambda path=full_path: iter_existing_full(path))
+        full_sources.append(lambda records=shard_full: (records[k] for k in sorted(records)))
+        print(f"[MERGE] {shard_dir}: {len(state['scores'])} scored, {len(state['failures'])} failures")
+
+    os.makedirs(cfg["output_dir"], exist_ok=True)
+    total_full = save_merged_full(full_sources, cfg["result_files"]["full"], cfg)
+    score_sorted = [scores[k] for k in sorted(scores)]
+    save_results(score_sorted, cfg["result_files"]["scores"], cfg)
+    failure_sorted = [failures[k] for k in sorted(failures) if k not in scores]
+    if failure_sorted:
+        save_results(failure_sorted, cfg["result_files"]["failures"], cfg)
+    if score_sorted:
+        write_analysis_report(score_sorted, cfg)
+    print(f"Merged {len(shard_dirs)} shards: {total_full} full records, {len(score_sorted)} scores, {len(failure_sorted)} failures")
+
+class WorkQueue:
+    """Shared SQLite work queue so several eval.py workers can cooperate on one --output_dir.
+
+    Every sequence is a row in tasks (pending -> leased -> done/failed). A
+    worker claims one row at a time with a lease that a heartbeat thread
+    renews; rows whose lease expired (crashed or stalled worker) are claimed
+    again. A result is committed in the same UPDATE that finishes its row, as
+    a journal-style entry, so nothing is lost and nothing is judged twice
+    unless a lease runs out mid-request. The file must live on storage with
+    working POSIX locks (SQLite over NFS without locking is not safe).
+    """
+
+    def __init__(self, path: str, worker_id: str, lease_seconds: float = 120):
+        self.path = path
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.held = set()
+        self.stats = {"claimed": 0, "reclaimed": 0, "completed": 0, "late": 0}
+        self.lock = threading.RLock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # 自动提交模式，事务全部显式 BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, timeout=600, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "idx TEXT PRIMARY KEY, status TEXT, worker TEXT, lease_expires REAL, attempts INTEGER, "
+            "result TEXT, finished REAL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.stop = threading.Event()
+        self.heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        self.heartbeat.start()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def seed(self, indices: List[str], reset_failed: bool = False):
+        """Add sequences that are not in the queue yet; with reset_failed, re-open failed ones."""
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (idx, status, attempts) VALUES (?, 'pending', 0)",
+                [(index,) for index in indices]
+            )
+            if reset_failed:
+                conn.executemany(
+                    "UPDATE tasks SET status = 'pending', result = NULL WHERE idx = ? AND status = 'failed'",
+                    [(index,) for index in indices]
+                )
+
+    def claim(self, skip: set = frozenset()) -> Optional[str]:
+        """Lease the next pending (or expired) sequence to this worker; None if there is none."""
+        now = time.time()
+        with self.transaction() as conn:
+            rows = conn.execute(
+                "SELECT idx, status FROM tasks WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY attempts, idx LIMIT ?", (now, len(skip) + 1)
+            ).fetchall()
+            row = next((r for r in rows if r[0] not in skip), None)
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE idx = ?",
+                (self.worker_id, now + self.lease_seconds, row[0])
+            )
+        self.held.add(row[0])
+        self.stats["claimed"] += 1
+        if row[1] == "leased":
+            self.stats["reclaimed"] += 1
+        return row[0]
+
+    def release(self, index: str):
+        """Hand a claimed sequence back without a result."""
+        self.held.discard(index)
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = 'pending', worker = NULL, lease_expires = NULL WHERE idx = ? AND worker = ?",
+                (index, self.worker_id)
+            )
+
+    def complete(self, index: str, entry: Dict):
+        """Commit a journal-style entry ({"full", "scores"} or {"failure"}) and finish the row.
+
+        A success is kept even if the lease was lost in the meantime; nothing
+        overwrites a row that is already done.
+        """
+        self.held.discard(index)
+        status = "failed" if "failure" in entry else "done"
+        with self.transaction() as conn:
+            row = conn.execute("SELECT worker FROM tasks WHERE idx = ?", (index,)).fetchone()
+            cur = conn.execute(
+                "UPDATE tasks SET status = ?, result = ?, worker = ?, lease_expires = NULL, finished = ? "
+                "WHERE idx = ? AND status != 'done'",
+                (status, json.dumps(entry, ensure_ascii=False), self.worker_id, time.time(), index)
+            )
+        self.stats["completed"] += cur.rowcount
+        if row is not None and row[0] != self.worker_id:
+            self.stats["late"] += 1
+
+    def outstanding(self, skip: set = frozenset()) -> int:
+        """Number of pending or leased sequences, not counting pending ones in skip."""
+        with self.lock:
+            count = self.conn.execute("SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'leased')").fetchone()[0]
+            for index in skip:
+                row = self.conn.execute("SELECT status FROM tasks WHERE idx = ?", (index,)).fetchone()
+                count -= row is not None and row[0] == "pending"
+        return count
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+
+    def results(self) -> Tuple[Dict[str, Dict], Dict[str, Dict], Dict[str, Dict]]:
+        """Committed (full, scores, failures) records, in the same form as replay_journal."""
+        full, scores, failures = {}, {}, {}
+        with self.lock:
+            rows = self.conn.execute("SELECT idx, result FROM tasks WHERE status IN ('done', 'failed')").fetchall()
+        for index, blob in rows:
+            entry = json.loads(blob)
+            if "failure" in entry:
+                failures[index] = entry["failure"]
+            else:
+                full[index] = entry["full"]
+                scores[index] = entry["scores"]
+        return full, scores, failures
+
+    @contextlib.contextmanager
+    def exporting(self):
+        """Serialize the final export; yields whether results changed since the last one."""
+        with self.transaction() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'exported_at'").fetchone()
+            last_finished = conn.execute("SELECT MAX(finished) FROM tasks").fetchone()[0]
+            needed = last_finished is not None and (row is None or last_finished > float(row[0]))
+            yield needed
+            if needed:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('exported_at', ?)", (repr(last_finished),))
+
+    def _heartbeat(self):
+        while not self.stop.wait(self.lease_seconds / 3):
+            with self.transaction() as conn:
+                conn.execute(
+                    "UPDATE tasks SET lease_expires = ? WHERE worker = ? AND status = 'leased'",
+                    (time.time() + self.lease_seconds, self.worker_id)
+                )
+
+    def close(self):
+        self.stop.set()
+        self.heartbeat.join()
+        with self.lock:
+            self.conn.close()
+
+def iter_queue_jobs(queue: WorkQueue, tasks: Dict[str, Tuple[Dict, Dict[int, str]]], cfg: Dict, runtime: Dict):
+    """Job source for run_evaluation that claims sequences from the work queue one at a time.
+
+    Yields None while other workers hold the remaining leases and this worker
+    still has requests in flight; polls while it has none.
+    """
+    poll = min(5.0, cfg["lease_seconds"] / 4)
+    unknown = set()
+    while True:
+        index = queue.claim(unknown)
+        if index is not None:
+            if index in tasks:
+                seq_data, image_paths = tasks[index]
+                yield (index, index, seq_data, cfg, runtime, image_paths)
+            else:
+                # 该 worker 无法处理（数据集或图片与其他 worker 不一致）
+                log_event(runtime, f"[WARN] Sequence {index} is not runnable on this worker; releasing it")
+                queue.release(index)
+                unknown.add(index)
+            continue
+        if queue.outstanding(unknown) == 0:
+            return
+        if queue.held:
+            yield None
+        else:
+            time.sleep(poll)
+
+def export_work_queue(queue: WorkQueue, cfg: Dict):
+    """Compact the queue's committed results into the result files (once, by one worker)."""
+    with queue.exporting() as needed:
+        if not needed:
+            print("Work queue results are already exported")
+            return
+        state = load_run_state(cfg)
+        full, scores, failures = queue.results()
+        state["full"].update(full)
+        state["scores"].update(scores)
+        state["failures"].update(failures)
+        compact_results(state, cfg)
+
+def run_work_queue(queue: WorkQueue, tasks: List[Tuple[str, Dict, Dict[int, str]]], cfg: Dict, image_index: ImageIndex):
+    """Judge sequences claimed from the shared work queue; the last worker to finish exports the results."""
+    queue.seed([index for index, _, _ in tasks], reset_failed=cfg["retry_failed"])
+    print(f"[QUEUE] Worker {cfg['worker_id']} joined {queue.path}: {queue.counts()}")
+    runtime = make_runtime(cfg, image_index)
+    progress = runtime["progress"]
+
+    def on_result(index, result):
+        if isinstance(result, tuple):
+            queue.complete(index, {"index": index, "full": result[0], "scores": result[1]})
+        else:
+            queue.complete(index, {"index": index, "failure": result})
+        progress.update(index, result)
+
+    try:
+        runnable = {index: (seq_data, image_paths) for index, seq_data, image_paths in tasks}
+        run_evaluation(iter_queue_jobs(queue, runnable, cfg, runtime), cfg, on_result, runtime, total=queue.outstanding())
+    finally:
+        print(f"[QUEUE] Worker {cfg['worker_id']}: {queue.stats}, queue {queue.counts()}")
+    if queue.outstanding() == 0:
+        export_work_queue(queue, cfg)
+    else:
+        print("Other workers are still running; the last one to finish writes the result files")
+
+# 生成器写入中的临时文件后缀；存在 <图片名><后缀> 时该图片视为未写完
+WATCH_TEMP_SUFFIXES = (".tmp", ".part", ".partial", ".crdownload", ".download", "~")
+WATCH_POLL_SECONDS = 1.0
+
+def iter_watch_jobs(pending: Dict[str, Dict], watcher: ImageDirWatcher, cfg: Dict, runtime: Dict):
+    """Job source that yields a sequence as soon as all of its step images exist and are stable.
+
+    An image is stable once it is non-empty, has no temp-suffixed sibling, and
+    its size and mtime have not changed for --watch_settle seconds. Yields
+    None while waiting; stops when every sequence was handed out or none
+    became ready for --watch_idle seconds.
+    """
+    observed = {}
+    last_ready = time.monotonic()
+    next_scan = 0.0
+
+    def stable(path, now):
+        if any(watcher.index.exists(path + suffix) for suffix in WATCH_TEMP_SUFFIXES):
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        signature = (st.st_size, st.st_mtime_ns)
+        if observed.get(path, (None, None))[0] != signature:
+            observed[path] = (signature, now)
+        unchanged_for = max(now - observed[path][1], time.time() - st.st_mtime)
+        return st.st_size > 0 and unchanged_for >= cfg["watch_settle"]
+
+    while pending:
+        now = time.monotonic()
+        if now < next_scan:
+            yield None
+            continue
+        next_scan = now + WATCH_POLL_SECONDS
+        watcher.poll()
+        ready = []
+        for index, sequence_data in pending.items():
+            steps = [prompt["step"] for prompt in sequence_data["prompts"]]
+            paths = find_image_paths(index, cfg["image_dir"], steps, watcher.index, quiet=True)
+            if len(paths) == len(steps) and all(stable(path, now) for path in paths.values()):
+                ready.append((index, paths))
+        for index, paths in ready:
+            for path in paths.values():
+                observed.pop(path, None)
+            log_event(runtime, f"[WATCH] Sequence {index}: all images written, queued")
+            yield (index, index, pending.pop(index), cfg, runtime, paths)
+        if ready:
+            last_ready = now
+        elif now - last_ready >= cfg["watch_idle"]:
+            log_event(runtime, f"[WATCH] No sequence completed for {cfg['watch_idle']:g}s; "
+                               f"giving up on {len(pending)} incomplete sequences")
+            return
+        else:
+            yield None
+
+def run_watch(state: Dict, cfg: Dict, image_index: ImageIndex):
+    """Judge sequences while the generator is still writing --image_dir (--watch)."""
+    done_indices = set(state["scores"])
+    pending = {}
+    for sequence_data in iter_sequences(cfg["json_path"], cfg["shard"]):
+        index = sequence_data["index"]
+        if index in done_indices or (cfg["retry_failed"] and index not in state["failures"]):
+            continue
+        pending[index] = sequence_data
+    if not pending:
+        print("No tasks to process.")
+        return
+    watcher = ImageDirWatcher(image_index)
+    print(f"[WATCH] Watching {cfg['image_dir']} ({watcher.mode}) for {len(pending)} sequences "
+          f"({len(done_indices)} already evaluated)")
+    try:
+        with open(state["journal_path"], 'a', encoding='utf-8') as journal:
+            runtime = make_runtime(cfg, image_index)
+            run_evaluation(iter_watch_jobs(pending, watcher, cfg, runtime), cfg,
+                           lambda index, result: record_result(state, journal, index, result, runtime["progress"]),
+                           runtime, total=len(pending))
+    finally:
+        watcher.close()
+
+BATCH_DIR = "batch"
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+def batch_prepare(cfg: Dict):
+    """Write the judge requests of all pending sequences as Batch API input shards.
+
+    Each line is {"custom_id": <sequence index>, "method", "url", "body"}; a new
+    shard is started before a file would exceed --batch_max_mb or
+    --batch_max_requests. batch/batch_meta.json records the shards and the
+    resolved image paths so that --batch_ingest needs no image directory.
+    """
+    state = load_run_state(cfg)
+    image_index = ImageIndex.build(cfg["image_dir"], cfg["image_manifest"])
+    tasks = queue_sequences(iter_sequences(cfg["json_path"], cfg["shard"]), state, cfg, image_index)
+    runtime = {"image_index": image_index, "images": make_image_optimizer(cfg), "rubric": render_rubric(cfg["output_mode"])}
+
+    batch_dir = os.path.join(cfg["output_dir"], BATCH_DIR)
+    os.makedirs(batch_dir, exist_ok=True)
+    for name in os.listdir(batch_dir):
+        if name.startswith("requests_") and name.endswith(".jsonl"):
+            os.remove(os.path.join(batch_dir, name))
+    max_bytes = int(cfg["batch_max_mb"] * 1024 * 1024)
+    shards, image_paths_by_index = [], {}
+    f, shard_bytes, shard_requests = None, 0, 0
+
+    def encode(task):
+        index, sequence_data, image_paths = task
+        return index, prepare_sequence_request(index, sequence_data, cfg, runtime, image_paths=image_paths)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=cfg["max_workers"]) as executor:
+            # map 保持输入顺序，分片内容与运行无关
+            for index, prepared in executor.map(encode, tasks):
+                if prepared is None:
+                    print(f"[SKIP] Sequence {index}: could not build request")
+                    continue
+                image_paths, msgs = prepared
+                line = json.dumps({
+                    "custom_id": index,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": judge_request_params(cfg, msgs)
+                }, ensure_ascii=False) + "\n"
+                size = len(line.encode("utf-8"))
+                if size > max_bytes:
+                    print(f"[SKIP] Sequence {index}: request is {size / 1024 / 1024:.1f} MB, above --batch_max_mb")
+                    continue
+                if f is None or shard_bytes + size > max_bytes or shard_requests >= cfg["batch_max_requests"]:
+                    if f is not None:
+                        f.close()
+                    shards.append(os.path.join(batch_dir, f"requests_{len(shards):03d}.jsonl"))
+                    f = open(shards[-1], 'w', encoding='utf-8')
+                    shard_bytes, shard_requests = 0, 0
+                f.write(line)
+                shard_bytes += size
+                shard_requests += 1
+                image_paths_by_index[index] = image_paths
+    finally:
+        if f is not None:
+            f.close()
+
+    meta_path = os.path.join(batch_dir, "batch_meta.json")
+    with open(meta_path, 'w', encoding='utf-8') as mf:
+        json.dump({
+            "model": cfg["model"],
+            "output_mode": cfg["output_mode"],
+            "created": datetime.now().isoformat(),
+            "shards": [os.path.basename(p) for p in shards],
+            "image_paths": image_paths_by_index
+        }, mf, ensure_ascii=False, indent=2)
+    print(f"[BATCH] Wrote {len(image_paths_by_index)} requests in {len(shards)} shard(s) to {batch_dir}")
+
+def batch_execute_local(cfg: Dict):
+    """Local stand-in for the provider's batch endpoint.
+
+    Answers every prepared shard through the regular (rate-limited) chat
+    endpoint at --api_base and writes results_NNN.jsonl in the Batch API
+    output format, so the prepare/ingest round trip can be run without a
+    batch-capable provider.
+    """
+    batch_dir = os.path.join(cfg["output_dir"], BATCH_DIR)
+    with open(os.path.join(batch_dir, "batch_meta.json"), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    client = make_client(cfg)
+    scheduler = JudgeScheduler(cfg)
+
+    def execute(line):
+        request = json.loads(line)
+        try:
+            resp = call_judge(client, request["body"], scheduler)
+            return {
+                "id": f"batch_req_{request['custom_id']}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": resp.model_dump()},
+                "error": None
+            }
+        except Exception as e:
+            status_code = getattr(e, "status_code", None)
+            return {
+                "id": f"batch_req_{request['custom_id']}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": status_code, "body": {"error": {"message": str(e)}}} if status_code else None,
+                "error": None if status_code else {"code": classify_error(e), "message": str(e)}
+            }
+
+    for i, shard in enumerate(meta["shards"]):
+        with open(os.path.join(batch_dir, shard), 'r', encoding='utf-8') as f:
+            lines = [line for line in f if line.strip()]
+        result_path = os.path.join(batch_dir, f"results_{i:03d}.jsonl")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=cfg["max_workers"]) as executor, \
+                open(result_path, 'w', encoding='utf-8') as out:
+            for result in executor.map(execute, lines):
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        print(f"[BATCH] {shard} -> {result_path} ({len(lines)} requests)")
+
+def parse_batch_result(item: Dict, output_mode: str = "text") -> Tuple[str, Optional[str], Optional[Tuple[str, str]]]:
+    """Return (custom_id, judge text or None, (error_type, message) or None) for one Batch API output line."""
+    custom_id = str(item.get("custom_id"))
+    response = item.get("response") or {}
+    status_code = response.get("status_code")
+    if item.get("error") or not response:
+        error = item.get("error") or {}
+        return custom_id, None, ("batch_error", error.get("message") or error.get("code") or "missing response")
+    body = response.get("body") or {}
+    if status_code != 200:
+        return custom_id, None, (classify_status(status_code or 500), json.dumps(body.get("error", body), ensure_ascii=False))
+    choices = body.get("choices") or [{}]
+    content = (choices[0].get("message") or {}).get("content")
+    try:
+        check_judge_response({"content": content, "finish_reason": choices[0].get("finish_reason")}, output_mode)
+    except Exception as e:
+        return custom_id, None, (classify_error(e), str(e))
+    return custom_id, content, None
+
+def batch_ingest(cfg: Dict):
+    """Fold Batch API output files into the normal result files, journal and analysis report."""
+    sequences = load_sequences(cfg["json_path"], cfg["shard"])
+    state = load_run_state(cfg)
+
+    meta_path = os.path.join(cfg["output_dir"], BATCH_DIR, "batch_meta.json")
+    meta = {}
+    if os.path.isfile(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    image_paths_by_index = meta.get("image_paths", {})
+    output_mode = meta.get("output_mode", cfg["output_mode"])
+    image_index = ImageIndex.build(cfg["image_dir"], cfg["image_manifest"]) if cfg["image_dir"] else None
+
+    counts = {"ok": 0, "failed": 0, "unknown": 0}
+    try:
+        with open(state["journal_path"], 'a', encoding='utf-8') as journal:
+            for path in cfg["batch_ingest"]:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line_no, line in enumerate(f, 1):
+                        if not line.strip():
+                            continue
+                        try:
+                            index, eval_txt, error = parse_batch_result(json.loads(line), output_mode)
+                        except ValueError as e:
+                            print(f"[WARN] {path}:{line_no}: unreadable result line ({e})")
+                            continue
+                        sequence_data = sequences.get(index)
+                        if sequence_data is None:
+                            print(f"[WARN] {path}:{line_no}: unknown custom_id {index}")
+                            counts["unknown"] += 1
+                            continue
+                        if error is not None:
+                            record_result(state, journal, index, make_failure_record(index, error[0], error[1], 1))
+                            counts["failed"] += 1
+                            continue
+                        if index in image_paths_by_index:
+                            image_paths = {int(step): p for step, p in image_paths_by_index[index].items()}
+                        elif image_index is not None:
+                            steps = [prompt["step"] for prompt in sequence_data["prompts"]]
+                            image_paths = find_image_paths(index, cfg["image_dir"], steps, image_index)
+                        else:
+                            image_paths = {}
+                        record_result(state, journal, index, build_result_records(index, sequence_data, image_paths, eval_txt, output_mode))
+                        counts["ok"] += 1
+    finally:
+        compact_results(state, cfg)
+    print(f"[BATCH] Ingested {counts['ok']} results, {counts['failed']} failed, {counts['unknown']} unknown custom_id")
+
+def open_text(path: str):
+    """Open a text file for reading, transparently decompressing gzip files."""
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def iter_json_records(path: str, chunk_size: int = 1 << 16):
+    """Stream the objects of a JSON array or JSONL file (optionally gzip-compressed).
+
+    The JSON array is decoded incrementally, one record at a time, so large
+    files are never loaded into memory as a whole.
+    """
+    decoder = json.JSONDecoder()
+    with open_text(path) as f:
+        buf = f.read(chunk_size)
+        pos = len(buf) - len(buf.lstrip())
+        in_array = buf[pos:pos + 1] == '['
+        if in_array:
+            pos += 1
+        while True:
+            # 跳过空白和分隔符
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buf):
+                buf, pos = f.read(chunk_size), 0
+                if not buf:
+                    return
+                continue
+            if in_array and buf[pos] == ']':
+                return
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except ValueError:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    if not in_array:
+                        print(f"[WARN] Ignoring torn trailing record in {path}")
+                        return
+                    raise
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield obj
+
+def iter_full_records(path: str, chunk_size: int = 1 << 16):
+    """Stream full records from a full-results JSON array, a JSONL file or a journal."""
+    for obj in iter_json_records(path, chunk_size):
+        if "failure" in obj:  # journal entry of a failed sequence
+            continue
+        yield obj.get("full", obj)
+
+# 单张图片上限（OpenAI 视觉输入限制）与最小边长
+PREFLIGHT_MAX_IMAGE_BYTES = 20 * 1024 * 1024
+PREFLIGHT_MIN_SIDE = 64
+PREFLIGHT_ERRORS = {
+    "missing_field", "duplicate_index", "no_steps", "missing_image", "unreadable_image", "empty_image",
+    "corrupt_image", "truncated_image", "unsupported_format", "oversized_image"
+}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_IEND = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+
+def image_header_info(data: bytes) -> Tuple[str, Optional[int], Optional[int], Optional[str]]:
+    """Format, width, height and a problem description from the raw bytes of a PNG/JPEG/WebP file."""
+    if data.startswith(PNG_SIGNATURE):
+        if len(data) < 33 or data[12:16] != b"IHDR":
+            return "png", None, None, "corrupt_image"
+        width, height = struct.unpack(">II", data[16:24])
+        if zlib.crc32(data[12:29]) & 0xffffffff != struct.unpack(">I", data[29:33])[0]:
+            return "png", None, None, "corrupt_image"
+        if not data.rstrip(b"\x00").endswith(PNG_IEND):
+            return "png", width, height, "truncated_image"
+        return "png", width, height, None
+    if data.startswith(b"\xff\xd8"):
+        pos, width, height = 2, None, None
+        while pos + 4 <= len(data):
+            if data[pos] != 0xff:
+                return "jpeg", width, height, "corrupt_image"
+            marker = data[pos + 1]
+            if marker in (0xd8, 0x01) or 0xd0 <= marker <= 0xd7:
+                pos += 2
+                continue
+            length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+            # SOF0-SOF15（排除 DHT/JPG/DAC）
+            if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc) and pos + 9 <= len(data):
+                height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            if marker == 0xda:  # 扫描数据开始，之后只检查结束标记
+                break
+            pos += 2 + length
+        if width is None:
+            return "jpeg", None, None, "corrupt_image"
+        if not data.rstrip(b"\x00").endswith(b"\xff\xd9"):
+            return "jpeg", width, height, "truncated_image"
+        return "jpeg", width, height, None
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        width = height = None
+        chunk = data[12:16]
+        if chunk == b"VP8X" and len(data) >= 30:
+            width = 1 + int.from_bytes(data[24:27], "little")
+            height = 1 + int.from_bytes(data[27:30], "little")
+        elif chunk == b"VP8L" and len(data) >= 25:
+            bits = int.from_bytes(data[21:25], "little")
+            width, height = 1 + (bits & 0x3fff), 1 + ((bits >> 14) & 0x3fff)
+        elif chunk == b"VP8 " and len(data) >= 30:
+            width = int.from_bytes(data[26:28], "little") & 0x3fff
+            height = int.from_bytes(data[28:30], "little") & 0x3fff
+        if struct.unpack("<I", data[4:8])[0] + 8 > len(data):
+            return "webp", width, height, "truncated_image"
+        return "webp", width, height, None if width else "corrupt_image"
+    return "unknown", None, None, "unsupported_format"
+
+def inspect_image(path: str) -> Dict:
+    """Preflight check of one image file (runs in a worker process)."""
+    info = {"path": path, "bytes": None, "format": None, "width": None, "height": None, "sha1": None, "issue": None}
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        info["issue"], info["detail"] = "unreadable_image", str(e)
+        return info
+    info["bytes"] = len(data)
+    if not data:
+        info["issue"] = "empty_image"
+        return info
+    info["sha1"] = hashlib.sha1(data).hexdigest()
+    info["format"], info["width"], info["height"], info["issue"] = image_header_info(data)
+    if info["issue"] is None and len(data) > PREFLIGHT_MAX_IMAGE_BYTES:
+        info["issue"] = "oversized_image"
+    return info
+
+def preflight_sequence_issues(sequence_data: Dict) -> List[Dict]:
+    """Structural problems of one dataset entry."""
+    issues = []
+    for field in ("index", "category", "process_type", "prompts"):
+        if field not in sequence_data:
+            issues.append({"issue": "missing_field", "detail": field})
+    prompts = sequence_data.get("prompts") or []
+    if not prompts:
+        issues.append({"issue": "no_steps"})
+    for prompt in prompts:
+        missing = [field for field in ("step", "prompt", "explanation") if field not in prompt]
+        if missing:
+            issues.append({"issue": "missing_field", "step": prompt.get("step"), "detail": ", ".join(missing)})
+    steps = [prompt.get("step") for prompt in prompts]
+    if prompts and len(steps) != 4:
+        issues.append({"issue": "step_count", "detail": f"{len(steps)} steps, expected 4"})
+    if len(set(steps)) != len(steps):
+        issues.append({"issue": "duplicate_step", "detail": str(sorted(s for s in steps if steps.count(s) > 1))})
+    return issues
+
+def run_preflight(cfg: Dict) -> bool:
+    """Validate the dataset and image tree without calling the judge; returns True if there are no errors.
+
+    Image files are checked on a process pool: header decoding (PNG/JPEG/WebP
+    dimensions, PNG IHDR CRC), truncation (missing IEND / EOI), empty and
+    oversized files, format vs. upload MIME type, and duplicate images within
+    a sequence. The report goes to <output_dir>/preflight_report.json.
+    """
+    t0 = time.perf_counter()
+    image_index = ImageIndex.build(cfg["image_dir"], cfg["image_manifest"])
+    per_sequence, image_steps, seen = {}, {}, set()
+    sequences = 0
+    for sequence_data in iter_sequences(cfg["json_path"], cfg["shard"]):
+        sequences += 1
+        index = str(sequence_data.get("index", f"#{sequences}"))
+        issues = preflight_sequence_issues(sequence_data)
+        if index in seen:
+            # 重复条目只报告，图片已随第一条检查
+            per_sequence[index].extend(issues + [{"issue": "duplicate_index"}])
+            continue
+        seen.add(index)
+        steps = [prompt["step"] for prompt in sequence_data.get("prompts") or [] if "step" in prompt]
+        paths = find_image_paths(index, cfg["image_dir"], steps, image_index, quiet=True)
+        for step in steps:
+            if step not in paths:
+                issues.append({"issue": "missing_image", "step": step})
+        for step, path in paths.items():
+            image_steps.setdefault(path, []).append((index, step))
+        per_sequence[index] = issues
+
+    workers = cfg["preflight_workers"] or os.cpu_count() or 1
+    paths = list(image_steps)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        infos = list(pool.map(inspect_image, paths, chunksize=max(1, len(paths) // (workers * 8) or 1)))
+
+    expected_format = cfg["image_format"] if cfg["image_max_side"] else "png"
+    by_sequence = {}
+    formats, widths, heights, sizes, owners = {}, [], [], [], {}
+    for info in infos:
+        for index, step in image_steps[info["path"]]:
+            by_sequence.setdefault(index, []).append((step, info))
+        if info["issue"]:
+            for index, step in image_steps[info["path"]]:
+                per_sequence[index].append({"issue": info["issue"], "step": step, "detail": info.get("detail") or info["path"]})
+        if info["format"]:
+            formats[info["format"]] = formats.get(info["format"], 0) + 1
+        if info["width"]:
+            widths.append(info["width"])
+            heights.append(info["height"])
+        if info["bytes"] is not None:
+            sizes.append(info["bytes"])
+        if info["sha1"]:
+            owners.setdefault(info["sha1"], set()).update(index for index, _ in image_steps[info["path"]])
+
+    for index, step_infos in by_sequence.items():
+        issues = per_sequence[index]
+        hashes = {}
+        for step, info in sorted(step_infos, key=lambda item: str(item[0])):
+            if info["sha1"]:
+                hashes.setdefault(info["sha1"], []).append(step)
+            if info["format"] not in (None, "unknown") and info["format"] != expected_format and not cfg["image_max_side"]:
+                issues.append({"issue": "mime_mismatch", "step": step, "detail": f"{info['format']} file sent as image/png"})
+            if info["width"] and min(info["width"], info["height"]) < PREFLIGHT_MIN_SIDE:
+                issues.append({"issue": "small_image", "step": step, "detail": f"{info['width']}x{info['height']}"})
+        for steps in hashes.values():
+            if len(steps) > 1:
+                issues.append({"issue": "duplicate_image", "detail": f"steps {steps} are identical"})
+        sizes_seen = {(info["width"], info["height"]) for _, info in step_infos if info["width"]}
+        if len(sizes_seen) > 1:
+            issues.append({"issue": "dimension_mismatch", "detail": str(sorted(sizes_seen))})
+
+    by_issue = {}
+    for issues in per_sequence.values():
+        for issue in issues:
+            issue["severity"] = "error" if issue["issue"] in PREFLIGHT_ERRORS else "warning"
+            by_issue[issue["issue"]] = by_issue.get(issue["issue"], 0) + 1
+    errors = sum(n for issue, n in by_issue.items() if issue in PREFLIGHT_ERRORS)
+    report = {
+        "dataset": cfg["json_path"],
+        "image_dir": cfg["image_dir"],
+        "sequences": sequences,
+        "images_checked": len(infos),
+        "elapsed_s": round(time.perf_counter() - t0, 3),
+        "summary": {
+            "errors": errors,
+            "warnings": sum(by_issue.values()) - errors,
+            "sequences_with_errors": sum(any(i["severity"] == "error" for i in issues) for issues in per_sequence.values()),
+            "by_issue": by_issue
+        },
+        "images": {
+            "formats": formats,
+            "width": {"min": min(widths), "max": max(widths)} if widths else None,
+            "height": {"min": min(heights), "max": max(heights)} if heights else None,
+            "bytes": {"min": min(sizes), "max": max(sizes), "total": sum(sizes)} if sizes else None,
+            "shared_across_sequences": sum(len(indices) > 1 for indices in owners.values())
+        },
+        "issues": [{"index": index, "issues": issues} for index, issues in per_sequence.items() if issues],
+        "timestamp": datetime.now().isoformat()
+    }
+    os.makedirs(cfg["output_dir"], exist_ok=True)
+    path = os.path.join(cfg["output_dir"], "preflight_report.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[PREFLIGHT] {sequences} sequences, {len(infos)} images checked in {report['elapsed_s']}s "
+          f"({workers} processes): {errors} errors, {report['summary']['warnings']} warnings {by_issue}")
+    print(f"Preflight report saved to: {path}")
+    return errors == 0
+
+def load_weight_configs(path: str = None) -> Dict[str, Dict]:
+    """Load named weight configurations for --rescore; "default" is always included.
+
+    The file maps a name to any of "dimension_weights", "sub_dimension_weights"
+    and "grade_thresholds" (a list of [threshold, grade] pairs); missing keys
+    fall back to the module defaults.
+    """
+    configs = {"default": {}}
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            configs.update(json.load(f))
+    resolved = {}
+    for name, conf in configs.items():
+        resolved[name] = {
+            "dimension_weights": conf.get("dimension_weights", DIMENSION_WEIGHTS),
+            "sub_dimension_weights": conf.get("sub_dimension_weights", SUB_DIMENSION_WEIGHTS),
+            "grade_thresholds": [tuple(t) for t in conf.get("grade_thresholds", GRADE_THRESHOLDS)]
+        }
+    return resolved
+
+def rescore_results(cfg: Dict):
+    """Re-parse stored judge transcripts and recompute scores without calling the API."""
+    configs = load_weight_configs(cfg["rescore_configs"])
+    scores_by_config = {name: [] for name in configs}
+    comparison = []
+    parse_failures = []
+
+    total = 0
+    for record in iter_full_records(cfg["rescore"]):
+        total += 1
+        index = record["index"]
+        scores, _ = parse_evaluation(record.get("evaluation") or "", record.get("output_mode", "text"))
+        if record.get("samples"):
+            sample_scores = [parse_evaluation(txt, record.get("output_mode", "text"))[0] for txt in record["samples"]["evaluations"]]
+            scores, _, _ = aggregate_sample_scores(sample_scores, record["samples"]["aggregate"])
+        if not scores:
+            parse_failures.append(index)
+            continue
+        row = {"index": index, "category": record["category"], "process_type": record["process_type"]}
+        for name, conf in configs.items():
+            comprehensive_scores = calculate_comprehensive_scores(
+                scores, conf["dimension_weights"], conf["sub_dimension_weights"], conf["grade_thresholds"]
+            )
+            scores_by_config[name].append(make_score_record(index, record, scores, comprehensive_scores))
+            row[name] = comprehensive_scores["overall_score"]
+        comparison.append(row)
+
+    print(f"Rescored {total - len(parse_failures)}/{total} records from {cfg['rescore']} under {len(configs)} configuration(s)")
+    if parse_failures:
+        print(f"[WARN] No scores could be parsed for {len(parse_failures)} records: {parse_failures[:10]}")
+
+    rescore_dir = os.path.join(cfg["output_dir"], "rescore")
+    summary = {}
+    for name, conf in configs.items():
+        score_sorted = sorted(scores_by_config[name], key=lambda r: r["index"])
+        out_cfg = {**cfg, "output_dir": os.path.join(rescore_dir, name)}
+        save_results(score_sorted, cfg["result_files"]["scores"], out_cfg)
+        analysis = analyze_comprehensive_results(score_sorted, conf["dimension_weights"])
+        with open(os.path.join(out_cfg["output_dir"], "analysis_report.json"), 'w', encoding='utf-8') as f:
             json.dump({
                 "analysis": analysis,
+                "weights": conf,
+                "source": cfg["rescore"],
                 "timestamp": datetime.now().isoformat(),
                 "total_sequences": len(score_sorted)
             }, f, ensure_ascii=False, indent=2)
-        print(f"Analysis report saved to: {analysis_path}")
-        
-        # 打印简要报告
-        print("\n=== EVALUATION SUMMARY ===")
-        print(f"Total sequences evaluated: {analysis['summary']['total_sequences']}")
-        print(f"Overall average score: {analysis['summary']['average_overall_score']}")
-        print(f"Weight ratio: {analysis['summary']['weight_ratio']}")
-        print(f"Excellent sequences (≥4.5): {analysis['summary']['excellent_sequences']}")
-        print(f"Good sequences (3.5-4.5): {analysis['summary']['good_sequences']}")
-        print(f"Fair sequences (3.0-3.5): {analysis['summary']['fair_sequences']}")
-        print(f"Poor sequences (<3.0): {analysis['summary']['poor_sequences']}")
-
-    print(f"Evaluation completed. Total sequences: {len(full_sorted)}")
+        summary[name] = analysis.get("summary", {})
+
+    comparison.sort(key=lambda r: r["index"])
+    save_results(comparison, "comparison.jsonl", {**cfg, "output_dir": rescore_dir})
+    with open(os.path.join(rescore_dir, "comparison_summary.json"), 'w', encoding='utf-8') as f:
+        json.dump({"summary": summary, "parse_failures": parse_failures}, f, ensure_ascii=False, indent=2)
+
+    print("\n=== RESCORE SUMMARY ===")
+    for name, s in summary.items():
+        print(f"{name:>20}: average overall {s.get('average_overall_score')}, "
+              f"excellent {s.get('excellent_sequences')}, good {s.get('good_sequences')}, "
+              f"fair {s.get('fair_sequences')}, poor {s.get('poor_sequences')}")
+
+# 排行榜：领域列（匹配 category 的小写关键词）与明细列，分数按 5 分制 ×20 换算为百分制
+LEADERBOARD_DOMAINS = [
+    ("Physics", ("physics",)),
+    ("Chemistry", ("chemistry",)),
+    ("Biology", ("biology",)),
+    ("Geography", ("geography",)),
+    ("Meteorology", ("meteorology",)),
+    ("Culture", ("culture", "history"))
+]
+LEADERBOARD_DIMENSIONS = [
+    ("semantic_consistency", "Semantic Consistency", "Sem.<br>Cons."),
+    ("factual_consistency", "Factual Consistency", "Fact.<br>Cons."),
+    ("spatial_temporal_consistency", "Spatial-Temporal Consistency", "Spat.<br>Temp."),
+    ("consistency_score", "Consistency Score", "Consist.<br>Avg"),
+    ("expressiveness", "Expressiveness", "Expr."),
+    ("artistic_quality", "Artistic Quality", "Art.<br>Qual."),
+    ("authenticity", "Authenticity", "Auth."),
+    ("aesthetic_score", "Aesthetic Score", "Aesth.<br>Avg"),
+    ("physical_reliability", "Physical Reliability", "Phys.<br>Rel."),
+    ("basic_properties", "Basic Properties", "Basic<br>Prop."),
+    ("dynamics_interactivity", "Dynamics \\& Interactivity", "Dyn.<br>& Int."),
+    ("physicality_score", "Physicality Score", "Phys.<br>Avg")
+]
+LEADERBOARD_SCALE = 20
+LEADERBOARD_ROW_COLORS = ["blue!5", "yellow!8", "red!5"]
+
+def load_batch_manifest(path: str) -> List[Dict]:
+    """Load the (model name, image_dir[, group]) entries of a batch run from JSON or JSONL."""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        models = json.loads(text)
+    except ValueError:
+        models = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for model in models:
+        model.setdefault("group", "Models")
+    names = [model["name"] for model in models]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate model names in {path}")
+    return models
+
+def summarize_for_leaderboard(score_records: List[Dict]) -> Dict:
+    """Per-domain and per-dimension means of one model on the 0-100 leaderboard scale."""
+    if not score_records:
+        return {"count": 0, "domains": {}, "dimensions": {}, "overall": None}
+    table = build_score_table(score_records)
+    categories = [str(c).lower() for c in table["category"]]
+    overall = table["overall_score"]
+    domains = {}
+    for label, keys in LEADERBOARD_DOMAINS:
+        mask = np.array([any(k in c for k in keys) for c in categories])
+        domains[label] = round(float(overall[mask].mean()) * LEADERBOARD_SCALE, 2) if mask.any() else None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        dimensions = {
+            key: round(float(np.nanmean(table[key])) * LEADERBOARD_SCALE, 2) for key, _, _ in LEADERBOARD_DIMENSIONS
+        }
+    return {
+        "count": len(score_records),
+        "domains": domains,
+        "dimensions": dimensions,
+        "overall": round(float(overall.mean()) * LEADERBOARD_SCALE, 2)
+    }
+
+def write_leaderboard(models: List[Dict], output_dir: str):
+    """Regenerate leaderboard.json, the LaTeX tables (tab/benchmark*.tex layout) and HTML leaderboard tables."""
+    groups = []
+    for model in models:
+        if model["group"] not in groups:
+            groups.append(model["group"])
+
+    def fmt(value, bold=False):
+        if value is None or value != value:
+            return "--"
+        return f"\\textbf{{{value:.2f}}}" if bold else f"{value:.2f}"
+
+    def best(values):
+        values = [v for v in values if v is not None and v == v]
+        return max(values) if values else None
+
+    # Domain table: best overall is bold across all models
+    best_overall = best([m["summary"]["overall"] for m in models])
+    domain_rows = []
+    for i, group in enumerate(groups):
+        domain_rows.append(f"    \\rowcolor{{{LEADERBOARD_ROW_COLORS[i % len(LEADERBOARD_ROW_COLORS)]}}}")
+        domain_rows.append(f"    \\textbf{{{group}}} & & & & & & & \\\\")
+        for m in (m for m in models if m["group"] == group):
+            cells = [fmt(m["summary"]["domains"].get(label)) for label, _ in LEADERBOARD_DOMAINS]
+            cells.append(fmt(m["summary"]["overall"], m["summary"]["overall"] == best_overall))
+            domain_rows.append(f"    {m['name']} & " + " & ".join(cells) + " \\\\")
+        domain_rows.append("    ")
+    domain_tex = "\n".join([
+        "\\begin{table*}[htbp]",
+        "    \\centering",
+        "    \\caption{Comparing Envision Scores for T2I Models in Science and Culture Domains.}",
+        "    \\label{tab:model_comparison_comprehensive}",
+        "    \\small",
+        "    \\setlength{\\tabcolsep}{1.2mm}{",
+        "    \\begin{tabular}{lccccccc}",
+        "    \\toprule",
+        "    \\multirow{2}{*}{\\textbf{Model}} & \\multicolumn{6}{c}{\\textbf{Domain-Specific Performance}} & \\multirow{2}{*}{\\textbf{Overall}} \\\\",
+        "    \\cmidrule(lr){2-7}",
+        "     & " + " & ".join(f"\\textbf{{{label}}}" for label, _ in LEADERBOARD_DOMAINS) + " & \\\\",
+        "    \\midrule",
+        *domain_rows[:-1],
+        "    \\bottomrule",
+        "    \\end{tabular}",
+        "    }",
+        "    \\end{table*}",
+        ""
+    ])
+
+    # Detailed table: best value per column is bold within each group
+    detail_rows = []
+    for i, group in enumerate(groups):
+        members = [m for m in models if m["group"] == group]
+        group_best = {key: best([m["summary"]["dimensions"].get(key) for m in members]) for key, _, _ in LEADERBOARD_DIMENSIONS}
+        detail_rows.append(f"    \\rowcolor{{{LEADERBOARD_ROW_COLORS[i % len(LEADERBOARD_ROW_COLORS)]}}}")
+        detail_rows.append(f"    \\textbf{{{group}}}" + " &" * len(LEADERBOARD_DIMENSIONS) + " \\\\")
+        for m in members:
+            cells = [
+                fmt(m["summary"]["dimensions"].get(key), m["summary"]["dimensions"].get(key) == group_best[key] and len(members) > 1)
+                for key, _, _ in LEADERBOARD_DIMENSIONS
+            ]
+            detail_rows.append(f"    {m['name']} & " + " & ".join(cells) + "  \\\\")
+    detail_tex = "\n".join([
+        "\\begin{table*}[htbp]",
+        "    \\centering",
+        "    \\caption{Comprehensive Performance Comparison of Text-to-Image Generation Models across Multiple Evaluation Dimensions for \\textbf{Envision All Domains Average}}",
+        "    \\label{tab:model_comparison_average}",
+        "    \\resizebox{\\textwidth}{!}{",
+        f"    \\begin{{tabular}}{{l*{{{len(LEADERBOARD_DIMENSIONS)}}}{{>{{\\centering\\arraybackslash}}p{{1.5cm}}}}}}",
+        "    \\toprule",
+        f"    \\multirow{{2}}{{*}}{{\\textbf{{Model}}}} & \\multicolumn{{{len(LEADERBOARD_DIMENSIONS)}}}{{c}}{{\\textbf{{Evaluation Dimensions}}}} \\\\",
+        f"    \\cmidrule(lr){{2-{len(LEADERBOARD_DIMENSIONS) + 1}}}",
+        "     & " + " & ".join(f"{{\\footnotesize\\centering\\textbf{{{title}}}}}" for _, title, _ in LEADERBOARD_DIMENSIONS) + " \\\\",
+        "    \\midrule",
+        *detail_rows,
+        "    \\bottomrule",
+        "    \\end{tabular}",
+        "    }",
+        "    \\end{table*}",
+        ""
+    ])
+
+    # HTML tables in the layout of the leaderboard section of index.html
+    html = ['<table class="table leaderboard-table" id="domain-table">', "    <thead>", "        <tr>",
+            '            <th class="model-name">Model</th>']
+    html += [f"            <th>{label}</th>" for label, _ in LEADERBOARD_DOMAINS] + ["            <th>Overall</th>", "        </tr>", "    </thead>", "    <tbody>"]
+    for group in groups:
+        members = [m for m in models if m["group"] == group]
+        group_best = best([m["summary"]["overall"] for m in members])
+        html.append(f'        <tr><td colspan="{len(LEADERBOARD_DOMAINS) + 2}" class="category-header">{group}</td></tr>')
+        for m in members:
+            cells = "".join(f"<td>{fmt(m['summary']['domains'].get(label))}</td>" for label, _ in LEADERBOARD_DOMAINS)
+            overall_class = ' class="best-score"' if m["summary"]["overall"] == group_best else ""
+            html.append(f'        <tr><td class="model-name">{m["name"]}</td>{cells}<td{overall_class}>{fmt(m["summary"]["overall"])}</td></tr>')
+    html += ["    </tbody>", "</table>", "", '<table class="table leaderboard-table" id="detailed-table">', "    <thead>", "        <tr>",
+             '            <th class="model-name">Model</th>']
+    html += [f'            <th title="{title.replace(chr(92), "")}">{short}</th>' for _, title, short in LEADERBOARD_DIMENSIONS]
+    html += ["        </tr>", "    </thead>", "    <tbody>"]
+    for group in groups:
+        html.append(f'        <tr><td colspan="{len(LEADERBOARD_DIMENSIONS) + 1}" class="category-header">{group}</td></tr>')
+        for m in (m for m in models if m["group"] == group):
+            cells = "".join(f"<td>{fmt(m['summary']['dimensions'].get(key))}</td>" for key, _, _ in LEADERBOARD_DIMENSIONS)
+            html.append(f'        <tr><td class="model-name">{m["name"]}</td>{cells}</tr>')
+    html += ["    </tbody>", "</table>", ""]
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "leaderboard.json"), 'w', encoding='utf-8') as f:
+        json.dump([{"name": m["name"], "group": m["group"], **m["summary"]} for m in models], f, ensure_ascii=False, indent=2)
+    for filename, content in (("benchmark.tex", domain_tex), ("benchmark_all.tex", detail_tex), ("leaderboard.html", "\n".join(html))):
+        with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as f:
+            f.write(content)
+    print(f"Leaderboard tables written to {output_dir} (leaderboard.json, benchmark.tex, benchmark_all.tex, leaderboard.html)")
+
+# 显著性检验的列：总分、三个维度分与九个子维度
+COMPARE_COLUMNS = ["overall_score", "consistency_score", "physicality_score", "aesthetic_score"] + SUB_DIMENSIONS
+RESAMPLE_CHUNK = 1000
+
+def resample_chunk(scores: np.ndarray, pairs: List[Tuple[int, int]], kind: str, count: int, seed) -> List[np.ndarray]:
+    """One chunk of paired resamples for every model pair (process-pool worker).
+
+    scores is (models x sequences x columns). The same resamples are applied
+    to every pair, so the random draws are generated once per chunk.
+    "bootstrap" returns per pair the (count x columns) resampled mean
+    differences; "permutation" returns per pair and column how many random
+    sign flips give a mean difference at least as large in magnitude as the
+    observed one.
+    """
+    rng = np.random.default_rng(seed)
+    n = scores.shape[1]
+    if kind == "bootstrap":
+        # 有放回抽样 -> 每个重采样中各序列被抽中的次数，一次矩阵乘法得到全部重采样均值
+        draws = rng.integers(0, n, size=(count, n)) + (np.arange(count) * n)[:, None]
+        weights = np.bincount(draws.ravel(), minlength=count * n).reshape(count, n).astype(float)
+    else:
+        # 配对置换 = 随机交换每个序列两侧的分数，即差值随机变号；分母固定，比较和即可
+        weights = np.where(rng.random((count, n)) < 0.5, -1.0, 1.0)
+    results = []
+    for a, b in pairs:
+        diffs = scores[a] - scores[b]
+        valid = ~np.isnan(diffs)
+        diffs = np.where(valid, diffs, 0.0)
+        if kind == "bootstrap":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                results.append((weights @ diffs) / (weights @ valid.astype(float)))
+        else:
+            observed = np.abs(diffs.sum(axis=0))
+            results.append((np.abs(weights @ diffs) >= observed - 1e-9).sum(axis=0))
+    return results
+
+def holm_adjust(p_values: List[float]) -> List[float]:
+    """Holm step-down adjusted p-values."""
+    order = sorted(range(len(p_values)), key=lambda i: p_values[i])
+    adjusted, running = [0.0] * len(p_values), 0.0
+    for rank, i in enumerate(order):
+        running = max(running, min(1.0, (len(p_values) - rank) * p_values[i]))
+        adjusted[i] = running
+    return adjusted
+
+def compare_runs(runs: Dict[str, List[Dict]], cfg: Dict) -> Dict:
+    """Paired bootstrap CIs and permutation tests between every pair of runs.
+
+    Runs are aligned on the sequence indices they all scored. Resampling is
+    split into chunks of RESAMPLE_CHUNK that run on a process pool; every
+    chunk has its own seed, so results do not depend on the worker count.
+    All pairs share the same resamples.
+    """
+    names = list(runs)
+    by_index = [{record["index"]: record for record in runs[name]} for name in names]
+    common = sorted(set.intersection(*(set(records) for records in by_index)))
+    for name, records in zip(names, by_index):
+        if len(records) > len(common):
+            print(f"[WARN] {name}: {len(records) - len(common)} sequences not scored by every run are left out")
+    if len(common) < 2:
+        raise ValueError(f"Only {len(common)} sequences are scored by every run; nothing to compare")
+    matrices = {}
+    for name, records in zip(names, by_index):
+        table = build_score_table([records[index] for index in common])
+        matrices[name] = np.column_stack([table[column] for column in COMPARE_COLUMNS])
+
+    resamples, alpha = cfg["resamples"], cfg["alpha"]
+    chunks = [min(RESAMPLE_CHUNK, resamples - start) for start in range(0, resamples, RESAMPLE_CHUNK)]
+    pairs = list(itertools.combinations(range(len(names)), 2))
+    scores = np.stack([matrices[name] for name in names])
+    seeds = np.random.SeedSequence(cfg["compare_seed"]).spawn(2 * len(chunks))
+    workers = cfg["compare_workers"] or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        tasks = {
+            kind: [pool.submit(resample_chunk, scores, pairs, kind, count, seed)
+                   for count, seed in zip(chunks, seeds[k * len(chunks):(k + 1) * len(chunks)])]
+            for k, kind in enumerate(("bootstrap", "permutation"))
+        }
+        results = {kind: [future.result() for future in futures] for kind, futures in tasks.items()}
+    print(f"[COMPARE] {len(pairs)} pair(s) x {resamples} bootstrap resamples and permutations over "
+          f"{len(common)} sequences in {time.perf_counter() - t0:.2f}s ({workers} workers)")
+
+    comparisons = []
+    for p, (a, b) in enumerate(pairs):
+        diffs = scores[a] - scores[b]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mean_diff = np.nanmean(diffs, axis=0)
+            boot = np.concatenate([chunk[p] for chunk in results["bootstrap"]])
+            low, high = np.nanpercentile(boot, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+        exceed = np.sum([chunk[p] for chunk in results["permutation"]], axis=0)
+        columns = {}
+        for j, column in enumerate(COMPARE_COLUMNS):
+            n = int((~np.isnan(diffs[:, j])).sum())
+            if n == 0:
+                continue
+            columns[column] = {
+                "mean_diff": round(float(mean_diff[j]), 4),
+                "ci_low": round(float(low[j]), 4),
+                "ci_high": round(float(high[j]), 4),
+                "p_value": round(float((exceed[j] + 1) / (resamples + 1)), 5),
+                "n": n
+            }
+        comparisons.append({"a": names[a], "b": names[b], "columns": columns})
+
+    # 每列在所有模型对之间做 Holm 校正
+    for column in COMPARE_COLUMNS:
+        tested = [c["columns"][column] for c in comparisons if column in c["columns"]]
+        for stats, adjusted in zip(tested, holm_adjust([stats["p_value"] for stats in tested])):
+            stats["p_holm"] = round(adjusted, 5)
+            stats["significant"] = adjusted < alpha
+    return {
+        "models": names,
+        "sequences": len(common),
+        "resamples": resamples,
+        "alpha": alpha,
+        "seed": cfg["compare_seed"],
+        "comparisons": comparisons
+    }
+
+def write_significance(result: Dict, output_dir: str):
+    """Write significance.json and an overall-score significance matrix (significance.html) next to the leaderboard."""
+    names = result["models"]
+    cells = {}
+    for comparison in result["comparisons"]:
+        stats = comparison["columns"]["overall_score"]
+        cells[(comparison["a"], comparison["b"])] = (stats["mean_diff"], stats)
+        cells[(comparison["b"], comparison["a"])] = (-stats["mean_diff"], stats)
+
+    def cell(row, col):
+        if row == col:
+            return "--"
+        diff, stats = cells[(row, col)]
+        return f"{diff * LEADERBOARD_SCALE + 0.0:+.2f}{'*' if stats['significant'] else ''}"
+
+    # 行减列的总分差（百分制），* 表示 Holm 校正后显著
+    html = ['<table class="table leaderboard-table" id="significance-table">', "    <thead>", "        <tr>",
+            '            <th class="model-name">Model</th>']
+    html += [f"            <th>{name}</th>" for name in names] + ["        </tr>", "    </thead>", "    <tbody>"]
+    for row in names:
+        tds = []
+        for col in names:
+            better = row != col and cells[(row, col)][1]["significant"] and cells[(row, col)][0] > 0
+            css = ' class="best-score"' if better else ""
+            tds.append(f"<td{css}>{cell(row, col)}</td>")
+        html.append(f'        <tr><td class="model-name">{row}</td>{"".join(tds)}</tr>')
+    html += ["    </tbody>", "</table>", ""]
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "significance.json"), 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(output_dir, "significance.html"), 'w', encoding='utf-8') as f:
+        f.write("\n".join(html))
+
+    width = max(max(len(name) for name in names), 8) + 2
+    print(f"\nOverall-score differences, row minus column (0-100 scale, * = p_holm < {result['alpha']}):")
+    print(" " * width + "".join(f"{name:>{width}}" for name in names))
+    for row in names:
+        print(f"{row:<{width}}" + "".join(f"{cell(row, col):>{width}}" for col in names))
+    print(f"Significance tables written to {output_dir} (significance.json, significance.html)")
+
+def run_compare(cfg: Dict):
+    """Compare the score files of finished runs (NAME=PATH entries; PATH may be a run directory)."""
+    runs = {}
+    for entry in cfg["compare"]:
+        name, sep, path = entry.partition("=")
+        if not sep:
+            path = entry
+            name = os.path.basename(os.path.normpath(path if os.path.isdir(path) else os.path.dirname(os.path.abspath(path))))
+        if os.path.isdir(path):
+            path = os.path.join(path, cfg["result_files"]["scores"])
+        if name in runs:
+            raise ValueError(f"Duplicate run name {name!r}; use NAME=PATH")
+        runs[name] = list(load_jsonl(path).values())
+        print(f"Loaded {len(runs[name])} score records for {name} from {path}")
+    if len(runs) < 2:
+        raise ValueError("--compare needs at least two score files")
+    write_significance(compare_runs(runs, cfg), cfg["leaderboard_dir"] or cfg["output_dir"])
+
+def run_batch(cfg: Dict):
+    """Judge several generators in one process under one concurrency/rate budget.
+
+    The rubric and the prompt text of every sequence are rendered once and
+    shared by all models; jobs are interleaved round-robin across models so
+    every model makes progress.
+    Each model keeps its own journal and result files under output_dir/<name>.
+    """
+    models = load_batch_manifest(cfg["batch_manifest"])
+    sequences = load_sequences(cfg["json_path"], cfg["shard"])
+    if not sequences:
+        print("No sequences loaded. Exiting.")
+        return
+
+    runtime = make_runtime(cfg)
+    # 所有模型共享同一份 dict（浅拷贝进 model_runtime），排队后再填充
+    runtime["prompt_texts"] = {}
+
+    per_model_jobs = []
+    for model in models:
+        model_dir = os.path.join(cfg["output_dir"], re.sub(r"[^\w.-]+", "_", model["name"]))
+        model["cfg"] = {
+            **cfg,
+            "image_dir": model["image_dir"],
+            "output_dir": model_dir,
+            "image_manifest": os.path.join(model_dir, "image_manifest.json") if cfg["image_manifest"] else None
+        }
+        os.makedirs(model_dir, exist_ok=True)
+        print(f"\n=== {model['name']} ({model['image_dir']}) ===")
+        model["state"] = load_run_state(model["cfg"])
+        image_index = ImageIndex.build(model["image_dir"], model["cfg"]["image_manifest"])
+        model_runtime = {**runtime, "image_index": image_index}
+        tasks = queue_sequences(sequences.values(), model["state"], model["cfg"], image_index)
+        per_model_jobs.append([
+            ((model["name"], index), index, seq_data, model["cfg"], model_runtime, image_paths)
+            for index, seq_data, image_paths in tasks
+        ])
+
+    # 每个待评序列只渲染一次提示词，所有模型复用
+    for index in {job[1] for model_jobs in per_model_jobs for job in model_jobs}:
+        runtime["prompt_texts"][index] = build_sequence_text_contents(
+            sequences[index], cfg["output_mode"], cfg["prompt_layout"], runtime["rubric"]
+        )
+
+    # 轮转交错各模型的任务，保证公平
+    jobs = [job for round_jobs in itertools.zip_longest(*per_model_jobs) for job in round_jobs if job is not None]
+    print(f"\nPrepared {len(jobs)} judgments across {len(models)} models")
+
+    by_name = {model["name"]: model for model in models}
+    try:
+        if jobs:
+            with contextlib.ExitStack() as stack:
+                journals = {
+                    model["name"]: stack.enter_context(open(model["state"]["journal_path"], 'a', encoding='utf-8'))
+                    for model in models
+                }
+
+                def on_result(key, result):
+                    name, index = key
+                    record_result(by_name[name]["state"], journals[name], index, result, runtime["progress"])
+
+                run_evaluation(jobs, cfg, on_result, runtime)
+        else:
+            print("No tasks to process.")
+    finally:
+        for model in models:
+            print(f"\n=== {model['name']} ===")
+            compact_results(model["state"], model["cfg"])
+
+    for model in models:
+        scores = [model["state"]["scores"][k] for k in sorted(model["state"]["scores"])]
+        model["summary"] = summarize_for_leaderboard(scores)
+    write_leaderboard(models, cfg["leaderboard_dir"] or cfg["output_dir"])
+    scored = {model["name"]: list(model["state"]["scores"].values()) for model in models if model["state"]["scores"]}
+    if len(scored) > 1 and cfg["resamples"]:
+        write_significance(compare_runs(scored, cfg), cfg["leaderboard_dir"] or cfg["output_dir"])
+
+# --serve：分页上限、缩略图尺寸、可排序字段与 UI 静态文件目录
+SERVE_PAGE_SIZE = 50
+SERVE_MAX_PAGE_SIZE = 500
+SERVE_THUMBNAIL_SIZES = (128, 256, 512)
+SERVE_SORT_FIELDS = {"index", "overall_score", "consistency_score", "aesthetic_score", "physicality_score"}
+SERVE_STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "UI")
+SERVE_STATIC_TYPES = {".html": "text/html; charset=utf-8", ".js": "application/javascript", ".css": "text/css",
+                      ".json": "application/json", ".png": "image/png", ".jpg": "image/jpeg", ".svg": "image/svg+xml"}
+
+def index_full_records(path: str) -> Optional[Dict[str, Tuple[int, int]]]:
+    """Byte range of every record of a full-results file, by sequence index.
+
+    Understands the indent=2 JSON arrays written by save_results (one record
+    per "  {" ... "  }" block) and JSONL files. Returns None for other layouts
+    (e.g. gzip), which the caller then holds in memory.
+    """
+    if path.endswith(".gz"):
+        return None
+    offsets, pos = {}, 0
+    with open(path, 'rb') as f:
+        head = f.read(1024).lstrip()
+        f.seek(0)
+        if head[:1] == b"[":
+            start = index = None
+            for line in f:
+                stripped = line.rstrip(b"\r\n")
+                if stripped == b"  {":
+                    start, index = pos, None
+                elif start is not None and index is None and stripped.startswith(b'    "index": '):
+                    index = json.loads(stripped[len(b'    "index": '):].rstrip(b","))
+                elif start is not None and stripped.rstrip(b",") == b"  }":
+                    if index is None:
+                        return None
+                    offsets[str(index)] = (start, pos + len(stripped.rstrip(b",")) - start)
+                    start = None
+                pos += len(line)
+        else:
+            for line in f:
+                if line.strip():
+                    obj = json.loads(line)
+                    if "failure" not in obj:
+                        offsets[str(obj.get("full", obj)["index"])] = (pos, len(line))
+                pos += len(line)
+    return offsets if offsets or pos < 4 else None
+
+class ResultsStore:
+    """Read-only view of the result files of one output directory for --serve.
+
+    The score records are held in memory; full records (judge transcripts)
+    are read from their byte range on demand. Everything is reloaded when one
+    of the files changes, and the file signatures form the ETag version.
+    """
+
+    def __init__(self, cfg: Dict):
+        self.cfg = cfg
+        self.paths = {
+            "scores": os.path.join(cfg["output_dir"], cfg["result_files"]["scores"]),
+            "full": os.path.join(cfg["output_dir"], cfg["result_files"]["full"]) if cfg["result_files"]["full"] else None,
+            "analysis": os.path.join(cfg["output_dir"], "analysis_report.json")
+        }
+        self.lock = threading.Lock()
+        self.version = None
+        self.image_index = ImageIndex.build(cfg["image_dir"]) if cfg["image_dir"] else None
+        self.thumbnailers = {}
+        self.refresh()
+
+    def signature(self) -> str:
+        parts = []
+        for name, path in sorted(self.paths.items()):
+            try:
+                st = os.stat(path)
+                parts.append(f"{name}:{st.st_size}:{st.st_mtime_ns}")
+            except (OSError, TypeError):
+                parts.append(f"{name}:-")
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+    def refresh(self) -> str:
+        """Reload the files if they changed; returns the current data version."""
+        version = self.signature()
+        with self.lock:
+            if version == self.version:
+                return version
+            scores = list(load_jsonl(self.paths["scores"]).values())
+            offsets, in_memory = {}, {}
+            if self.paths["full"] and os.path.isfile(self.paths["full"]):
+                offsets = index_full_records(self.paths["full"])
+                if offsets is None:
+                    in_memory = {str(r["index"]): r for r in iter_full_records(self.paths["full"])}
+            analysis = None
+            if os.path.isfile(self.paths["analysis"]):
+                with open(self.paths["analysis"], 'r', encoding='utf-8') as f:
+                    analysis = json.load(f).get("analysis")
+            self.scores, self.offsets, self.in_memory, self.analysis = scores, offsets or {}, in_memory, analysis
+            self.by_index = {str(record["index"]): record for record in scores}
+            self.version = version
+        print(f"[SERVE] Loaded {len(scores)} score records and {len(self.offsets) or len(in_memory)} full records (version {version})")
+        return version
+
+    def facets(self) -> Dict:
+        counts = {"category": {}, "process_type": {}, "overall_grade": {}}
+        for record in self.scores:
+            for field, values in counts.items():
+                values[record.get(field)] = values.get(record.get(field), 0) + 1
+        return counts
+
+    def summary(self) -> Dict:
+        return {"version": self.version, "sequences": len(self.scores), "full_records": bool(self.offsets or self.in_memory),
+                "facets": self.facets(), "analysis": self.analysis}
+
+    def page(self, query: Dict[str, List[str]]) -> Dict:
+        """One page of score records, filtered by category, process_type, grade and score range."""
+        def values(name):
+            return {v for item in query.get(name, []) for v in item.split(",") if v}
+
+        categories, process_types, grades = values("category"), values("process_type"), values("grade")
+        min_score = float(query["min_score"][0]) if "min_score" in query else None
+        max_score = float(query["max_score"][0]) if "max_score" in query else None
+        page = max(1, int(query.get("page", ["1"])[0]))
+        page_size = min(SERVE_MAX_PAGE_SIZE, max(1, int(query.get("page_size", [str(SERVE_PAGE_SIZE)])[0])))
+        sort = query.get("sort", ["index"])[0]
+        if sort.lstrip("-") not in SERVE_SORT_FIELDS:
+            raise ValueError(f"sort must be one of {sorted(SERVE_SORT_FIELDS)}, optionally prefixed with '-'")
+
+        rows = [
+            r for r in self.scores
+            if (not categories or r.get("category") in categories)
+            and (not process_types or r.get("process_type") in process_types)
+            and (not grades or r.get("overall_grade") in grades)
+            and (min_score is None or r.get("overall_score", 0) >= min_score)
+            and (max_score is None or r.get("overall_score", 0) <= max_score)
+        ]
+        field = sort.lstrip("-")
+        if field == "index":
+            # 数字序号按数值排序
+            key = lambda r: (0, int(r["index"]), "") if str(r["index"]).isdigit() else (1, 0, str(r["index"]))
+        else:
+            key = lambda r: r.get(field, 0)
+        rows.sort(key=key, reverse=sort.startswith("-"))
+        start = (page - 1) * page_size
+        return {
+            "version": self.version,
+            "total": len(rows),
+            "page": page,
+            "page_size": page_size,
+            "pages": (len(rows) + page_size - 1) // page_size,
+            "items": rows[start:start + page_size]
+        }
+
+    def detail(self, index: str) -> Optional[Dict]:
+        """Full record of one sequence (judge transcript, steps, timings), read on demand."""
+        with self.lock:
+            if index in self.in_memory:
+                return self.in_memory[index]
+            span = self.offsets.get(index)
+        if span is None:
+            return None
+        with open(self.paths["full"], 'rb') as f:
+            f.seek(span[0])
+            obj = json.loads(f.read(span[1]))
+        return obj.get("full", obj)
+
+    def image_path(self, index: str, step: int) -> Optional[str]:
+        """Image of one step: resolved under --image_dir when given, else the path recorded in the full record."""
+        record = self.detail(index)
+        if record is None:
+            return None
+        steps = {s["step"]: s.get("image_path") for s in record.get("steps", [])}
+        if step not in steps:
+            return None
+        if self.image_index is not None:
+            path = find_image_paths(index, self.cfg["image_dir"], [step], self.image_index, quiet=True).get(step)
+        else:
+            path = steps[step]
+        return path if path and os.path.isfile(path) else None
+
+    def thumbnail(self, path: str, size: int) -> bytes:
+        with self.lock:
+            if size not in self.thumbnailers:
+                self.thumbnailers[size] = ImageOptimizer(size, "jpeg", 80, self.cfg["image_cache_dir"])
+            thumbnailer = self.thumbnailers[size]
+        with open(path, 'rb') as f:
+            return thumbnailer.process(f.read())
+
+def make_results_handler(store: ResultsStore):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_body(self, status: int, body: bytes, content_type: str, etag: str = None, cache: str = "no-cache"):
+            headers = {"Content-Type": content_type, "Cache-Control": cache, "Vary": "Accept-Encoding",
+                       "Access-Control-Allow-Origin": "*", "Access-Control-Expose-Headers": "ETag"}
+            if etag is not None:
+                headers["ETag"] = etag
+            if (len(body) > 1024 and content_type.startswith(("application/json", "text/", "application/javascript"))
+                    and "gzip" in self.headers.get("Accept-Encoding", "")):
+                body = gzip.compress(body, compresslevel=5)
+                headers["Content-Encoding"] = "gzip"
+            headers["Content-Length"] = str(len(body))
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def send_json(self, status: int, payload, etag: str = None):
+            self.send_body(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8", etag)
+
+        def not_modified(self, etag: str) -> bool:
+            """Answer 304 when the client's cached copy (If-None-Match) is still current."""
+            tags = {tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")}
+            if etag not in tags and "*" not in tags:
+                return False
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return True
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+            query = parse_qs(url.query)
+            try:
+                if parts[:1] != ["api"]:
+                    self.serve_static(parts)
+                    return
+                version = store.refresh()
+                # ETag = 数据版本 + 请求路径与参数：文件不变时客户端缓存一直有效
+                etag = '"' + hashlib.sha1(f"{version}|{url.path}?{url.query}".encode("utf-8")).hexdigest()[:20] + '"'
+                if parts == ["api", "summary"]:
+                    if not self.not_modified(etag):
+                        self.send_json(200, store.summary(), etag)
+                elif parts == ["api", "sequences"]:
+                    if not self.not_modified(etag):
+                        self.send_json(200, store.page(query), etag)
+                elif len(parts) == 3 and parts[1] == "sequences":
+                    if self.not_modified(etag):
+                        return
+                    record = store.detail(parts[2])
+                    if record is None:
+                        self.send_json(404, {"error": f"no full record for sequence {parts[2]}"})
+                    else:
+                        self.send_json(200, record, etag)
+                elif len(parts) == 4 and parts[1] == "images":
+                    self.serve_image(parts[2], int(parts[3]), query)
+                else:
+                    self.send_json(404, {"error": "not found"})
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def serve_image(self, index: str, step: int, query: Dict[str, List[str]]):
+            size = int(query["size"][0]) if "size" in query else None
+            if size is not None and size not in SERVE_THUMBNAIL_SIZES:
+                raise ValueError(f"size must be one of {SERVE_THUMBNAIL_SIZES}")
+            path = store.image_path(index, step)
+            if path is None:
+                self.send_json(404, {"error": f"no image for sequence {index} step {step}"})
+                return
+            st = os.stat(path)
+            etag = '"' + hashlib.sha1(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}:{size}".encode("utf-8")).hexdigest()[:20] + '"'
+            if self.not_modified(etag):
+                return
+            if size is not None:
+                if Image is None:
+                    self.send_json(501, {"error": "thumbnails need Pillow (pip install pillow)"})
+                    return
+                body, content_type = store.thumbnail(path, size), "image/jpeg"
+            else:
+                with open(path, 'rb') as f:
+                    body = f.read()
+                content_type = IMAGE_MIME_TYPES.get(os.path.splitext(path)[1].lower().lstrip(".").replace("jpg", "jpeg"), "application/octet-stream")
+            self.send_body(200, body, content_type, etag)
+
+        def serve_static(self, parts: List[str]):
+            path = os.path.normpath(os.path.join(SERVE_STATIC_DIR, *parts)) if parts else os.path.join(SERVE_STATIC_DIR, "index.html")
+            if os.path.commonpath([path, SERVE_STATIC_DIR]) != SERVE_STATIC_DIR or not os.path.isfile(path):
+                self.send_json(404, {"error": "not found"})
+                return
+            st = os.stat(path)
+            etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+            if self.not_modified(etag):
+                return
+            with open(path, 'rb') as f:
+                body = f.read()
+            self.send_body(200, body, SERVE_STATIC_TYPES.get(os.path.splitext(path)[1], "application/octet-stream"), etag)
+
+    return Handler
+
+def run_results_server(cfg: Dict):
+    """Serve the result files of --output_dir (and the UI app) over HTTP until interrupted."""
+    store = ResultsStore(cfg)
+    server = ThreadingHTTPServer((cfg["serve_host"], cfg["serve"]), make_results_handler(store))
+    server.daemon_threads = True
+    host, port = server.server_address[:2]
+    print(f"[SERVE] Results of {cfg['output_dir']} on http://{host}:{port}/api/sequences "
+          f"(UI at http://{host}:{port}/); Ctrl-C to stop", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    args = parse_arguments()
+    cfg = get_config(args)
+    
+    # Create output directory
+    Path(cfg["output_dir"]).mkdir(parents=True, exist_ok=True)
+    print(f"Output directory: {cfg['output_dir']}")
+
+    if cfg["rescore"]:
+        rescore_results(cfg)
+        return
+    if cfg["compare"]:
+        run_compare(cfg)
+        return
+    if cfg["serve"] is not None:
+        run_results_server(cfg)
+        return
+    if cfg["batch_manifest"]:
+        run_batch(cfg)
+        return
+    if cfg["batch_prepare"]:
+        batch_prepare(cfg)
+        return
+    if cfg["batch_execute_local"]:
+        batch_execute_local(cfg)
+        return
+    if cfg["batch_ingest"]:
+        batch_ingest(cfg)
+        return
+
+    if cfg["merge"]:
+        merge_shards(cfg)
+        return
+    if cfg["preflight"]:
+        sys.exit(0 if run_preflight(cfg) else 1)
+
+    if not os.path.isfile(cfg["json_path"]):
+        print(f"[ERROR] Sequence file not found: {cfg['json_path']}. Exiting.")
+        return
+
+    state = load_run_state(cfg)
+    queue = None
+    if cfg["work_queue"]:
+        # 共享队列中已提交的结果同样视为已完成
+        queue = WorkQueue(os.path.join(cfg["output_dir"], cfg["work_queue"]), cfg["worker_id"], cfg["lease_seconds"])
+        _, queue_scores, queue_failures = queue.results()
+        state["scores"].update(queue_scores)
+        state["failures"].update(queue_failures)
+
+    if cfg["watch"]:
+        # 生成器可能尚未创建图片目录：从空索引开始，由监听器补全
+        os.makedirs(cfg["image_dir"], exist_ok=True)
+
+    # Index the image tree once; reused for queueing and evaluation.
+    # Sequences are streamed from the dataset file, never held as a whole.
+    image_index = ImageIndex.build(cfg["image_dir"], cfg["image_manifest"])
+    if cfg["watch"]:
+        try:
+            run_watch(state, cfg, image_index)
+        finally:
+            compact_results(state, cfg)
+        return
+    tasks = queue_sequences(iter_sequences(cfg["json_path"], cfg["shard"]), state, cfg, image_index)
+
+    if queue is not None:
+        try:
+            run_work_queue(queue, tasks, cfg, image_index)
+        finally:
+            queue.close()
+        return
+
+    # Evaluate; every finished sequence is journaled immediately
+    try:
+        if tasks:
+            if cfg["order"] == "stratified":
+                tasks = stratified_order(tasks)
+            with open(state["journal_path"], 'a', encoding='utf-8') as journal:
+                runtime = make_runtime(cfg, image_index)
+                jobs = [(index, index, seq_data, cfg, runtime, image_paths) for index, seq_data, image_paths in tasks]
+                estimate = None
+                if cfg["order"] == "stratified" or cfg["target_ci"]:
+                    # 总体 = 已完成 + 待评测序列
+                    population = {}
+                    for record in itertools.chain(state["scores"].values(), (seq_data for _, seq_data, _ in tasks)):
+                        population[stratum_of(record)] = population.get(stratum_of(record), 0) + 1
+                    estimate = RunningEstimate(population, cfg["ci_level"])
+                    for record in state["scores"].values():
+                        estimate.add(record)
+                    runtime["progress"].estimate = estimate
+
+                def on_result(index, result):
+                    if estimate is not None and isinstance(result, tuple):
+                        estimate.add(result[1])
+                    record_result(state, journal, index, result, runtime["progress"])
+
+                if cfg["target_ci"]:
+                    run_evaluation(stop_at_target_ci(jobs, estimate, cfg, runtime), cfg, on_result, runtime, total=len(jobs))
+                else:
+                    run_evaluation(jobs, cfg, on_result, runtime)
+                if estimate is not None:
+                    write_running_estimate(estimate, runtime.get("stopped_early", False), cfg)
+        else:
+            print("No tasks to process.")
+    finally:
+        # Sort and save results
+        compact_results(state, cfg)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
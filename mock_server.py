@@ -0,0 +1,236 @@
+"""OpenAI-compatible stand-in judge server for offline runs of eval.py.
+
+Serves POST /v1/chat/completions with canned, score-bearing responses (the
+nine-line text format, or the JSON format of --output_mode json) and lets you
+inject latency, server errors and 429s. Use it through --api_base:
+
+    python mock_server.py --port 8000 --latency lognormal --latency_ms 800
+    python eval.py ... --api_base http://127.0.0.1:8000/v1 --api_key mock
+
+Scores are derived from a hash of the request, so identical requests always
+get identical answers; with n > 1 the extra choices deviate by up to one point. Only the standard library is required.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+SCORE_LABELS = [
+    ("semantic_consistency", "Semantic Consistency"),
+    ("factual_consistency", "Factual Consistency"),
+    ("spatial_temporal_consistency", "Spatial-Temporal Consistency"),
+    ("expressiveness", "Expressiveness"),
+    ("artistic_quality", "Artistic Quality"),
+    ("authenticity", "Authenticity"),
+    ("basic_properties", "Basic Properties"),
+    ("dynamics_interactivity", "Dynamics and Interactivity"),
+    ("physical_reliability", "Physical Reliability")
+]
+# 与 eval.py 的 IMAGE_TOKEN_ESTIMATE 一致
+IMAGE_TOKENS = 765
+PREFIX_BLOCK_CHARS = 1024
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='OpenAI-compatible mock judge server')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=8000, help='Port (0 picks a free port)')
+    parser.add_argument('--latency', choices=['fixed', 'uniform', 'exponential', 'lognormal'], default='fixed', help='Response latency distribution')
+    parser.add_argument('--latency_ms', type=float, default=50, help='Mean response latency in milliseconds')
+    parser.add_argument('--latency_sigma', type=float, default=0.5, help='Shape of the lognormal distribution / half-width fraction of the uniform one')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--rate_limit_rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 429')
+    parser.add_argument('--retry_after', type=float, default=1.0, help='Retry-After seconds sent with injected 429s')
+    parser.add_argument('--rpm', type=float, default=None, help='Enforce a requests-per-minute limit (429 + x-ratelimit-* headers)')
+    parser.add_argument('--truncate_rate', type=float, default=0.0, help='Fraction of responses cut in half with finish_reason "length"')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for latency and fault injection')
+    return parser.parse_args(argv)
+
+class MockJudge:
+    """Request handling state shared by all server threads."""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_requests = 0
+        self.prefixes = set()
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "truncated": 0}
+
+    def latency(self) -> float:
+        mean = self.args.latency_ms / 1000.0
+        with self.lock:
+            if self.args.latency == "uniform":
+                return self.rng.uniform(mean * (1 - self.args.latency_sigma), mean * (1 + self.args.latency_sigma))
+            if self.args.latency == "exponential":
+                return self.rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+            if self.args.latency == "lognormal":
+                sigma = self.args.latency_sigma
+                return self.rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma) if mean > 0 else 0.0
+            return mean
+
+    def fault(self) -> Optional[Dict]:
+        """Decide whether this request fails; returns {"status", "message", "headers"} or None."""
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.args.rpm:
+                now = time.monotonic()
+                if now - self.window_start >= 60:
+                    self.window_start, self.window_requests = now, 0
+                self.window_requests += 1
+                reset = 60 - (now - self.window_start)
+                if self.window_requests > self.args.rpm:
+                    self.stats["rate_limited"] += 1
+                    return {"status": 429, "message": "rate limit exceeded", "headers": {
+                        "retry-after": f"{reset:.1f}",
+                        "x-ratelimit-remaining-requests": "0",
+                        "x-ratelimit-reset-requests": f"{reset:.1f}s"
+                    }}
+            roll = self.rng.random()
+            if roll < self.args.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return {"status": 429, "message": "slow down", "headers": {"retry-after": str(self.args.retry_after)}}
+            if roll < self.args.rate_limit_rate + self.args.error_rate:
+                self.stats["errors"] += 1
+                return {"status": 500, "message": "injected server error", "headers": {}}
+            self.stats["ok"] += 1
+            return None
+
+    def truncate(self) -> bool:
+        with self.lock:
+            if self.rng.random() < self.args.truncate_rate:
+                self.stats["truncated"] += 1
+                return True
+            return False
+
+    def usage(self, body: Dict, completion: str) -> Dict:
+        """Approximate token usage, with cached_tokens for the text prefix already seen."""
+        text, images, prefix_done = [], 0, False
+        for msg in body.get("messages", []):
+            content = msg.get("content")
+            parts = [{"type": "text", "text": content}] if isinstance(content, str) else content or []
+            for part in parts:
+                if part.get("type") == "text":
+                    text.append(part.get("text", ""))
+                else:
+                    images += 1
+        joined = "".join(text)
+        # 模拟服务端前缀缓存：按 1024 字符块累计已见过的前缀
+        cached_chars = 0
+        with self.lock:
+            for end in range(PREFIX_BLOCK_CHARS, len(joined) + 1, PREFIX_BLOCK_CHARS):
+                key = hashlib.sha1(joined[:end].encode("utf-8")).digest()
+                if key in self.prefixes and not prefix_done:
+                    cached_chars = end
+                else:
+                    prefix_done = True
+                    self.prefixes.add(key)
+        prompt_tokens = len(joined) // 4 + images * IMAGE_TOKENS
+        completion_tokens = max(1, len(completion) // 4)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_chars // 4}
+        }
+
+    def choice(self, body: Dict, digest: bytes, index: int) -> Dict:
+        if index:
+            # 额外样本：在基准分数上做 ±1 的确定性扰动
+            sample = hashlib.sha256(digest + index.to_bytes(4, "big")).digest()
+            scores = [min(5, max(1, 1 + digest[i] % 5 + sample[i] % 3 - 1)) for i in range(len(SCORE_LABELS))]
+        else:
+            scores = [1 + digest[i] % 5 for i in range(len(SCORE_LABELS))]
+        wants_json = body.get("response_format") is not None or "Return ONLY a JSON object" in json.dumps(body.get("messages"))
+        if wants_json:
+            content = json.dumps({
+                key: {"score": score, "reason": "Mock judgement."} for (key, _), score in zip(SCORE_LABELS, scores)
+            })
+        else:
+            content = "\n".join(f"{label}: {score}" for (_, label), score in zip(SCORE_LABELS, scores))
+        finish_reason = "stop"
+        if self.truncate():
+            content, finish_reason = content[:len(content) // 2], "length"
+        return {"index": index, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}
+
+    def completion(self, body: Dict) -> Dict:
+        """Answer with body["n"] choices; choice i only depends on the messages and i."""
+        digest = hashlib.sha256(json.dumps(body.get("messages"), sort_keys=True).encode("utf-8")).digest()
+        n = max(1, int(body.get("n") or 1))
+        choices = [self.choice(body, digest, i) for i in range(n)]
+        return {
+            "id": f"chatcmpl-mock-{digest[:6].hex()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": choices,
+            "usage": self.usage(body, "".join(c["message"]["content"] for c in choices))
+        }
+
+def make_handler(judge: MockJudge):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status: int, payload: Dict, headers: Dict = None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self.send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+            elif self.path.rstrip("/").endswith("/stats"):
+                self.send_json(200, judge.stats)
+            else:
+                self.send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": "not found"}})
+                return
+            time.sleep(judge.latency())
+            fault = judge.fault()
+            if fault is not None:
+                error = {"message": fault["message"], "type": "rate_limit" if fault["status"] == 429 else "server_error",
+                         "code": "rate_limit_exceeded" if fault["status"] == 429 else None}
+                self.send_json(fault["status"], {"error": error}, fault["headers"])
+                return
+            self.send_json(200, judge.completion(body))
+
+    return Handler
+
+def start_server(args) -> ThreadingHTTPServer:
+    """Start the mock server on a background thread; returns the server (see .server_address)."""
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(MockJudge(args)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    args = parse_arguments()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(MockJudge(args)))
+    server.daemon_threads = True
+    host, port = server.server_address[:2]
+    print(f"Mock judge listening on http://{host}:{port}/v1 (latency {args.latency} {args.latency_ms}ms, "
+          f"errors {args.error_rate}, 429s {args.rate_limit_rate})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import eval as ev  # noqa: E402
+import mock_server  # noqa: E402
+
+SCORE_LABELS = [
+    "Semantic Consistency", "Factual Consistency", "Spatial-Temporal Consistency",
+    "Expressiveness", "Artistic Quality", "Authenticity",
+    "Basic Properties", "Dynamics and Interactivity", "Physical Reliability"
+]
+
+
+class StubJudgeHandler(BaseHTTPRequestHandler):
+    """Minimal chat-completions endpoint; scores are derived from a hash of the request.
+
+    Requests with a response_format get the JSON output format, others the nine score lines.
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        request = json.loads(body)
+        self.server.requests.append(request)
+        if self.server.faults:
+            status = self.server.faults.pop(0)
+            payload = json.dumps({"error": {"message": f"injected {status}", "type": "stub", "code": None}}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("retry-after", "0")
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        digest = hashlib.sha256(json.dumps(request["messages"], sort_keys=True).encode()).digest()
+        if "response_format" in request:
+            text = json.dumps({
+                label.lower().replace(" and ", "_").replace(" ", "_").replace("-", "_"): {"score": 1 + digest[i] % 5, "reason": "ok"}
+                for i, label in enumerate(SCORE_LABELS)
+            })
+        else:
+            text = "\n".join(f"**{label}**: {1 + digest[i] % 5}" for i, label in enumerate(SCORE_LABELS))
+        payload = json.dumps({
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": request["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1000, "completion_tokens": 100, "total_tokens": 1100,
+                      "prompt_tokens_details": {"cached_tokens": self.cached_tokens(request)}}
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def cached_tokens(self, request) -> int:
+        """Pretend-prefix-cache: 800 of the 1000 prompt tokens hit when the first user text part was seen before."""
+        user = next(msg for msg in request["messages"] if msg["role"] == "user")
+        first = user["content"][0]["text"] if isinstance(user["content"], list) else user["content"]
+        with self.server.lock:
+            hit = first in self.server.prefixes
+            self.server.prefixes.add(first)
+        return 800 if hit else 0
+
+    def log_message(self, *args):
+        pass
+
+
+def strip_telemetry(full_records, keys=("timings",)):
+    """Full records without the per-run telemetry fields, for comparing runs."""
+    return [{k: v for k, v in record.items() if k not in keys} for record in full_records]
+
+
+@pytest.fixture
+def stub_judge():
+    """A local judge server; yields its base URL and records every request body in .requests.
+
+    Status codes appended to .faults are answered (in order) instead of the next requests.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubJudgeHandler)
+    server.requests = []
+    server.faults = []
+    server.prefixes = set()
+    server.lock = threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def mock_judge():
+    """Start mock_server.py in-process with the given options; returns its base URL."""
+    servers = []
+
+    def start(*argv):
+        server = mock_server.start_server(mock_server.parse_arguments(["--port", "0", "--latency_ms", "0", *argv]))
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1"
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Write n four-step sequences and their step images; returns (json_path, image_dir)."""
+    def make(n=6):
+        from PIL import Image
+        image_dir = tmp_path / "images"
+        data = []
+        for i in range(n):
+            index = str(i)
+            data.append({
+                "index": index, "category": ["physics", "biology", "history"][i % 3], "process_type": "AB"[i % 2],
+                "prompts": [{"step": s, "prompt": f"p{s}", "explanation": f"e{s}"} for s in range(1, 5)]
+            })
+            (image_dir / index).mkdir(parents=True)
+            for s in range(1, 5):
+                Image.new("RGB", (64, 48), (40 * s, 7 * i % 256, 90)).save(image_dir / index / f"step_{s}.png")
+        json_path = tmp_path / "data.json"
+        json_path.write_text(json.dumps(data), encoding="utf-8")
+        return str(json_path), str(image_dir)
+    return make
+
+
+@pytest.fixture
+def make_cfg(monkeypatch):
+    """Build a run configuration from command-line arguments, as main() does."""
+    def make(*argv):
+        monkeypatch.setattr(sys, "argv", ["eval.py", *argv])
+        return ev.get_config(ev.parse_arguments())
+    return make
+
+
+@pytest.fixture
+def run_eval(monkeypatch):
+    """Run eval.py's main() with the given command-line arguments."""
+    def run(*argv):
+        monkeypatch.setattr(sys, "argv", ["eval.py", *argv])
+        ev.main()
+    return run
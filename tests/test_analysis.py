@@ -0,0 +1,53 @@
+import random
+import statistics
+
+from conftest import ev
+
+
+def score_records(n, seed=0):
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        scores = {dim: float(rng.randint(1, 5)) for dim in ev.SUB_DIMENSIONS}
+        sequence_data = {"category": ["physics", "biology", "history"][i % 3], "process_type": "AB"[i % 2]}
+        records.append(ev.make_score_record(str(i), sequence_data, scores, ev.calculate_comprehensive_scores(scores)))
+    return records
+
+
+def test_breakdowns_match_plain_python():
+    records = score_records(40)
+    analysis = ev.analyze_comprehensive_results(records)
+
+    for category in ("physics", "biology", "history"):
+        overall = [r["overall_score"] for r in records if r["category"] == category]
+        stats = analysis["by_category"][category]
+        assert stats["count"] == len(overall)
+        assert stats["overall_score"]["mean"] == round(statistics.mean(overall), 2)
+        assert stats["overall_score"]["std"] == round(statistics.stdev(overall), 2)
+        assert stats["overall_score"]["max"] == round(max(overall), 2)
+    assert sum(s["count"] for s in analysis["by_process_type"].values()) == 40
+
+    authenticity = [r["authenticity"] for r in records]
+    assert analysis["sub_dimension_performance"]["authenticity"]["pass_rate_3"] == \
+        round(sum(v >= 3 for v in authenticity) / 40, 2)
+    assert sum(analysis["score_distribution"].values()) == 40
+
+
+def test_ranking_matches_stable_sort_with_ties():
+    records = score_records(30, seed=3)
+    for r in records[::4]:
+        r["overall_score"] = 3.0  # 制造大量并列
+    ranked = sorted(records, key=lambda r: r["overall_score"], reverse=True)
+    analysis = ev.analyze_comprehensive_results(records)
+    assert [e["index"] for e in analysis["ranking"]["top_5"]] == [r["index"] for r in ranked[:5]]
+    assert [e["index"] for e in analysis["ranking"]["bottom_5"]] == [r["index"] for r in ranked[-5:]]
+
+
+def test_missing_sub_dimensions_are_ignored_not_zeroed():
+    records = score_records(4)
+    del records[0]["authenticity"]
+    analysis = ev.analyze_comprehensive_results(records)
+    assert analysis["sub_dimension_performance"]["authenticity"]["count"] == 3
+    expected = statistics.mean(r["authenticity"] for r in records[1:])
+    assert analysis["sub_dimension_performance"]["authenticity"]["mean"] == round(expected, 2)
+    assert ev.analyze_comprehensive_results([]) == {}
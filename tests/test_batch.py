@@ -0,0 +1,62 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from conftest import ev
+
+
+def write_manifest(tmp_path, image_dirs):
+    manifest = tmp_path / "models.json"
+    manifest.write_text(json.dumps([
+        {"name": name, "image_dir": image_dir, "group": "Open-Source T2I Models"} for name, image_dir in image_dirs
+    ]), encoding="utf-8")
+    return str(manifest)
+
+
+def test_batch_judges_every_model_and_renders_prompts_once(tmp_path, stub_judge, dataset, run_eval, monkeypatch):
+    json_path, image_dir = dataset(4)
+    other_dir = str(tmp_path / "other_images")
+    shutil.copytree(image_dir, other_dir)
+    shutil.rmtree(os.path.join(other_dir, "3"))  # 第二个模型缺一个序列
+    manifest = write_manifest(tmp_path, [("alpha", image_dir), ("beta/v2", other_dir)])
+
+    rendered = []
+    render = ev.build_sequence_prompt_text
+    monkeypatch.setattr(ev, "build_sequence_prompt_text", lambda seq, *a, **kw: rendered.append(seq["index"]) or render(seq, *a, **kw))
+
+    out_dir = str(tmp_path / "out")
+    run_eval("--json_path", json_path, "--batch_manifest", manifest, "--output_dir", out_dir,
+             "--api_key", "k", "--model", "m", "--api_base", stub_judge.url, "--max_workers", "2",
+             "--result_full", "full.json", "--result_scores", "scores.jsonl")
+
+    assert len(stub_judge.requests) == 7
+    assert sorted(rendered) == ["0", "1", "2", "3"]
+    assert len(ev.load_jsonl(os.path.join(out_dir, "alpha", "scores.jsonl"))) == 4
+    assert len(ev.load_jsonl(os.path.join(out_dir, "beta_v2", "scores.jsonl"))) == 3
+
+    with open(os.path.join(out_dir, "leaderboard.json"), encoding="utf-8") as f:
+        leaderboard = json.dumps(json.load(f))
+    assert "alpha" in leaderboard and "beta/v2" in leaderboard
+    for name in ("benchmark.tex", "benchmark_all.tex", "leaderboard.html"):
+        assert os.path.getsize(os.path.join(out_dir, name)) > 0
+
+    # 中断后重跑：每个模型从自己的结果续跑，不再请求
+    run_eval("--json_path", json_path, "--batch_manifest", manifest, "--output_dir", out_dir,
+             "--api_key", "k", "--model", "m", "--api_base", stub_judge.url,
+             "--result_full", "full.json", "--result_scores", "scores.jsonl")
+    assert len(stub_judge.requests) == 7
+
+
+def test_batch_manifest_rejects_duplicate_names(tmp_path):
+    manifest = write_manifest(tmp_path, [("a", "x"), ("a", "y")])
+    with pytest.raises(ValueError, match="Duplicate"):
+        ev.load_batch_manifest(manifest)
+
+
+def test_batch_mode_requires_result_scores(make_cfg, capsys):
+    with pytest.raises(SystemExit):
+        make_cfg("--json_path", "d.json", "--batch_manifest", "m.json", "--output_dir", "o",
+                 "--api_key", "k", "--model", "m", "--result_full", "full.json")
+    assert "--result_scores" in capsys.readouterr().err
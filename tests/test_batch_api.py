@@ -0,0 +1,60 @@
+import glob
+import json
+import os
+
+from conftest import ev, strip_telemetry
+
+FILES = ["--result_full", "full.json", "--result_scores", "scores.jsonl"]
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_prepare_execute_ingest_matches_direct_run(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(5)
+    direct_dir = str(tmp_path / "direct")
+    run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", direct_dir,
+             "--api_key", "k", "--model", "m", "--api_base", stub_judge.url, *FILES)
+
+    out_dir = str(tmp_path / "batch")
+    run_eval("--batch-prepare", "--json_path", json_path, "--image_dir", image_dir, "--model", "m",
+             "--output_dir", out_dir, "--batch_max_requests", "2", *FILES)
+    shards = sorted(glob.glob(os.path.join(out_dir, "batch", "requests_*.jsonl")))
+    assert [len(read_jsonl(p)) for p in shards] == [2, 2, 1]
+    assert [line["custom_id"] for p in shards for line in read_jsonl(p)] == ["0", "1", "2", "3", "4"]
+    assert len(stub_judge.requests) == 5
+
+    run_eval("--batch_execute_local", "--api_key", "k", "--api_base", stub_judge.url, "--output_dir", out_dir, *FILES)
+    results = sorted(glob.glob(os.path.join(out_dir, "batch", "results_*.jsonl")))
+    # ingest 不需要 --image_dir，图片路径来自 batch_meta.json
+    run_eval("--batch-ingest", *results, "--json_path", json_path, "--output_dir", out_dir, *FILES)
+
+    assert read_jsonl(os.path.join(out_dir, "scores.jsonl")) == read_jsonl(os.path.join(direct_dir, "scores.jsonl"))
+    with open(os.path.join(out_dir, "full.json"), encoding="utf-8") as f, \
+            open(os.path.join(direct_dir, "full.json"), encoding="utf-8") as g:
+        assert strip_telemetry(json.load(f), ("timings", "usage")) == strip_telemetry(json.load(g), ("timings", "usage"))
+
+
+def test_ingest_records_failed_lines_and_prepare_retries_them(tmp_path, dataset, run_eval):
+    json_path, image_dir = dataset(3)
+    out_dir = str(tmp_path / "batch")
+    output = tmp_path / "output.jsonl"
+    lines = [
+        {"custom_id": "0", "response": {"status_code": 200, "body": {"choices": [{"message": {"content": "Semantic Consistency: 4\nAuthenticity: 3"}}]}}, "error": None},
+        {"custom_id": "1", "response": {"status_code": 429, "body": {"error": {"message": "slow down"}}}, "error": None},
+        {"custom_id": "2", "response": None, "error": {"code": "batch_expired", "message": "expired"}},
+        {"custom_id": "99", "response": {"status_code": 200, "body": {"choices": []}}, "error": None}
+    ]
+    output.write_text("\n".join(json.dumps(line) for line in lines) + "\n", encoding="utf-8")
+    run_eval("--batch-ingest", str(output), "--json_path", json_path, "--output_dir", out_dir, *FILES)
+
+    assert list(ev.load_jsonl(os.path.join(out_dir, "scores.jsonl"))) == ["0"]
+    failures = ev.load_jsonl(os.path.join(out_dir, "failures.jsonl"))
+    assert {k: v["error_type"] for k, v in failures.items()} == {"1": "rate_limit", "2": "batch_error"}
+
+    run_eval("--batch-prepare", "--retry_failed", "--json_path", json_path, "--image_dir", image_dir,
+             "--model", "m", "--output_dir", out_dir, *FILES)
+    shard = os.path.join(out_dir, "batch", "requests_000.jsonl")
+    assert [line["custom_id"] for line in read_jsonl(shard)] == ["1", "2"]
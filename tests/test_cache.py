@@ -0,0 +1,81 @@
+import json
+import os
+import time
+
+from PIL import Image
+
+from conftest import ev
+
+
+def params(text: str, model: str = "m") -> dict:
+    return {"model": model, "temperature": 0.3, "max_tokens": 2000,
+            "messages": [{"role": "user", "content": text}]}
+
+
+def test_judge_cache_put_get_and_key_sensitivity(tmp_path):
+    cache = ev.JudgeCache(str(tmp_path / "cache.sqlite"))
+    key = ev.JudgeCache.key(params("a"))
+    assert cache.get(key) is None
+    cache.put(key, "m", {"content": "scores"})
+    assert cache.get(key) == {"content": "scores"}
+
+    # 任何请求内容或模型变化都应落到不同的键上
+    assert ev.JudgeCache.key(params("b")) != key
+    assert ev.JudgeCache.key(params("a", model="other")) != key
+    assert ev.JudgeCache.key(params("a")) == key
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+    cache.close()
+
+    reopened = ev.JudgeCache(str(tmp_path / "cache.sqlite"))
+    assert reopened.get(key) == {"content": "scores"}
+    reopened.close()
+
+
+def test_judge_cache_evicts_least_recently_used_beyond_size(tmp_path):
+    cache = ev.JudgeCache(str(tmp_path / "cache.sqlite"))
+    blob = {"content": "x" * 4000}
+    for name in ("a", "b", "c"):
+        cache.put(name, "m", blob)
+        time.sleep(0.01)
+    cache.get("a")  # a 变为最近使用
+    cache.max_bytes = 9000
+    cache.evict()
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats["evicted"] == 1
+    cache.close()
+
+
+def test_judge_cache_evicts_entries_older_than_max_age(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ev.JudgeCache(path)
+    cache.put("old", "m", {"content": "1"})
+    cache.conn.execute("UPDATE responses SET created = ? WHERE key = 'old'", (time.time() - 3 * 86400,))
+    cache.conn.commit()
+    cache.put("new", "m", {"content": "2"})
+    cache.close()
+
+    cache = ev.JudgeCache(path, max_age_days=1)
+    assert cache.get("old") is None and cache.get("new") is not None
+    cache.close()
+
+
+def test_unchanged_requests_are_answered_from_cache(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(4)
+    cache_path = str(tmp_path / "cache.sqlite")
+
+    def run(output_dir):
+        run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", output_dir,
+                 "--api_key", "k", "--model", "m", "--api_base", stub_judge.url, "--cache_path", cache_path,
+                 "--result_full", "full.json", "--result_scores", "scores.jsonl")
+        with open(os.path.join(output_dir, "scores.jsonl"), encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    first = run(str(tmp_path / "a"))
+    assert run(str(tmp_path / "b")) == first
+    assert len(stub_judge.requests) == 4
+
+    # 换掉一张图片只让该序列重新评审
+    Image.new("RGB", (64, 48), (1, 2, 3)).save(os.path.join(image_dir, "2", "step_3.png"))
+    run(str(tmp_path / "c"))
+    assert len(stub_judge.requests) == 5
@@ -0,0 +1,126 @@
+import itertools
+import json
+import os
+
+import numpy as np
+import pytest
+
+from conftest import ev
+
+
+def score_record(index: str, overall: float, **fields) -> dict:
+    """Minimal score record; sub-dimensions not given are treated as missing."""
+    return {"index": index, "category": "physics", "process_type": "A", "overall_score": overall, **fields}
+
+
+def compare_cfg(**overrides) -> dict:
+    return {"resamples": 4000, "alpha": 0.05, "compare_seed": 0, "compare_workers": 1, **overrides}
+
+
+def runs_with_diffs(diffs, base: float = 3.0) -> dict:
+    return {
+        "a": [score_record(str(i), base + d) for i, d in enumerate(diffs)],
+        "b": [score_record(str(i), base) for i in range(len(diffs))]
+    }
+
+
+def exact_sign_flip_p(diffs) -> float:
+    """Two-sided p-value of the paired sign-flip test by full enumeration."""
+    diffs = np.asarray(diffs, dtype=float)
+    observed = abs(diffs.sum())
+    signs = np.array(list(itertools.product((-1.0, 1.0), repeat=len(diffs))))
+    return float((np.abs(signs @ diffs) >= observed - 1e-9).mean())
+
+
+def test_holm_adjust_known_values():
+    assert ev.holm_adjust([0.01, 0.04, 0.03, 0.005]) == pytest.approx([0.03, 0.06, 0.06, 0.02])
+    assert ev.holm_adjust([0.5, 0.4]) == pytest.approx([0.8, 0.8])
+    assert ev.holm_adjust([0.9, 0.6, 0.7]) == pytest.approx([1.0, 1.0, 1.0])
+    assert ev.holm_adjust([]) == []
+
+
+@pytest.mark.parametrize("diffs", [
+    [0.5] * 10,
+    [0.4, 0.3, -0.1, 0.2, 0.5, -0.2, 0.1, 0.3, 0.0, 0.2],
+    [0.3, -0.3, 0.1, -0.1, 0.2, -0.2, 0.05, -0.05, 0.4, -0.4]
+])
+def test_permutation_p_value_matches_exact_enumeration(diffs):
+    resamples = 4000
+    result = ev.compare_runs(runs_with_diffs(diffs), compare_cfg(resamples=resamples))
+    overall = result["comparisons"][0]["columns"]["overall_score"]
+    exact = exact_sign_flip_p(diffs)
+    # 蒙特卡洛估计 (exceed + 1) / (resamples + 1) 的标准误
+    se = np.sqrt(max(exact * (1 - exact), 1e-4) / resamples)
+    assert abs(overall["p_value"] - exact) <= 4 * se + 1 / resamples
+    assert overall["mean_diff"] == pytest.approx(np.mean(diffs), abs=1e-4)
+    assert overall["ci_low"] <= overall["mean_diff"] <= overall["ci_high"]
+    assert overall["n"] == len(diffs)
+
+
+def test_seeded_p_values_are_reproducible():
+    # 固定 --compare_seed 0 时的结果；重采样实现变化会在这里暴露
+    diffs = [0.4, 0.3, -0.1, 0.2, 0.5, -0.2, 0.1, 0.3, 0.0, 0.2]
+    overall = ev.compare_runs(runs_with_diffs(diffs), compare_cfg())["comparisons"][0]["columns"]["overall_score"]
+    assert overall["p_value"] == 0.05324
+    overall = ev.compare_runs(runs_with_diffs([0.5] * 10), compare_cfg())["comparisons"][0]["columns"]["overall_score"]
+    assert overall["p_value"] == 0.00275
+
+
+def test_identical_runs_are_not_significant():
+    runs = runs_with_diffs([0.0] * 12)
+    overall = ev.compare_runs(runs, compare_cfg())["comparisons"][0]["columns"]["overall_score"]
+    assert overall["p_value"] == 1.0
+    assert overall["ci_low"] == overall["ci_high"] == 0.0
+    assert overall["significant"] is False
+
+
+def test_results_depend_only_on_seed():
+    rng = np.random.default_rng(7)
+    diffs = rng.normal(0.1, 0.3, size=40).round(2)
+    runs = runs_with_diffs(diffs)
+    runs["c"] = [score_record(str(i), 3.0 + d / 2) for i, d in enumerate(diffs)]
+    one = ev.compare_runs(runs, compare_cfg(resamples=2500, compare_workers=1))
+    two = ev.compare_runs(runs, compare_cfg(resamples=2500, compare_workers=2))
+    assert one["comparisons"] == two["comparisons"]
+    other = ev.compare_runs(runs, compare_cfg(resamples=2500, compare_seed=1))
+    assert other["comparisons"] != one["comparisons"]
+
+
+def test_holm_is_applied_across_pairs():
+    diffs = [0.5, 0.4, 0.6, 0.5, 0.3, 0.5, 0.4, 0.6]
+    runs = runs_with_diffs(diffs)
+    runs["c"] = [score_record(str(i), 3.0 - d) for i, d in enumerate(diffs)]
+    result = ev.compare_runs(runs, compare_cfg())
+    tested = [c["columns"]["overall_score"] for c in result["comparisons"]]
+    adjusted = ev.holm_adjust([stats["p_value"] for stats in tested])
+    assert [stats["p_holm"] for stats in tested] == pytest.approx(adjusted, abs=1e-5)
+    assert [stats["significant"] for stats in tested] == [p < 0.05 for p in adjusted]
+
+
+def test_runs_are_aligned_on_common_sequences():
+    runs = runs_with_diffs([0.2] * 6)
+    runs["a"].append(score_record("extra", 5.0))
+    result = ev.compare_runs(runs, compare_cfg(resamples=500))
+    assert result["sequences"] == 6
+    assert result["comparisons"][0]["columns"]["overall_score"]["mean_diff"] == pytest.approx(0.2)
+
+
+def test_too_few_common_sequences():
+    with pytest.raises(ValueError):
+        ev.compare_runs({"a": [score_record("0", 3.0)], "b": [score_record("1", 3.0)]}, compare_cfg())
+
+
+def test_compare_mode_reads_run_directories(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(6)
+    for name in ("x", "y"):
+        run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", str(tmp_path / name),
+                 "--api_key", "k", "--model", name, "--api_base", stub_judge.url,
+                 "--result_full", "full.json", "--result_scores", "scores.jsonl")
+    # 只读模式：未指定 --result_scores 时读取 scores.jsonl
+    run_eval("--compare", f"X={tmp_path / 'x'}", str(tmp_path / "y"), "--output_dir", str(tmp_path / "cmp"),
+             "--resamples", "200", "--compare_workers", "1")
+    with open(os.path.join(str(tmp_path / "cmp"), "significance.json"), encoding="utf-8") as f:
+        report = json.load(f)
+    assert report["sequences"] == 6
+    assert [(c["a"], c["b"]) for c in report["comparisons"]] == [("X", "y")]
+    assert os.path.exists(os.path.join(str(tmp_path / "cmp"), "significance.html"))
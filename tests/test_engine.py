@@ -0,0 +1,37 @@
+import json
+import os
+
+from conftest import ev, strip_telemetry
+
+
+def run_args(stub_judge, json_path, image_dir, output_dir, *extra):
+    return ["--json_path", json_path, "--image_dir", image_dir, "--output_dir", output_dir,
+            "--api_key", "k", "--model", "m", "--api_base", stub_judge.url,
+            "--result_full", "full.json", "--result_scores", "scores.jsonl", *extra]
+
+
+def test_async_engine_matches_thread_engine(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(8)
+    outputs = {}
+    for engine in ("thread", "async"):
+        output_dir = str(tmp_path / engine)
+        run_eval(*run_args(stub_judge, json_path, image_dir, output_dir, "--engine", engine, "--max_workers", "3"))
+        with open(os.path.join(output_dir, "scores.jsonl"), encoding="utf-8") as f:
+            scores = [json.loads(line) for line in f]
+        with open(os.path.join(output_dir, "full.json"), encoding="utf-8") as f:
+            outputs[engine] = (scores, strip_telemetry(json.load(f), ("timings", "usage")))
+
+    assert len(outputs["thread"][0]) == 8
+    assert outputs["async"] == outputs["thread"]
+    assert len(stub_judge.requests) == 16
+
+
+def test_async_engine_resumes_from_journal(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(4)
+    output_dir = str(tmp_path / "out")
+    run_eval(*run_args(stub_judge, json_path, image_dir, output_dir, "--engine", "async"))
+    run_eval(*run_args(stub_judge, json_path, image_dir, output_dir, "--engine", "async"))
+
+    # 第二次运行全部命中已有结果，不再请求评审模型
+    assert len(stub_judge.requests) == 4
+    assert len(ev.load_jsonl(os.path.join(output_dir, "scores.jsonl"))) == 4
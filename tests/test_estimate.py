@@ -0,0 +1,66 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from conftest import ev
+
+
+def task(index, category, process_type):
+    return (index, {"category": category, "process_type": process_type}, {})
+
+
+def test_stratified_order_interleaves_strata_proportionally():
+    tasks = [task(f"a{i}", "physics", "A") for i in range(6)] + [task(f"b{i}", "biology", "B") for i in range(3)]
+    ordered = ev.stratified_order(tasks)
+    assert sorted(ordered) == sorted(tasks)
+    assert ordered == ev.stratified_order(list(reversed(tasks)))  # 与输入顺序无关
+    # 每个前缀中两层的比例接近 2:1
+    for size in (3, 6, 9):
+        prefix = [t[1]["category"] for t in ordered[:size]]
+        assert prefix.count("physics") == 2 * size // 3
+
+
+def test_running_estimate_matches_closed_form():
+    rng = np.random.default_rng(0)
+    records = [{"category": c, "process_type": "A", **{column: float(v) for column in ev.ESTIMATE_COLUMNS}}
+               for c, v in zip(["x"] * 6 + ["y"] * 4, rng.uniform(1, 5, 10))]
+    estimate = ev.RunningEstimate({"x/A": 12, "y/A": 4})
+    assert estimate.estimate() is None
+    for record in records[:3]:
+        estimate.add(record)
+    simple = estimate.estimate()
+    values = np.array([r["overall_score"] for r in records[:3]])
+    assert simple["method"] == "simple"
+    assert simple["mean"] == pytest.approx(values.mean(), abs=1e-4)
+    half = 1.959964 * np.sqrt((1 - 3 / 16) * values.var(ddof=1) / 3)
+    assert simple["width"] == pytest.approx(2 * half, abs=1e-3)
+
+    for record in records[3:]:
+        estimate.add(record)
+    stratified = estimate.estimate()
+    x = np.array([r["overall_score"] for r in records[:6]])
+    y = np.array([r["overall_score"] for r in records[6:]])
+    assert stratified["method"] == "stratified" and stratified["n"] == 10
+    assert stratified["mean"] == pytest.approx(0.75 * x.mean() + 0.25 * y.mean(), abs=1e-4)
+    # y 层已全部评测，只剩 x 层的抽样方差
+    variance = 0.75 ** 2 * (1 - 6 / 12) * x.var(ddof=1) / 6
+    assert stratified["width"] == pytest.approx(2 * 1.959964 * np.sqrt(variance), abs=1e-3)
+    assert estimate.converged(10.0, 10) and not estimate.converged(10.0, 11)
+
+
+def test_target_ci_stops_a_stratified_run_early(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(12)
+    output_dir = str(tmp_path / "out")
+    run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", output_dir,
+             "--api_key", "k", "--model", "m", "--api_base", stub_judge.url,
+             "--result_full", "full.json", "--result_scores", "scores.jsonl",
+             "--order", "stratified", "--target_ci", "100", "--ci_min_sequences", "4", "--max_workers", "1")
+    with open(os.path.join(output_dir, "running_estimate.json"), encoding="utf-8") as f:
+        summary = json.load(f)
+    scores = ev.load_jsonl(os.path.join(output_dir, "scores.jsonl"))
+    assert summary["stopped_early"]
+    assert summary["population"] == 12
+    assert 4 <= len(scores) < 12
+    assert summary["estimates"]["overall_score"]["n"] == len(scores)
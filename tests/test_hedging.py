@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from conftest import ev
+
+
+def make_scheduler(slots=4):
+    concurrency = ev.AdaptiveConcurrency(maximum=slots, initial=slots)
+    return SimpleNamespace(pause_until=0.0, concurrency=concurrency, admission_delay=lambda tokens: 0.0,
+                           observe_response=lambda headers, usage, tokens: None)
+
+
+def raw_response(name):
+    usage = SimpleNamespace(total_tokens=100)
+    return SimpleNamespace(name=name, headers={}, parse=lambda: SimpleNamespace(usage=usage))
+
+
+def warmed_hedger(budget=1.0, latency=0.01):
+    hedger = ev.RequestHedger(50, budget, workers=4)
+    for _ in range(ev.HEDGE_MIN_OBSERVATIONS):
+        hedger.observe(latency)
+    return hedger
+
+
+def test_requests_are_sent_inline_until_a_threshold_exists():
+    hedger = ev.RequestHedger(95, 1.0, workers=2)
+    threads = []
+
+    def send():
+        threads.append(threading.current_thread())
+        return raw_response("primary")
+
+    for _ in range(ev.HEDGE_MIN_OBSERVATIONS):
+        assert hedger.delay() is None
+        assert hedger.call(send, make_scheduler(), 0).name == "primary"
+    assert set(threads) == {threading.current_thread()}
+    assert hedger.delay() is not None and hedger.stats["hedged"] == 0
+
+
+def test_losing_copy_keeps_its_slot_until_it_completes():
+    hedger = warmed_hedger()
+    scheduler = make_scheduler()
+    release_primary = threading.Event()
+    calls = []
+
+    def send():
+        calls.append(None)
+        if len(calls) == 1:
+            release_primary.wait(5)
+            return raw_response("primary")
+        return raw_response("hedge")
+
+    assert hedger.call(send, scheduler, 0).name == "hedge"
+    assert hedger.stats["hedged"] == 1 and hedger.stats["hedge_wins"] == 1
+    # 主请求仍在进行，对冲占用的并发槽尚未归还
+    assert scheduler.concurrency.in_flight == 1
+
+    release_primary.set()
+    deadline = time.monotonic() + 5
+    while scheduler.concurrency.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert scheduler.concurrency.in_flight == 0
+    assert hedger.stats["discarded_tokens"] == 100
+    hedger.executor.shutdown(wait=True)
+
+
+def test_skipped_hedge_is_counted_once_per_call(monkeypatch):
+    monkeypatch.setattr(ev, "HEDGE_RECHECK_SECONDS", 0.02)
+    hedger = warmed_hedger(budget=0.0)
+
+    def send():
+        time.sleep(0.2)  # 超过阈值后被反复复查
+        return raw_response("primary")
+
+    assert hedger.call(send, make_scheduler(), 0).name == "primary"
+    assert hedger.stats["skipped_budget"] == 1 and hedger.stats["hedged"] == 0
+
+    busy = warmed_hedger()
+    scheduler = make_scheduler(slots=1)
+    assert scheduler.concurrency.try_acquire()  # 调用方占着唯一的槽
+    assert busy.call(send, scheduler, 0).name == "primary"
+    assert busy.stats["skipped_busy"] == 1 and busy.stats["hedged"] == 0
+
+
+def test_async_hedge_cancels_the_slow_primary():
+    hedger = warmed_hedger()
+    scheduler = make_scheduler()
+    cancelled = []
+
+    async def send():
+        if not cancelled:
+            cancelled.append(False)
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled[0] = True
+                raise
+            return raw_response("primary")
+        return raw_response("hedge")
+
+    async def run():
+        result = await hedger.call_async(send, scheduler, 0)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()).name == "hedge"
+    assert cancelled == [True]
+    assert hedger.stats["hedge_wins"] == 1 and scheduler.concurrency.in_flight == 0
+
+
+def test_hedged_run_matches_plain_run(tmp_path, mock_judge, dataset, run_eval):
+    url = mock_judge("--latency", "lognormal", "--latency_ms", "20", "--latency_sigma", "1.0", "--seed", "2")
+    json_path, image_dir = dataset(30)
+    results = {}
+    for name, extra in (("plain", []), ("hedged", ["--hedge_percentile", "50", "--hedge_budget", "0.5"])):
+        output_dir = str(tmp_path / name)
+        run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", output_dir,
+                 "--api_key", "mock", "--model", "m", "--api_base", url,
+                 "--result_full", "full.json", "--result_scores", "scores.jsonl", "--max_workers", "4", *extra)
+        results[name] = ev.load_jsonl(os.path.join(output_dir, "scores.jsonl"))
+    assert len(results["plain"]) == 30
+    assert results["hedged"] == results["plain"]
+    with open(os.path.join(output_dir, "run_metrics.json"), encoding="utf-8") as f:
+        hedging = json.load(f)["hedging"]
+    assert hedging["requests"] == 30 and hedging["threshold_s"] is not None
@@ -0,0 +1,61 @@
+import json
+import os
+
+from conftest import ev
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+
+
+def make_layout(root):
+    """One sequence per naming pattern find_image_paths understands."""
+    for step in range(1, 5):
+        touch(os.path.join(root, "index_0001", f"index_0001_step_{step}.png"))
+        touch(os.path.join(root, "index_12", f"index_12_step_{step}.png"))
+        touch(os.path.join(root, "7", f"step_{step}.png"))
+        touch(os.path.join(root, f"9_step_{step}.png"))
+    touch(os.path.join(root, "3", "1.png"))
+
+
+def test_image_index_lookup_matches_filesystem_probing(tmp_path):
+    root = str(tmp_path / "images")
+    make_layout(root)
+    index = ev.ImageIndex.build(root)
+    steps = [1, 2, 3, 4]
+    for seq in ("1", "12", "7", "9", "3", "42"):
+        assert ev.find_image_paths(seq, root, steps, index) == ev.find_image_paths(seq, root, steps)
+    assert len(ev.find_image_paths("1", root, steps, index)) == 4
+    assert ev.find_image_paths("3", root, steps, index) == {1: os.path.join(root, "3", "1.png")}
+
+
+def test_image_index_manifest_skips_unchanged_directories(tmp_path, capsys):
+    root = str(tmp_path / "images")
+    manifest = str(tmp_path / "manifest.json")
+    make_layout(root)
+    ev.ImageIndex.build(root, manifest)
+    with open(manifest, encoding="utf-8") as f:
+        assert sorted(json.load(f)["dirs"]) == ["3", "7", "index_0001", "index_12"]
+
+    capsys.readouterr()
+    ev.ImageIndex.build(root, manifest)
+    assert "4 unchanged from manifest" in capsys.readouterr().out
+
+    # 新增文件改变目录 mtime，只有该目录被重新列出
+    touch(os.path.join(root, "3", "2.png"))
+    index = ev.ImageIndex.build(root, manifest)
+    assert "3 unchanged from manifest" in capsys.readouterr().out
+    assert index.exists(os.path.join(root, "3", "2.png"))
+
+
+def test_image_index_ignores_manifest_of_other_directory(tmp_path, capsys):
+    root = str(tmp_path / "images")
+    other = str(tmp_path / "other")
+    manifest = str(tmp_path / "manifest.json")
+    make_layout(root)
+    make_layout(other)
+    ev.ImageIndex.build(other, manifest)
+    capsys.readouterr()
+    ev.ImageIndex.build(root, manifest)
+    assert "0 unchanged from manifest" in capsys.readouterr().out
@@ -0,0 +1,59 @@
+import base64
+import os
+from io import BytesIO
+
+from PIL import Image
+
+from conftest import ev
+
+
+def png_bytes(size, mode="RGB") -> bytes:
+    out = BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)).save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_image_optimizer_downscales_and_reencodes():
+    optimizer = ev.ImageOptimizer(256, "jpeg", 80)
+    out = Image.open(BytesIO(optimizer.process(png_bytes((1024, 512), "RGBA"))))
+    assert out.format == "JPEG" and out.mode == "RGB"
+    assert out.size == (256, 128)
+
+    # 小于上限的图片只重新编码，不放大
+    small = Image.open(BytesIO(optimizer.process(png_bytes((100, 60)))))
+    assert small.size == (100, 60)
+    assert optimizer.stats["images"] == 2
+
+
+def test_image_optimizer_reuses_disk_variants(tmp_path):
+    raw = png_bytes((800, 800))
+    first = ev.ImageOptimizer(128, "webp", 70, cache_dir=str(tmp_path))
+    data = first.process(raw)
+    assert first.stats["cache_hits"] == 0
+
+    second = ev.ImageOptimizer(128, "webp", 70, cache_dir=str(tmp_path))
+    assert second.process(raw) == data
+    assert second.stats["cache_hits"] == 1
+
+    # 参数不同则是另一个变体
+    third = ev.ImageOptimizer(128, "webp", 90, cache_dir=str(tmp_path))
+    third.process(raw)
+    assert third.stats["cache_hits"] == 0
+
+
+def test_optimized_images_are_sent_with_matching_mime_type(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(1)
+    run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", str(tmp_path / "out"),
+             "--api_key", "k", "--model", "m", "--api_base", stub_judge.url,
+             "--result_full", "full.json", "--result_scores", "scores.jsonl",
+             "--image_max_side", "32", "--image_format", "webp", "--image_detail", "low")
+
+    parts = [part for msg in stub_judge.requests[0]["messages"] if isinstance(msg["content"], list)
+             for part in msg["content"] if part["type"] == "image_url"]
+    assert len(parts) == 4
+    for part in parts:
+        assert part["image_url"]["detail"] == "low"
+        header, payload = part["image_url"]["url"].split(",", 1)
+        assert header == "data:image/webp;base64"
+        assert Image.open(BytesIO(base64.b64decode(payload))).size == (32, 24)
+    assert os.path.isfile(os.path.join(str(tmp_path / "out"), "scores.jsonl"))
@@ -0,0 +1,88 @@
+import json
+import os
+
+from conftest import ev
+
+
+def judged(index: str, value: float) -> dict:
+    """Journal entry of a sequence judged with every sub-dimension at value."""
+    comprehensive = ev.calculate_comprehensive_scores({"semantic_consistency": value, "authenticity": value})
+    return {
+        "index": index,
+        "full": {"index": index, "comprehensive_scores": comprehensive},
+        "scores": {"index": index, "overall_score": comprehensive["overall_score"]}
+    }
+
+
+def failed(index: str) -> dict:
+    return {"index": index, "failure": ev.make_failure_record(index, "timeout", "timed out", 3)}
+
+
+def write_journal(path, entries):
+    with open(path, 'a', encoding='utf-8') as f:
+        for entry in entries:
+            ev.append_journal(f, entry)
+
+
+def test_replay_journal_drops_torn_tail_and_resumes(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    write_journal(path, [judged("0", 3), failed("1")])
+    intact = os.path.getsize(path)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(judged("2", 4))[:40])
+
+    full, scores, failures = ev.replay_journal(path)
+    assert sorted(scores) == ["0"] and sorted(full) == ["0"]
+    assert sorted(failures) == ["1"]
+    assert os.path.getsize(path) == intact
+
+    # 截断后追加的条目从干净的一行开始
+    write_journal(path, [judged("1", 4), judged("2", 2)])
+    full, scores, failures = ev.replay_journal(path)
+    assert sorted(scores) == ["0", "1", "2"]
+    assert failures == {}
+    assert scores["2"] == judged("2", 2)["scores"]
+
+
+def test_replay_journal_drops_complete_entry_without_newline(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    write_journal(path, [judged("0", 3)])
+    intact = os.path.getsize(path)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(judged("1", 4)))
+
+    # 能解析但缺少换行的末行同样视为写了一半，否则下一次追加会接在它后面
+    _, scores, _ = ev.replay_journal(path)
+    assert sorted(scores) == ["0"]
+    assert os.path.getsize(path) == intact
+
+    write_journal(path, [judged("1", 2), judged("2", 5)])
+    _, scores, _ = ev.replay_journal(path)
+    assert sorted(scores) == ["0", "1", "2"]
+    assert scores["1"] == judged("1", 2)["scores"]
+
+
+def test_replay_journal_skips_corrupt_complete_line(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    write_journal(path, [judged("0", 3)])
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("{not json\n")
+    write_journal(path, [judged("1", 3)])
+    size = os.path.getsize(path)
+
+    _, scores, _ = ev.replay_journal(path)
+    assert sorted(scores) == ["0", "1"]
+    assert os.path.getsize(path) == size
+
+
+def test_replay_journal_missing_or_empty(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    assert ev.replay_journal(path) == ({}, {}, {})
+    open(path, 'w').close()
+    assert ev.replay_journal(path) == ({}, {}, {})
+
+
+def test_journal_path_defaults_next_to_result_full(make_cfg):
+    cfg = make_cfg("--json_path", "d.json", "--image_dir", "imgs", "--output_dir", "out", "--api_key", "k",
+                   "--model", "m", "--result_full", "full.json", "--result_scores", "scores.jsonl")
+    assert cfg["journal"] == "full.json.journal.jsonl"
@@ -0,0 +1,72 @@
+import json
+import os
+import random
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import ev
+
+
+def eval_args(url, json_path, image_dir, output_dir, *extra):
+    return ["--json_path", json_path, "--image_dir", image_dir, "--output_dir", output_dir,
+            "--api_key", "mock", "--model", "m", "--api_base", url,
+            "--result_full", "full.json", "--result_scores", "scores.jsonl", *extra]
+
+
+def stats(url):
+    with urllib.request.urlopen(f"{url}/stats") as resp:
+        return json.load(resp)
+
+
+@pytest.mark.parametrize("output_mode", ["text", "json"])
+def test_mock_answers_are_complete_and_deterministic(tmp_path, mock_judge, dataset, run_eval, output_mode):
+    url = mock_judge()
+    json_path, image_dir = dataset(4)
+    results = []
+    for run in ("a", "b"):
+        output_dir = str(tmp_path / run)
+        run_eval(*eval_args(url, json_path, image_dir, output_dir, "--output_mode", output_mode))
+        results.append(ev.load_jsonl(os.path.join(output_dir, "scores.jsonl")))
+    assert len(results[0]) == 4
+    assert all(set(ev.SUB_DIMENSIONS) <= set(record) for record in results[0].values())
+    assert results[0] == results[1]
+
+
+def test_injected_errors_are_retried(tmp_path, mock_judge, dataset, run_eval, monkeypatch):
+    monkeypatch.setattr(random, "uniform", lambda a, b: 0.0)
+    url = mock_judge("--error_rate", "0.3", "--rate_limit_rate", "0.2", "--retry_after", "0", "--seed", "1")
+    json_path, image_dir = dataset(6)
+    output_dir = str(tmp_path / "out")
+    run_eval(*eval_args(url, json_path, image_dir, output_dir, "--max_retries", "8"))
+
+    counts = stats(url)
+    assert counts["errors"] > 0 and counts["rate_limited"] > 0 and counts["ok"] == 6
+    assert len(ev.load_jsonl(os.path.join(output_dir, "scores.jsonl"))) == 6
+
+
+def test_truncated_json_output_is_recorded_as_failure(tmp_path, mock_judge, dataset, run_eval):
+    url = mock_judge("--truncate_rate", "1.0")
+    json_path, image_dir = dataset(2)
+    output_dir = str(tmp_path / "out")
+    run_eval(*eval_args(url, json_path, image_dir, output_dir, "--output_mode", "json", "--max_retries", "0"))
+    failures = ev.load_jsonl(os.path.join(output_dir, "failures.jsonl"))
+    assert [record["error_type"] for record in failures.values()] == ["truncated", "truncated"]
+
+
+def test_rpm_limit_answers_429_with_ratelimit_headers(mock_judge):
+    url = mock_judge("--rpm", "1")
+    body = json.dumps({"model": "m", "messages": [{"role": "user", "content": "hi"}]}).encode()
+
+    def post():
+        req = urllib.request.Request(f"{url}/chat/completions", data=body, headers={"Content-Type": "application/json"})
+        return urllib.request.urlopen(req)
+
+    with post() as resp:
+        assert json.load(resp)["choices"][0]["finish_reason"] == "stop"
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        post()
+    assert excinfo.value.code == 429
+    assert excinfo.value.headers["x-ratelimit-remaining-requests"] == "0"
+    assert float(excinfo.value.headers["retry-after"]) > 0
@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+
+from conftest import ev
+
+
+def structured(scores: dict) -> str:
+    return json.dumps({dim: {"score": score, "reason": f"{dim} ok"} for dim, score in scores.items()})
+
+
+def test_well_formed_json_yields_scores_and_reasons():
+    expected = {dim: i % 6 for i, dim in enumerate(ev.SUB_DIMENSIONS)}
+    scores, reasons = ev.parse_structured_scores(structured(expected))
+    assert scores == {dim: float(value) for dim, value in expected.items()}
+    assert reasons == {dim: f"{dim} ok" for dim in ev.SUB_DIMENSIONS}
+
+
+def test_code_fence_and_prose_around_the_object():
+    expected = {dim: 4 for dim in ev.SUB_DIMENSIONS}
+    txt = "Here is my assessment:\n```json\n" + structured(expected) + "\n```\nThanks."
+    scores, _ = ev.parse_structured_scores(txt)
+    assert scores == {dim: 4.0 for dim in ev.SUB_DIMENSIONS}
+
+
+def test_bare_scores_are_accepted():
+    scores, reasons = ev.parse_structured_scores(json.dumps({dim: 3 for dim in ev.SUB_DIMENSIONS}))
+    assert scores == {dim: 3.0 for dim in ev.SUB_DIMENSIONS}
+    assert reasons == {}
+
+
+def test_out_of_range_and_non_numeric_scores_are_dropped():
+    data = {dim: {"score": 4} for dim in ev.SUB_DIMENSIONS}
+    data["semantic_consistency"] = {"score": 7}
+    data["authenticity"] = {"score": True}
+    data["artistic_quality"] = {"score": "5"}
+    scores, _ = ev.parse_structured_scores(json.dumps(data))
+    assert set(ev.SUB_DIMENSIONS) - set(scores) == {"semantic_consistency", "authenticity", "artistic_quality"}
+
+
+def test_truncated_output_recovers_complete_pairs():
+    full = structured({dim: 2 for dim in ev.SUB_DIMENSIONS})
+    # 在第 5 个维度中途截断（max_tokens）
+    cut = full.index(f'"{ev.SUB_DIMENSIONS[4]}"') + 10
+    scores, reasons = ev.parse_structured_scores(full[:cut])
+    assert scores == {dim: 2.0 for dim in ev.SUB_DIMENSIONS[:4]}
+    assert reasons == {}
+
+
+def test_no_json_at_all():
+    assert ev.parse_structured_scores("I cannot evaluate these images.") == ({}, {})
+
+
+def test_check_judge_response_distinguishes_truncation_from_parse_errors():
+    complete = structured({dim: 3 for dim in ev.SUB_DIMENSIONS})
+    ev.check_judge_response({"content": complete, "finish_reason": "stop"}, "json")
+    partial = complete[:complete.index(f'"{ev.SUB_DIMENSIONS[6]}"')]
+    with pytest.raises(ev.TruncatedResponseError):
+        ev.check_judge_response({"content": partial, "finish_reason": "length"}, "json")
+    with pytest.raises(ev.ScoreParseError):
+        ev.check_judge_response({"content": partial, "finish_reason": "stop"}, "json")
+    with pytest.raises(ev.EmptyResponseError):
+        ev.check_judge_response({"content": "", "finish_reason": "stop"}, "text")
+
+
+def test_json_mode_end_to_end(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(2)
+    out_dir = str(tmp_path / "out")
+    run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", out_dir,
+             "--api_key", "k", "--model", "m", "--api_base", stub_judge.url, "--output_mode", "json",
+             "--result_full", "full.json", "--result_scores", "scores.jsonl")
+
+    assert all(r["max_tokens"] == 600 and r["response_format"]["type"] == "json_schema" for r in stub_judge.requests)
+    scores = ev.load_jsonl(os.path.join(out_dir, "scores.jsonl"))
+    assert len(scores) == 2
+    assert all(set(ev.SUB_DIMENSIONS) <= set(record) for record in scores.values())
+    with open(os.path.join(out_dir, "full.json"), encoding="utf-8") as f:
+        assert all(record["reasons"] for record in json.load(f))
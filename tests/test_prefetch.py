@@ -0,0 +1,62 @@
+import json
+import os
+
+from conftest import ev, strip_telemetry
+
+
+def test_memory_budget_admits_one_oversized_reservation():
+    budget = ev.MemoryBudget(100)
+    assert budget.try_acquire(250)  # 空闲时总能放行一个
+    assert not budget.try_acquire(1)
+    budget.adjust(-250)
+    assert budget.try_acquire(60) and budget.try_acquire(40)
+    assert not budget.try_acquire(1)
+    assert budget.used == 100 and budget.peak == 250
+
+
+def test_prefetch_stage_applies_backpressure_until_release(tmp_path, monkeypatch):
+    image = tmp_path / "img.png"
+    image.write_bytes(b"x" * 300)
+    msgs = [{"role": "user", "content": [{"type": "image_url", "image_url": {"url": "d" * 450}}]}]
+    monkeypatch.setattr(ev, "prepare_sequence_request", lambda index, seq, cfg, runtime, timings, paths: (paths, msgs))
+    stage = ev.PrefetchStage({"prefetch_mb": 1000 / 1024 / 1024, "prefetch_workers": 2, "max_workers": 4})
+    jobs = [(str(i), str(i), {"prompts": []}, {}, {}, {1: str(image)}) for i in range(4)]
+    stream = stage.wrap(jobs)
+
+    # 每个任务预估 401 字节，1000 字节预算只能先放行两个
+    first, second = next(stream), next(stream)
+    assert [first[0], second[0]] == ["0", "1"]
+    assert next(stream) is None
+    assert first[6].result({}) == ({1: str(image)}, msgs)
+    second[6].result({})
+    # 实际编码大小 450 替换预估值后仍占满预算，直到在途请求释放
+    assert stage.budget.used == 900
+    assert next(stream) is None
+
+    first[6].release()
+    second[6].release()
+    rest = [next(stream), next(stream)]
+    assert [job[0] for job in rest] == ["2", "3"]
+    for job in rest:
+        job[6].result({})
+        job[6].release()
+    assert next(stream, "done") == "done"
+    assert stage.budget.used == 0
+    assert stage.budget.peak <= 1000
+    stage.close()
+
+
+def test_prefetch_run_matches_direct_run(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(6)
+    outputs = {}
+    for name, extra in (("direct", []), ("prefetch", ["--prefetch_mb", "0.01", "--max_workers", "3"])):
+        output_dir = str(tmp_path / name)
+        run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", output_dir,
+                 "--api_key", "k", "--model", "m", "--api_base", stub_judge.url,
+                 "--result_full", "full.json", "--result_scores", "scores.jsonl", *extra)
+        with open(os.path.join(output_dir, "full.json"), encoding="utf-8") as f:
+            full = strip_telemetry(json.load(f), ("timings", "usage"))
+        outputs[name] = (ev.load_jsonl(os.path.join(output_dir, "scores.jsonl")), full)
+
+    assert len(outputs["direct"][0]) == 6
+    assert outputs["prefetch"] == outputs["direct"]
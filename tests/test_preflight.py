@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from conftest import ev
+
+
+def preflight(run_eval, json_path, image_dir, output_dir):
+    with pytest.raises(SystemExit) as exit_info:
+        run_eval("--preflight", "--json_path", json_path, "--image_dir", image_dir, "--output_dir", output_dir,
+                 "--preflight_workers", "2")
+    with open(os.path.join(output_dir, "preflight_report.json"), encoding="utf-8") as f:
+        return exit_info.value.code, json.load(f)
+
+
+def test_preflight_passes_a_clean_dataset(tmp_path, dataset, run_eval):
+    json_path, image_dir = dataset(3)
+    code, report = preflight(run_eval, json_path, image_dir, str(tmp_path / "out"))
+    assert code == 0
+    assert report["sequences"] == 3 and report["images_checked"] == 12
+    assert report["summary"]["errors"] == 0
+    # 64x48 的测试图片短边低于 PREFLIGHT_MIN_SIDE，仅作为警告
+    assert report["summary"]["by_issue"] == {"small_image": 12}
+    assert report["images"]["formats"] == {"png": 12}
+
+
+def test_preflight_reports_broken_entries_and_images(tmp_path, dataset, run_eval):
+    json_path, image_dir = dataset(4)
+    os.remove(os.path.join(image_dir, "0", "step_2.png"))
+    with open(os.path.join(image_dir, "1", "step_3.png"), "r+b") as f:
+        f.truncate(os.path.getsize(f.name) - 12)  # 去掉 IEND
+    shutil.copy(os.path.join(image_dir, "2", "step_1.png"), os.path.join(image_dir, "2", "step_4.png"))
+    with open(json_path, encoding="utf-8") as f:
+        data = json.load(f)
+    del data[3]["category"]
+    data.append(dict(data[0]))
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+    code, report = preflight(run_eval, json_path, image_dir, str(tmp_path / "out"))
+    assert code == 1
+    issues = {entry["index"]: {issue["issue"] for issue in entry["issues"]} - {"small_image"} for entry in report["issues"]}
+    assert issues == {
+        "0": {"missing_image", "duplicate_index"},
+        "1": {"truncated_image"},
+        "2": {"duplicate_image"},
+        "3": {"missing_field"}
+    }
+    assert report["summary"]["sequences_with_errors"] == 3
+    assert not os.path.exists(os.path.join(str(tmp_path / "out"), "scores.jsonl"))
+
+
+def test_preflight_sequence_issues():
+    sequence = {"index": "x", "category": "c", "process_type": "p",
+                "prompts": [{"step": 1, "prompt": "a", "explanation": "b"}, {"step": 1, "prompt": "a"}]}
+    assert [issue["issue"] for issue in ev.preflight_sequence_issues(sequence)] == \
+        ["missing_field", "step_count", "duplicate_step"]
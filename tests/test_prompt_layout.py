@@ -0,0 +1,41 @@
+import os
+
+from conftest import ev
+
+
+def sequence(index):
+    return {"index": index, "category": "physics", "process_type": "A",
+            "prompts": [{"step": s, "prompt": f"p{s} of {index}", "explanation": f"e{s}"} for s in range(1, 5)]}
+
+
+def user_texts(msgs):
+    return [part["text"] for part in msgs[1]["content"] if part["type"] == "text"]
+
+
+def test_inline_layout_is_the_original_single_prompt():
+    msgs = ev.build_sequence_evaluation_messages(sequence("3"), ["aaaa"] * 4)
+    assert user_texts(msgs) == [ev.build_sequence_prompt_text(sequence("3"))]
+    assert user_texts(msgs)[0].index("INDEX: 3") < user_texts(msgs)[0].index("SCORING CRITERIA")
+
+
+def test_prefix_layout_shares_a_byte_identical_prefix():
+    rubric = ev.render_rubric("json")
+    a = ev.build_sequence_evaluation_messages(sequence("1"), ["aaaa"] * 4, output_mode="json", layout="prefix", rubric=rubric)
+    b = ev.build_sequence_evaluation_messages(sequence("2"), ["bbbb"] * 4, output_mode="json", layout="prefix")
+    assert a[0] == b[0]
+    assert user_texts(a)[0] == user_texts(b)[0]
+    assert "SCORING CRITERIA" in user_texts(a)[0] and "INDEX" not in user_texts(a)[0]
+    assert "INDEX: 1" in user_texts(a)[1] and "INDEX: 2" in user_texts(b)[1]
+    # 图片排在所有文本之后
+    kinds = [part["type"] for part in a[1]["content"]]
+    assert kinds == ["text", "text"] + ["image_url"] * 4
+
+
+def test_cached_prompt_tokens_are_reported(tmp_path, stub_judge, dataset, run_eval, capsys):
+    json_path, image_dir = dataset(4)
+    for layout, cached in (("inline", "cached 0, 0.0%"), ("prefix", "cached 2400, 60.0%")):
+        run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", str(tmp_path / layout),
+                 "--api_key", "k", "--model", "m", "--api_base", stub_judge.url, "--max_workers", "1",
+                 "--prompt_layout", layout, "--result_full", "full.json", "--result_scores", "scores.jsonl")
+        assert f"Judge tokens: prompt 4000 ({cached})" in capsys.readouterr().out
+        assert len(ev.load_jsonl(os.path.join(str(tmp_path / layout), "scores.jsonl"))) == 4
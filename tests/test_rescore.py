@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ev
+
+
+def judge_then_rescore_args(tmp_path, stub_judge, dataset, run_eval, n=6):
+    json_path, image_dir = dataset(n)
+    judged_dir = str(tmp_path / "judged")
+    run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", judged_dir,
+             "--api_key", "k", "--model", "m", "--api_base", stub_judge.url,
+             "--result_full", "full.json", "--result_scores", "scores.jsonl")
+    return judged_dir
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_rescore_default_config_reproduces_scores(tmp_path, stub_judge, dataset, run_eval):
+    judged_dir = judge_then_rescore_args(tmp_path, stub_judge, dataset, run_eval)
+    configs = tmp_path / "configs.json"
+    configs.write_text(json.dumps({"aesthetic_heavy": {
+        "dimension_weights": {"consistency": 0.2, "physicality": 0.2, "aesthetic": 0.6}
+    }}), encoding="utf-8")
+
+    out_dir = str(tmp_path / "rescored")
+    # --result_scores 可省略，默认写 scores.jsonl
+    run_eval("--rescore", os.path.join(judged_dir, "full.json"), "--rescore_configs", str(configs),
+             "--output_dir", out_dir)
+
+    original = read_jsonl(os.path.join(judged_dir, "scores.jsonl"))
+    assert read_jsonl(os.path.join(out_dir, "rescore", "default", ev.DEFAULT_RESULT_SCORES)) == original
+    heavy = read_jsonl(os.path.join(out_dir, "rescore", "aesthetic_heavy", ev.DEFAULT_RESULT_SCORES))
+    for rec in heavy:
+        expected = 0.2 * rec["consistency_score"] + 0.2 * rec["physicality_score"] + 0.6 * rec["aesthetic_score"]
+        assert abs(rec["overall_score"] - expected) < 0.02
+
+    comparison = read_jsonl(os.path.join(out_dir, "rescore", "comparison.jsonl"))
+    assert [row["index"] for row in comparison] == [r["index"] for r in original]
+    assert all({"default", "aesthetic_heavy"} <= set(row) for row in comparison)
+    # 重打分不调用评审模型
+    assert len(stub_judge.requests) == 6
+
+
+def test_iter_full_records_reads_array_jsonl_and_journal(tmp_path):
+    records = [{"index": str(i), "evaluation": "x" * 300} for i in range(5)]
+    array_path = tmp_path / "full.json"
+    array_path.write_text(json.dumps(records, indent=2), encoding="utf-8")
+    assert list(ev.iter_full_records(str(array_path), chunk_size=64)) == records
+
+    journal_path = tmp_path / "journal.jsonl"
+    lines = [json.dumps({"index": r["index"], "full": r, "scores": {}}) for r in records]
+    lines.insert(2, json.dumps({"index": "9", "failure": {"error_type": "timeout"}}))
+    journal_path.write_text("\n".join(lines) + "\n" + lines[0][:50], encoding="utf-8")
+    assert list(ev.iter_full_records(str(journal_path), chunk_size=64)) == records
+
+
+def test_rescore_does_not_import_openai(tmp_path):
+    full_path = tmp_path / "full.json"
+    full_path.write_text(json.dumps([{"index": "0", "category": "physics", "process_type": "A",
+                                      "evaluation": "Semantic Consistency: 4\nAuthenticity: 3"}]), encoding="utf-8")
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = ("import sys, eval\n"
+            f"sys.argv = ['eval.py', '--rescore', {str(full_path)!r}, '--output_dir', {str(tmp_path / 'out')!r}]\n"
+            "eval.main()\n"
+            "assert 'openai' not in sys.modules\n")
+    subprocess.run([sys.executable, "-c", code], cwd=repo, check=True, capture_output=True)
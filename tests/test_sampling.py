@@ -0,0 +1,80 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import SCORE_LABELS, ev
+
+
+def evaluation(*scores):
+    return "\n".join(f"**{label}**: {score}" for label, score in zip(SCORE_LABELS, scores))
+
+
+def sampling_cfg(**overrides):
+    cfg = {"samples": 2, "max_samples": 4, "sample_spread": 1.0, "grade_margin": 0.1,
+           "sample_aggregate": "median", "output_mode": "text"}
+    cfg.update(overrides)
+    return cfg
+
+
+def test_aggregate_sample_scores_median_variance_spread():
+    samples = [dict(zip(ev.SUB_DIMENSIONS, [s] * 9)) for s in (2, 3, 5)]
+    scores, variance, spread = ev.aggregate_sample_scores(samples, "median")
+    dim = ev.SUB_DIMENSIONS[0]
+    assert scores[dim] == 3.0 and spread[dim] == 3.0
+    assert variance[dim] == pytest.approx(2.3333, abs=1e-4)
+    assert ev.aggregate_sample_scores(samples, "mean")[0][dim] == pytest.approx(3.333, abs=1e-3)
+
+
+def test_judge_samples_escalate_only_on_disagreement():
+    agreeing = ev.JudgeSamples(sampling_cfg())
+    assert agreeing.next_n() == 2
+    agreeing.add({"choices": [{"content": evaluation(*[3] * 9)}, {"content": evaluation(*[3] * 9)}]}, None)
+    # 总分 3.0 落在等级边界上
+    assert agreeing.disagree()
+    stable = ev.JudgeSamples(sampling_cfg())
+    stable.add({"choices": [{"content": evaluation(*[4, 3] * 4, 4)}] * 2}, None)
+    assert stable.next_n() == 0 and not stable.escalated
+
+    spread = ev.JudgeSamples(sampling_cfg())
+    spread.add({"choices": [{"content": evaluation(*[4, 3] * 4, 4)}, {"content": evaluation(1, *[4, 3] * 4)}]}, None)
+    assert spread.next_n() == 2 and spread.escalated
+    spread.add({"choices": [{"content": evaluation(*[4, 3] * 4, 4)}] * 2}, None)
+    assert spread.next_n() == 0  # 已达 --max_samples
+    record = spread.record()
+    assert record["n"] == 4 and record["rounds"] == 2 and record["escalated"]
+
+
+def test_unscorable_choice_is_dropped_from_a_multi_sample_response(make_cfg):
+    cfg = make_cfg("--json_path", "d.json", "--image_dir", "imgs", "--output_dir", "out", "--api_key", "k", "--model", "m",
+                   "--result_full", "full.json", "--result_scores", "scores.jsonl", "--samples", "2")
+    runtime = {"scheduler": ev.JudgeScheduler(cfg)}
+    message = lambda text: SimpleNamespace(message=SimpleNamespace(content=text), finish_reason="stop")
+    resp = SimpleNamespace(choices=[message("no scores here"), message(evaluation(*[4] * 9))], usage=None)
+    response = ev.store_judge_response(None, {"model": "m"}, resp, cfg, runtime)
+    assert [choice["content"] for choice in response["choices"]] == [evaluation(*[4] * 9)]
+    assert response["content"] == evaluation(*[4] * 9)
+    assert runtime["scheduler"].stats["parse_failures"] == 1
+
+    resp = SimpleNamespace(choices=[message("nothing"), message("still nothing")], usage=None)
+    with pytest.raises(ev.ScoreParseError):
+        ev.store_judge_response(None, {"model": "m"}, resp, cfg, runtime)
+
+
+def test_sampled_run_aggregates_and_records_samples(tmp_path, mock_judge, dataset, run_eval):
+    url = mock_judge()
+    json_path, image_dir = dataset(6)
+    output_dir = str(tmp_path / "out")
+    run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", output_dir,
+             "--api_key", "mock", "--model", "m", "--api_base", url,
+             "--result_full", "full.json", "--result_scores", "scores.jsonl",
+             "--samples", "2", "--max_samples", "4")
+    with open(os.path.join(output_dir, "full.json"), encoding="utf-8") as f:
+        full = json.load(f)
+    assert len(full) == 6
+    for record in full:
+        samples = record["samples"]
+        assert samples["n"] in (2, 4) and samples["escalated"] == (samples["n"] == 4)
+        parsed = [ev.parse_evaluation(txt, "text")[0] for txt in samples["evaluations"]]
+        assert record["individual_scores"] == ev.aggregate_sample_scores(parsed)[0]
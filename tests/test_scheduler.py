@@ -0,0 +1,104 @@
+import os
+import random
+import threading
+import time
+
+from conftest import ev
+
+
+def test_token_bucket_paces_after_burst():
+    bucket = ev.TokenBucket(60)  # 1 token/s, burst of 60
+    assert bucket.reserve(60) == 0.0
+    wait = bucket.reserve(2)
+    assert 1.9 < wait <= 2.0
+
+    # 实际用量比预估少时归还令牌
+    bucket.adjust(-2)
+    assert bucket.reserve(0) == 0.0
+
+
+def test_token_bucket_clamps_to_server_remaining():
+    bucket = ev.TokenBucket(600)
+    bucket.observe_remaining(0)
+    assert bucket.reserve(1) > 0
+
+
+def test_adaptive_concurrency_slow_start_then_aimd():
+    limiter = ev.AdaptiveConcurrency(maximum=8, initial=2)
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 5.0 and limiter.slow_start
+
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 8.0
+
+    limiter.acquire()
+    limiter.release(congested=True)
+    assert limiter.limit == 4.0 and not limiter.slow_start
+    # 同一拥塞窗口内的后续拥塞信号不再减半
+    limiter.acquire()
+    limiter.release(congested=True)
+    assert limiter.limit == 4.0
+
+    limiter.acquire()
+    limiter.release()
+    assert limiter.limit == 4.25
+
+
+def test_adaptive_concurrency_blocks_until_release():
+    limiter = ev.AdaptiveConcurrency(maximum=1, initial=1)
+    limiter.acquire()
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+    waiter.start()
+    time.sleep(0.1)
+    assert not acquired.is_set()
+    limiter.release()
+    waiter.join(timeout=2)
+    assert acquired.is_set() and limiter.in_flight == 1
+
+
+def test_parse_duration():
+    assert ev.parse_duration("6m0s") == 360.0
+    assert ev.parse_duration("20ms") == 0.02
+    assert ev.parse_duration("1.5s") == 1.5
+
+
+def run_args(stub_judge, json_path, image_dir, output_dir, *extra):
+    return ["--json_path", json_path, "--image_dir", image_dir, "--output_dir", output_dir,
+            "--api_key", "k", "--model", "m", "--api_base", stub_judge.url,
+            "--result_full", "full.json", "--result_scores", "scores.jsonl", "--max_workers", "1", *extra]
+
+
+def test_rate_limited_requests_are_retried(tmp_path, stub_judge, dataset, run_eval, monkeypatch):
+    monkeypatch.setattr(random, "uniform", lambda a, b: 0.0)
+    json_path, image_dir = dataset(2)
+    stub_judge.faults.extend([429, 503])
+    output_dir = str(tmp_path / "out")
+    run_eval(*run_args(stub_judge, json_path, image_dir, output_dir))
+
+    assert len(ev.load_jsonl(os.path.join(output_dir, "scores.jsonl"))) == 2
+    assert not os.path.exists(os.path.join(output_dir, "failures.jsonl"))
+    assert len(stub_judge.requests) == 4
+
+
+def test_failures_are_recorded_and_retried(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(3)
+    stub_judge.faults.append(400)
+    output_dir = str(tmp_path / "out")
+    run_eval(*run_args(stub_judge, json_path, image_dir, output_dir))
+
+    failures = ev.load_jsonl(os.path.join(output_dir, "failures.jsonl"))
+    assert len(failures) == 1
+    (failed_index, record), = failures.items()
+    assert record["error_type"] == "bad_request"
+    assert len(ev.load_jsonl(os.path.join(output_dir, "scores.jsonl"))) == 2
+
+    # --retry_failed 只重跑失败的序列
+    run_eval(*run_args(stub_judge, json_path, image_dir, output_dir, "--retry_failed"))
+    assert len(stub_judge.requests) == 4
+    assert failed_index in ev.load_jsonl(os.path.join(output_dir, "scores.jsonl"))
+    assert not os.path.exists(os.path.join(output_dir, "failures.jsonl"))
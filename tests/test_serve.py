@@ -0,0 +1,97 @@
+import gzip
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from conftest import ev
+
+
+@pytest.fixture
+def results_server(tmp_path, stub_judge, dataset, run_eval, make_cfg):
+    json_path, image_dir = dataset(7)
+    output_dir = str(tmp_path / "out")
+    run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", output_dir,
+             "--api_key", "k", "--model", "m", "--api_base", stub_judge.url,
+             "--result_full", "full.json", "--result_scores", "scores.jsonl")
+    cfg = make_cfg("--serve", "0", "--output_dir", output_dir, "--result_full", "full.json", "--image_dir", image_dir)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ev.make_results_handler(ev.ResultsStore(cfg)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", output_dir
+    server.shutdown()
+    server.server_close()
+
+
+def get(url, headers=None):
+    """(status, headers, body) of a GET request; HTTP errors are returned, not raised."""
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {})) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def get_json(url, headers=None):
+    status, resp_headers, body = get(url, headers)
+    return status, resp_headers, json.loads(body) if body else None
+
+
+def test_sequences_are_paginated_filtered_and_sorted(results_server):
+    base, output_dir = results_server
+    scores = ev.load_jsonl(os.path.join(output_dir, "scores.jsonl"))
+
+    status, _, first = get_json(f"{base}/api/sequences?page_size=3")
+    assert status == 200 and first["total"] == 7 and first["pages"] == 3
+    _, _, last = get_json(f"{base}/api/sequences?page_size=3&page=3")
+    assert [r["index"] for r in first["items"]] == ["0", "1", "2"] and [r["index"] for r in last["items"]] == ["6"]
+
+    _, _, physics = get_json(f"{base}/api/sequences?category=physics&process_type=A")
+    assert sorted(r["index"] for r in physics["items"]) == \
+        sorted(i for i, r in scores.items() if r["category"] == "physics" and r["process_type"] == "A")
+
+    _, _, ranked = get_json(f"{base}/api/sequences?sort=-overall_score&min_score=0")
+    overall = [r["overall_score"] for r in ranked["items"]]
+    assert overall == sorted(overall, reverse=True) and len(overall) == 7
+
+    status, _, error = get_json(f"{base}/api/sequences?sort=bogus")
+    assert status == 400 and "sort" in error["error"]
+
+
+def test_detail_images_and_etag_revalidation(results_server):
+    base, output_dir = results_server
+    with open(os.path.join(output_dir, "full.json"), encoding="utf-8") as f:
+        full = {r["index"]: r for r in json.load(f)}
+
+    status, headers, record = get_json(f"{base}/api/sequences/4")
+    assert status == 200 and record == full["4"]
+    etag = headers["ETag"]
+    status, headers, body = get(f"{base}/api/sequences/4", {"If-None-Match": etag})
+    assert status == 304 and body == b"" and headers["ETag"] == etag
+    assert get(f"{base}/api/sequences/404")[0] == 404
+
+    # 结果文件变化后 ETag 失效，数据重新加载
+    scores = ev.load_jsonl(os.path.join(output_dir, "scores.jsonl"))
+    scores["4"]["category"] = "chemistry"
+    with open(os.path.join(output_dir, "scores.jsonl"), "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(record) + "\n" for record in scores.values())
+    status, headers, _ = get_json(f"{base}/api/sequences/4", {"If-None-Match": etag})
+    assert status == 200 and headers["ETag"] != etag
+    assert [r["index"] for r in get_json(f"{base}/api/sequences?category=chemistry")[2]["items"]] == ["4"]
+
+    status, headers, image = get(f"{base}/api/images/4/2")
+    assert status == 200 and image.startswith(b"\x89PNG")
+    assert get(f"{base}/api/images/4/2", {"If-None-Match": headers["ETag"]})[0] == 304
+    status, headers, thumb = get(f"{base}/api/images/4/2?size=128")
+    assert status == 200 and thumb.startswith(b"\xff\xd8") and headers["Content-Type"] == "image/jpeg"
+
+
+def test_json_responses_are_gzip_compressed(results_server):
+    base, _ = results_server
+    status, headers, body = get(f"{base}/api/sequences", {"Accept-Encoding": "gzip"})
+    assert status == 200 and headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(body))["total"] == 7
@@ -0,0 +1,102 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from conftest import ev
+
+FILES = ["--result_full", "full.json", "--result_scores", "scores.jsonl"]
+
+
+def judged(index: str, value: float) -> dict:
+    """Journal entry of a successfully judged sequence with every sub-dimension at value."""
+    scores = {dim: value for dim in ev.SUB_DIMENSIONS}
+    comprehensive = ev.calculate_comprehensive_scores(scores)
+    sequence_data = {"category": "physics", "process_type": "A"}
+    return {
+        "index": index,
+        "full": {"index": index, "individual_scores": scores, "comprehensive_scores": comprehensive},
+        "scores": ev.make_score_record(index, sequence_data, scores, comprehensive)
+    }
+
+
+def failed(index: str) -> dict:
+    return {"index": index, "failure": ev.make_failure_record(index, "timeout", "timed out", 3)}
+
+
+def write_journal(path, entries):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for entry in entries:
+            ev.append_journal(f, entry)
+
+
+def test_shards_partition_the_dataset(tmp_path):
+    records = [{"index": str(i), "prompts": []} for i in range(200)]
+    path = tmp_path / "data.jsonl.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("\n".join(json.dumps(r) for r in records) + "\n")
+    shards = [[s["index"] for s in ev.iter_sequences(str(path), (i, 3))] for i in range(3)]
+    assert sorted(sum(shards, []), key=int) == [r["index"] for r in records]
+    assert all(40 < len(shard) < 95 for shard in shards)
+    # 分片只取决于 index 本身
+    assert all(ev.shard_of(index, 3) == i for i, shard in enumerate(shards) for index in shard)
+    assert [s["index"] for s in ev.iter_sequences(str(path))] == [r["index"] for r in records]
+
+
+def test_parse_shard_rejects_bad_values():
+    assert ev.parse_shard("1/4") == (1, 4)
+    for bad in ("4/4", "-1/2", "x", "1/0"):
+        with pytest.raises(Exception):
+            ev.parse_shard(bad)
+
+
+def test_merge_shards_combines_compacted_and_unfinished_shards(tmp_path, make_cfg):
+    shard_dirs = [str(tmp_path / f"shard_{i}_of_2") for i in range(2)]
+
+    # shard 0 跑完并已压缩；shard 1 中断，只有 journal
+    done_cfg = make_cfg("--merge", "unused", "--output_dir", shard_dirs[0], *FILES)
+    write_journal(os.path.join(shard_dirs[0], done_cfg["journal"]), [judged("0", 3), judged("2", 4), failed("4")])
+    ev.compact_results(ev.load_run_state(done_cfg), done_cfg)
+    assert not os.path.exists(os.path.join(shard_dirs[0], done_cfg["journal"]))
+    write_journal(os.path.join(shard_dirs[1], done_cfg["journal"]), [judged("1", 2), judged("3", 5), judged("4", 1)])
+
+    out_dir = str(tmp_path / "merged")
+    cfg = make_cfg("--merge", str(tmp_path / "shard_*"), "--output_dir", out_dir, *FILES)
+    ev.merge_shards(cfg)
+
+    scores = [json.loads(line) for line in open(os.path.join(out_dir, "scores.jsonl"), encoding='utf-8')]
+    assert [s["index"] for s in scores] == ["0", "1", "2", "3", "4"]
+    assert scores[4]["overall_score"] == judged("4", 1)["scores"]["overall_score"]
+    with open(os.path.join(out_dir, "full.json"), encoding='utf-8') as f:
+        assert [r["index"] for r in json.load(f)] == ["0", "1", "2", "3", "4"]
+    # shard 0 中失败的 "4" 已由 shard 1 评完
+    assert not os.path.exists(os.path.join(out_dir, "failures.jsonl"))
+    assert os.path.isfile(os.path.join(out_dir, "analysis_report.json"))
+
+
+def test_merge_shards_keeps_unscored_failures(tmp_path, make_cfg):
+    shard_dir = str(tmp_path / "shard_0_of_1")
+    cfg = make_cfg("--merge", shard_dir, "--output_dir", str(tmp_path / "merged"), *FILES)
+    write_journal(os.path.join(shard_dir, cfg["journal"]), [judged("0", 3), failed("1")])
+
+    ev.merge_shards(cfg)
+
+    failures = ev.load_jsonl(os.path.join(cfg["output_dir"], "failures.jsonl"))
+    assert list(failures) == ["1"]
+    assert list(ev.load_jsonl(os.path.join(cfg["output_dir"], "scores.jsonl"))) == ["0"]
+
+
+def test_sharded_runs_merge_to_the_unsharded_result(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(9)
+    common = ["--json_path", json_path, "--image_dir", image_dir, "--api_key", "k", "--model", "m",
+              "--api_base", stub_judge.url, *FILES]
+    run_eval(*common, "--output_dir", str(tmp_path / "single"))
+    for i in range(3):
+        run_eval(*common, "--output_dir", str(tmp_path / "sharded"), "--shard", f"{i}/3")
+    run_eval("--merge", str(tmp_path / "sharded" / "shard_*"), "--output_dir", str(tmp_path / "merged"), *FILES)
+
+    single = ev.load_jsonl(str(tmp_path / "single" / "scores.jsonl"))
+    assert ev.load_jsonl(str(tmp_path / "merged" / "scores.jsonl")) == single
+    assert len(single) == 9
@@ -0,0 +1,74 @@
+import io
+import json
+import os
+
+from conftest import ev
+
+
+def test_stage_histogram_counts_bound_values_in_their_bucket():
+    summary = ev.RunTelemetry.stage_summary([0.005, 0.0051, 1.0, 1.0, 200.0])
+    counts = dict(zip(summary["histogram"]["le"], summary["histogram"]["counts"]))
+    # le 桶含上界：恰好等于 0.005 / 1.0 的值计入这两个桶
+    assert counts[0.005] == 1 and counts[0.01] == 1
+    assert counts[1.0] == 2 and counts["+Inf"] == 1
+    assert sum(summary["histogram"]["counts"]) == summary["count"] == 5
+    assert summary["max"] == 200.0
+
+
+def test_usage_record_prices_cached_tokens_and_model_snapshots():
+    usage = {"prompt_tokens": 1000, "completion_tokens": 100, "prompt_tokens_details": {"cached_tokens": 400}}
+    record = ev.usage_record(usage, "gpt-4.1-mini-2025-04-14", ev.DEFAULT_PRICES)
+    # 最长前缀匹配 gpt-4.1-mini，而不是 gpt-4.1
+    assert record["cost_usd"] == round((600 * 0.40 + 400 * 0.10 + 100 * 1.60) / 1e6, 6)
+    assert ev.usage_record(usage, "unknown-model", ev.DEFAULT_PRICES)["cost_usd"] is None
+    assert ev.usage_record(usage, "gpt-4o", ev.DEFAULT_PRICES, local_cache_hit=True)["cost_usd"] == 0.0
+    assert ev.usage_record(None, "gpt-4o") is None
+
+
+def finished(seconds, usage=None):
+    full_rec = {"timings": {"judge": seconds, "total": seconds + 0.01}}
+    if usage:
+        full_rec["usage"] = usage
+    return full_rec, {}
+
+
+def test_prometheus_textfile_is_cumulative(tmp_path):
+    path = str(tmp_path / "metrics.prom")
+    telemetry = ev.RunTelemetry(prometheus_path=path, stream=io.StringIO(), interval=0)
+    telemetry.start(3)
+    usage = {"prompt_tokens": 10, "cached_tokens": 4, "completion_tokens": 2, "cost_usd": 0.5, "local_cache_hit": False}
+    telemetry.update("0", finished(0.05, usage))
+    telemetry.update("1", finished(2.0))
+    telemetry.update("2", ev.make_failure_record("2", "timeout", "timed out", 3))
+    telemetry.close()
+
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert 'envision_sequences_total{status="succeeded"} 2' in lines
+    assert 'envision_sequences_total{status="failed"} 1' in lines
+    assert 'envision_tokens_total{kind="cached"} 4' in lines
+    assert "envision_cost_usd_total 0.5" in lines
+    buckets = [line for line in lines if line.startswith('envision_stage_seconds_bucket{stage="judge"')]
+    assert buckets[3] == 'envision_stage_seconds_bucket{stage="judge",le="0.05"} 1'
+    assert buckets[-1] == 'envision_stage_seconds_bucket{stage="judge",le="+Inf"} 2'
+    values = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert values == sorted(values)
+    assert 'envision_stage_seconds_count{stage="judge"} 2' in lines
+
+
+def test_run_writes_metrics_and_progress_line(tmp_path, stub_judge, dataset, run_eval, capsys):
+    json_path, image_dir = dataset(3)
+    out_dir = str(tmp_path / "out")
+    run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", out_dir,
+             "--api_key", "k", "--model", "gpt-4o", "--api_base", stub_judge.url,
+             "--result_full", "full.json", "--result_scores", "scores.jsonl",
+             "--prometheus_textfile", str(tmp_path / "metrics.prom"))
+
+    assert "[PROGRESS] 3/3 (0 failed)" in capsys.readouterr().err
+    with open(os.path.join(out_dir, "run_metrics.json"), encoding="utf-8") as f:
+        metrics = json.load(f)
+    assert metrics["sequences"]["succeeded"] == 3
+    assert {"image_lookup", "encode", "judge", "total"} <= set(metrics["stages"])
+    assert metrics["tokens"]["prompt"] == 3000
+    assert metrics["cost_usd"] == round(3 * (1000 * 2.50 + 100 * 10.00) / 1e6, 6)
+    assert os.path.isfile(str(tmp_path / "metrics.prom"))
@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+
+import pytest
+
+from conftest import SCORE_LABELS, ev
+
+
+def triage_cfg(**overrides):
+    cfg = {"sample_aggregate": "median", "sample_spread": 1.0, "triage_bands": [(2.5, 4.0)],
+           "triage_spread": 2.0, "triage_audit": 0.0, "output_mode": "text"}
+    cfg.update(overrides)
+    return cfg
+
+
+def judged(*scores):
+    samples = ev.JudgeSamples(triage_cfg())
+    samples.add({"content": "\n".join(f"**{label}**: {s}" for label, s in zip(SCORE_LABELS, scores))}, None)
+    return samples
+
+
+def test_parse_band():
+    assert ev.parse_band("4:2.5") == (2.5, 4.0)
+    with pytest.raises(argparse.ArgumentTypeError):
+        ev.parse_band("2.5-4")
+
+
+def test_triage_reason():
+    cfg = triage_cfg()
+    assert ev.triage_reason("0", judged(*[5] * 9), cfg) is None
+    assert ev.triage_reason("0", judged(*[1] * 9), cfg) is None
+    assert ev.triage_reason("0", judged(*[3] * 9), cfg) == "band"
+    assert ev.triage_reason("0", judged(*[3] * 9), triage_cfg(triage_bands=[(4.5, 5.0)])) is None
+    # 一致性维度内部 5 与 1 相差超过 --triage_spread
+    assert ev.triage_reason("0", judged(1, 5, 5, 5, 5, 5, 5, 5, 5), cfg) == "inconsistent"
+    assert ev.triage_reason("0", judged(*[5] * 8), cfg) == "incomplete"
+    assert ev.triage_reason("0", judged(*[5] * 9), triage_cfg(triage_audit=1.0)) == "audit"
+
+    # 审计抽样只取决于索引，且比例大致符合 --triage_audit
+    audited = [i for i in range(1000) if ev.triage_reason(str(i), judged(*[5] * 9), triage_cfg(triage_audit=0.2))]
+    assert 150 < len(audited) < 250
+    assert audited == [i for i in range(1000) if ev.triage_reason(str(i), judged(*[5] * 9), triage_cfg(triage_audit=0.2))]
+
+
+def test_triage_run_escalates_and_writes_calibration(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(8)
+    output_dir = str(tmp_path / "out")
+    run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", output_dir,
+             "--api_key", "k", "--model", "strong", "--api_base", stub_judge.url,
+             "--result_full", "full.json", "--result_scores", "scores.jsonl",
+             "--triage_model", "cheap", "--triage_audit", "0.5")
+    scores = ev.load_jsonl(os.path.join(output_dir, "scores.jsonl"))
+    assert len(scores) == 8
+    escalated = [r for r in scores.values() if r["triage_reason"]]
+    models = [request["model"] for request in stub_judge.requests]
+    assert models.count("cheap") == 8
+    assert models.count("strong") == len(escalated)
+    for record in scores.values():
+        assert record["judge_model"] == ("strong" if record["triage_reason"] else "cheap")
+        assert ("triage" in record) == bool(record["triage_reason"])
+
+    with open(os.path.join(output_dir, "triage_calibration.json"), encoding="utf-8") as f:
+        report = json.load(f)
+    assert report["sequences"] == 8
+    assert report["settled_by_triage"] == 8 - len(escalated)
+    assert report["overlap"]["n"] == len(escalated)
@@ -0,0 +1,71 @@
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from conftest import ev
+
+
+@pytest.fixture(params=["inotify", "polling"])
+def watcher(request, tmp_path):
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    (image_dir / "0").mkdir()
+    watcher = ev.ImageDirWatcher(ev.ImageIndex.build(str(image_dir)))
+    if request.param == "polling":
+        watcher.close()
+        watcher.mode = "polling"
+        watcher._changed_by_mtime()
+    elif watcher.mode != "inotify":
+        pytest.skip("inotify is not available")
+    yield watcher
+    watcher.close()
+
+
+def test_image_dir_watcher_tracks_new_and_removed_files(watcher):
+    image_dir = watcher.image_dir
+    existing = os.path.join(image_dir, "0", "step_1.png")
+    created = os.path.join(image_dir, "1", "step_1.png")
+    assert watcher.poll() == 0
+
+    time.sleep(0.02)  # 轮询模式依赖目录 mtime 变化
+    with open(existing, "wb") as f:
+        f.write(b"png")
+    os.mkdir(os.path.join(image_dir, "1"))
+    with open(created, "wb") as f:
+        f.write(b"png")
+    watcher.poll()
+    assert watcher.index.exists(existing) and watcher.index.exists(created)
+    assert "1" in watcher.index.dirs
+
+    time.sleep(0.02)
+    os.remove(existing)
+    shutil.rmtree(os.path.join(image_dir, "1"))
+    watcher.poll()
+    assert not watcher.index.exists(existing) and not watcher.index.exists(created)
+
+
+def test_watch_starts_before_the_image_dir_exists(tmp_path, stub_judge, dataset, run_eval, monkeypatch):
+    monkeypatch.setattr(ev, "WATCH_POLL_SECONDS", 0.05)
+    json_path, generated = dataset(3)
+    image_dir = str(tmp_path / "incoming")
+    output_dir = str(tmp_path / "out")
+
+    def generator():
+        time.sleep(0.3)
+        for index in ("2", "0", "1"):
+            shutil.copytree(os.path.join(generated, index), os.path.join(image_dir, index))
+            time.sleep(0.1)
+
+    writer = threading.Thread(target=generator)
+    writer.start()
+    run_eval("--json_path", json_path, "--image_dir", image_dir, "--output_dir", output_dir,
+             "--api_key", "k", "--model", "m", "--api_base", stub_judge.url,
+             "--result_full", "full.json", "--result_scores", "scores.jsonl",
+             "--watch", "--watch_settle", "0.1", "--watch_idle", "5", "--prefetch_mb", "1")
+    writer.join()
+    scores = ev.load_jsonl(os.path.join(output_dir, "scores.jsonl"))
+    assert sorted(scores) == ["0", "1", "2"]
+    assert len(stub_judge.requests) == 3
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+
+from conftest import ev
+
+
+def test_two_workers_never_lease_the_same_sequence(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    indices = [str(i) for i in range(60)]
+    workers = [ev.WorkQueue(path, f"w{i}") for i in range(2)]
+    workers[0].seed(indices)
+    workers[1].seed(indices)
+    claimed = {worker.worker_id: [] for worker in workers}
+    start = threading.Barrier(len(workers))
+
+    def drain(worker):
+        start.wait()
+        while True:
+            index = worker.claim()
+            if index is None:
+                return
+            claimed[worker.worker_id].append(index)
+
+    threads = [threading.Thread(target=drain, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        first, second = claimed.values()
+        assert not set(first) & set(second)
+        assert sorted(first + second, key=int) == indices
+        assert len(first) + len(second) == len(indices)
+        assert workers[0].counts() == {"leased": len(indices)}
+    finally:
+        for worker in workers:
+            worker.close()
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    crashed = ev.WorkQueue(path, "crashed", lease_seconds=0.3)
+    crashed.seed(["a"])
+    assert crashed.claim() == "a"
+    # 停掉心跳而不完成任务，模拟 worker 崩溃
+    crashed.close()
+
+    survivor = ev.WorkQueue(path, "survivor", lease_seconds=30)
+    try:
+        assert survivor.claim() is None
+        time.sleep(0.5)
+        assert survivor.claim() == "a"
+        assert survivor.stats["reclaimed"] == 1
+        survivor.complete("a", {"index": "a", "failure": {"index": "a", "error_type": "timeout"}})
+        assert survivor.counts() == {"failed": 1}
+        assert survivor.outstanding() == 0
+    finally:
+        survivor.close()
+
+
+def test_live_lease_is_renewed_by_heartbeat(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    holder = ev.WorkQueue(path, "holder", lease_seconds=0.3)
+    other = ev.WorkQueue(path, "other", lease_seconds=30)
+    try:
+        holder.seed(["a"])
+        assert holder.claim() == "a"
+        time.sleep(0.6)
+        assert other.claim() is None
+    finally:
+        holder.close()
+        other.close()
+
+
+def test_work_queue_run_exports_results_and_resumes(tmp_path, stub_judge, dataset, run_eval):
+    json_path, image_dir = dataset(5)
+    out_dir = str(tmp_path / "out")
+    args = ["--json_path", json_path, "--image_dir", image_dir, "--output_dir", out_dir,
+            "--api_key", "k", "--model", "m", "--api_base", stub_judge.url, "--work_queue",
+            "--result_full", "full.json", "--result_scores", "scores.jsonl"]
+    run_eval(*args)
+    assert len(ev.load_jsonl(os.path.join(out_dir, "scores.jsonl"))) == 5
+
+    queue = ev.WorkQueue(os.path.join(out_dir, "work_queue.sqlite"), "inspector")
+    try:
+        assert queue.counts() == {"done": 5}
+    finally:
+        queue.close()
+
+    run_eval(*args)
+    assert len(stub_judge.requests) == 5